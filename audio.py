@@ -0,0 +1,419 @@
+# audio.py
+# ///////////////////////////////////////////////////////////////
+# วิเคราะห์เสียงจากไมค์ทีละ Chunk (PCM 16-bit mono, Native byte order แบบที่ PyAudio paInt16 ส่งมา)
+# - RMS / Zero-crossing rate บน memoryview โดยตรง (ไม่ struct.unpack เป็น tuple แล้ววน Generator ทุก Chunk)
+# - ใช้ NumPy ถ้ามี (ไม่บังคับ ไม่มีก็ใช้ Python ล้วนที่วนใน C)
+# - VoiceActivityDetector: Energy + Zero-crossing พร้อม Noise floor ที่ปรับตามเสียงรอบข้าง แทน Threshold คงที่
+# - CaptureStream / SpeechGate: อัดที่ 16 kHz (หรือ Resample ลงมา) และตัดเสียงเงียบหัว/ท้ายก่อนส่งเข้า Recognizer
+# - AudioDeviceManager: PortAudio ตัวเดียวทั้งแอป Initialize ใน Background ตอนเปิดแอป + เก็บ Stream อุ่นไว้ให้กดแล้วอัดได้ทันที
+# ///////////////////////////////////////////////////////////////
+import math
+import sys
+import threading
+import time
+from array import array
+from collections import deque
+from itertools import accumulate
+
+HAS_NUMPY = False
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    pass
+
+VAD_RATIO = 3.0            # พูด = RMS สูงกว่า Noise floor กี่เท่า (~ +9.5 dB)
+VAD_MIN_RMS = 200.0        # RMS ต่ำสุดที่นับเป็นเสียงพูด (ห้องเงียบมาก Noise floor ใกล้ 0)
+VAD_MAX_FLOOR = 500.0      # Noise floor สูงสุด (เริ่มพูดทันทีที่เปิดไมค์ ไม่ให้เสียงพูดกลายเป็น Floor)
+VAD_ZCR_FRICATIVE = 0.25   # ZCR ของเสียงเสียดแทรก (ส ซ ฟ ฉ) ที่พลังงานต่ำ แต่ยังนับเป็นเสียงพูด
+VAD_ONSET_CHUNKS = 2       # ต้องเป็นเสียงพูดติดกันกี่ Chunk ถึงเริ่มนับว่าพูด (กันเสียงกระแทก/คลิก)
+VAD_HANGOVER_MS = 300      # หยุดพูดสั้นๆ ระหว่างคำไม่เกินนี้ ยังนับว่าพูดอยู่
+VAD_CALIBRATE_MS = 300     # ช่วงแรก Noise floor = RMS ต่ำสุดที่เจอ (จับระดับเสียงห้องก่อนเริ่มพูด)
+AUDIO_WARM_IDLE = 120.0    # วินาที: Stream ที่อุ่นไว้ไม่ได้ใช้นานเท่านี้ -> ปิด (เลิกจองไมค์) แล้ว Initialize PortAudio ใหม่ (รับอุปกรณ์ที่เสียบ/ถอด)
+GATE_TAIL_MS = 100         # เสียงเงียบต่อท้ายที่ยังส่งให้ Recognizer หลัง VAD หยุด (ไม่ตัดท้ายคำสุดท้ายชิดเกินไป)
+
+# Profile การอัดเสียง (config["capture_profile"]): ระบบถอดเสียงใช้แค่ 16 kHz -> ข้อมูลน้อยกว่า 44.1 kHz เกือบ 3 เท่า
+CAPTURE_PROFILES = {
+    "speech": {"rate": 16000, "frames": 512},   # 32 ms ต่อ Chunk (ค่าเริ่มต้น)
+    "hifi": {"rate": 44100, "frames": 1024},    # แบบเดิม 23 ms ต่อ Chunk
+}
+
+# ///////////////////////////////////////////////////////////////
+# [SECTION: BUFFER HELPERS]
+# ///////////////////////////////////////////////////////////////
+_HI_BYTE = 1 if sys.byteorder == "little" else 0       # ไบต์ที่มี Sign bit ของแต่ละ Sample
+_SIGN_TABLE = bytes(1 if b >= 0x80 else 0 for b in range(256))
+_popcount = int.bit_count if hasattr(int, "bit_count") else (lambda n: bin(n).count("1"))  # int.bit_count: Python 3.10+
+
+def as_samples(data):
+    """bytes / bytearray / array('h') / memoryview -> memoryview แบบ 'h' (ไม่ Copy) ตัดไบต์เกินที่ไม่ครบ Sample ทิ้ง"""
+    view = memoryview(data)
+    if view.format == "h": return view
+    view = view.cast("B")
+    return view[:len(view) & ~1].cast("h")
+
+def _rms_py(samples):
+    # math.hypot(*x) = sqrt(sum(x²)) คำนวณใน C (เร็วกว่า sum(s**2 for s in ...) ราว 3 เท่า)
+    return math.hypot(*samples) / math.sqrt(len(samples)) if len(samples) else 0.0
+
+def _zcr_py(samples):
+    # Sign ของทุก Sample -> ไบต์ 0/1 ด้วย translate แล้ว XOR กับตัวถัดไปแบบเลขจำนวนเต็มก้อนเดียว -> นับบิต = จำนวนครั้งที่ข้ามศูนย์
+    n = len(samples)
+    if n < 2: return 0.0
+    signs = samples.tobytes()[_HI_BYTE::2].translate(_SIGN_TABLE)
+    flips = int.from_bytes(signs[:-1], "little") ^ int.from_bytes(signs[1:], "little")
+    return _popcount(flips) / (n - 1)
+
+def _rms_np(samples):
+    x = np.frombuffer(samples, dtype=np.int16).astype(np.float32)
+    return math.sqrt(float(np.dot(x, x)) / x.size) if x.size else 0.0
+
+def _zcr_np(samples):
+    s = np.signbit(np.frombuffer(samples, dtype=np.int16))
+    return float(np.count_nonzero(s[1:] != s[:-1])) / (s.size - 1) if s.size > 1 else 0.0
+
+class LevelRing:
+    """Ring buffer ของระดับเสียง: Thread อัดเสียงเขียนด้วย push() ไม่ต้องรอ Lock หรือ UI, อีก Thread อ่านเป็นระยะด้วย drain()/peak()
+    ผู้เขียนคนเดียว ผู้อ่านคนเดียว: เขียนช่องก่อนแล้วค่อยเลื่อน head (กำหนดค่า int เดียว) -> ผู้อ่านไม่เห็นช่องที่ยังเขียนไม่เสร็จ
+    อ่านไม่ทันจนวนรอบ -> ได้เฉพาะ size ค่าล่าสุด (ระดับเสียงเก่าไม่มีประโยชน์กับการวาด)"""
+    def __init__(self, size=64):
+        self.size = size
+        self.buf = array("d", bytes(8 * size))
+        self.head = 0  # จำนวนค่าที่เขียนไปทั้งหมด (เขียนโดย push เท่านั้น)
+        self.tail = 0  # อ่านถึงค่าที่เท่าไหร่แล้ว (เขียนโดยผู้อ่านเท่านั้น)
+
+    def push(self, value):
+        i = self.head
+        self.buf[i % self.size] = value
+        self.head = i + 1
+
+    def drain(self):
+        """ค่าที่เข้ามาใหม่ตั้งแต่อ่านครั้งก่อน (เก่าสุดก่อน)"""
+        head = self.head
+        start = max(self.tail, head - self.size)
+        self.tail = head
+        return [self.buf[i % self.size] for i in range(start, head)]
+
+    def peak(self):
+        """ค่าสูงสุดตั้งแต่อ่านครั้งก่อน (None = ไม่มีค่าใหม่)"""
+        values = self.drain()
+        return max(values) if values else None
+
+# ///////////////////////////////////////////////////////////////
+# [SECTION: ANALYSIS]
+# ///////////////////////////////////////////////////////////////
+def rms(data):
+    """RMS ของ Chunk (หน่วยเดียวกับ Sample: 0 - 32768)"""
+    samples = as_samples(data)
+    return _rms_np(samples) if HAS_NUMPY else _rms_py(samples)
+
+def zero_crossing_rate(data):
+    """สัดส่วนของ Sample ที่เปลี่ยนเครื่องหมายจากตัวก่อนหน้า (0 - 1): เสียงพูดที่มีเสียงก้อง (Voiced) ต่ำ, เสียงเสียดแทรก/Noise สูง"""
+    samples = as_samples(data)
+    return _zcr_np(samples) if HAS_NUMPY else _zcr_py(samples)
+
+class VoiceActivityDetector:
+    """ตรวจว่ากำลังพูดอยู่ไหมทีละ Chunk: process(chunk) -> True ระหว่างพูด (รวม Hangover ช่วงเว้นวรรคระหว่างคำ)
+    ค่าของ Chunk ล่าสุดอยู่ที่ .rms / .zcr (ใช้กับ Visualizer ต่อได้เลย ไม่ต้องคำนวณซ้ำ)"""
+    def __init__(self, sample_rate=44100, chunk_frames=1024, ratio=VAD_RATIO, min_rms=VAD_MIN_RMS):
+        chunk_ms = 1000.0 * chunk_frames / sample_rate
+        self.ratio = ratio
+        self.min_rms = min_rms
+        self.hangover = max(1, round(VAD_HANGOVER_MS / chunk_ms))
+        self.calibrate = max(1, round(VAD_CALIBRATE_MS / chunk_ms))
+        self.reset()
+
+    def reset(self):
+        self.noise_floor = None
+        self.rms = 0.0
+        self.zcr = 0.0
+        self.speaking = False
+        self.voiced = False  # Chunk ล่าสุดเป็นเสียงพูดจริง (ไม่นับ Hangover)
+        self.chunks = 0
+        self._run = 0   # Chunk ที่เป็นเสียงพูดติดกัน
+        self._hang = 0  # Chunk ที่เหลือก่อนนับว่าหยุดพูด
+
+    @property
+    def threshold(self):
+        return max(self.min_rms, (self.noise_floor or 0.0) * self.ratio)
+
+    def process(self, data):
+        samples = as_samples(data)
+        if HAS_NUMPY: self.rms, self.zcr = _rms_np(samples), _zcr_np(samples)
+        else: self.rms, self.zcr = _rms_py(samples), _zcr_py(samples)
+        self.chunks += 1
+        if self.chunks <= self.calibrate:
+            self.noise_floor = min(self.rms, VAD_MAX_FLOOR, self.noise_floor if self.noise_floor is not None else VAD_MAX_FLOOR)
+
+        thr = self.threshold
+        voiced = self.rms > thr
+        fricative = self.rms > thr * 0.5 and self.zcr >= VAD_ZCR_FRICATIVE
+        self.voiced = voiced or fricative
+        if self.voiced:
+            self._run += 1
+            if self._run >= VAD_ONSET_CHUNKS or self.speaking:
+                self.speaking = True
+                self._hang = self.hangover
+        else:
+            self._run = 0
+            # Noise floor ปรับเฉพาะตอนไม่พูด: ลงเร็ว ขึ้นช้า (เสียงท้ายคำไม่ดัน Floor ขึ้นมาก)
+            if self.chunks > self.calibrate:
+                self.noise_floor += (0.3 if self.rms < self.noise_floor else 0.05) * (self.rms - self.noise_floor)
+                self.noise_floor = min(self.noise_floor, VAD_MAX_FLOOR)
+            if self._hang: self._hang -= 1
+            if not self._hang: self.speaking = False
+        return self.speaking
+
+# ///////////////////////////////////////////////////////////////
+# [SECTION: CAPTURE]
+# ///////////////////////////////////////////////////////////////
+class Resampler:
+    """แปลง Sample rate ต่อเนื่องทีละ Chunk: Sample ปลายทางแต่ละตัว = ค่าเฉลี่ยของ Sample ต้นทางที่ตกในช่วงของมัน
+    (เฉลี่ยแบบ Box = Low-pass ในตัว กัน Aliasing ตอนลด Rate) เศษที่ไม่ครบช่วงยกไปรวมกับ Chunk ถัดไป
+    ต้นทาง Rate ต่ำกว่าปลายทาง -> ประมาณค่าเชิงเส้นระหว่าง Sample สองตัวที่คร่อมจุดนั้นแทน
+    ตำแหน่งนับเป็นจำนวนเต็ม (Sample ปลายทางที่ j อยู่ที่ j * src / dst) -> แบ่ง Chunk แบบไหนก็ได้ผลเท่ากับทั้งก้อน"""
+    def __init__(self, src_rate, dst_rate):
+        g = math.gcd(int(src_rate), int(dst_rate))
+        self.src, self.dst = int(src_rate) // g, int(dst_rate) // g
+        self.n_out = 0          # จำนวน Sample ปลายทางที่ส่งออกไปแล้ว
+        self.base = 0           # ตำแหน่งต้นทางของ carry[0]
+        self.carry = array("h")
+
+    def process(self, data):
+        x = array("h", self.carry)
+        x.frombytes(as_samples(data).cast("B"))
+        if self.src < self.dst: return self._interpolate(x)
+        src, dst, base = self.src, self.dst, self.base
+        end = (base + len(x)) * dst // src  # Sample ปลายทางที่ช่วงครบแล้ว (ไม่รวมตัวที่ end)
+        edges = [j * src // dst - base for j in range(self.n_out, end + 1)]
+        prefix = list(accumulate(x, initial=0))  # ผลรวมสะสม (วนใน C) -> ผลรวมช่วงใดก็ได้ด้วยการลบสองค่า
+        out = array("h", [(prefix[e] - prefix[s]) // (e - s) for s, e in zip(edges, edges[1:])])
+        self._advance(x, end)
+        return out.tobytes()
+
+    def _interpolate(self, x):
+        # จุดปลายทางต้องมี Sample ถัดไปให้ประมาณค่า -> ใช้ได้ถึงก่อน Sample สุดท้าย ที่เหลือยกไป Chunk ถัดไป
+        src, dst, base = self.src, self.dst, self.base
+        end = max(self.n_out, -(-(base + len(x) - 1) * dst // src))
+        out = array("h")
+        for j in range(self.n_out, end):
+            i, r = divmod(j * src, dst)
+            a = x[i - base]
+            out.append(a + (x[i - base + 1] - a) * r // dst)
+        self._advance(x, end)
+        return out.tobytes()
+
+    def _advance(self, x, end):
+        nxt = end * self.src // self.dst  # ต้นทางตัวแรกที่ Sample ปลายทางถัดไปต้องใช้
+        self.carry = x[nxt - self.base:]
+        self.base, self.n_out = nxt, end
+
+class CaptureStream:
+    """เปิดไมค์ตาม Profile: ขอ Rate ของ Profile ตรงๆ ก่อน อุปกรณ์ไม่รองรับ -> เปิดที่ Rate ปกติของอุปกรณ์แล้ว Resample ในโปรแกรม
+    read() -> PCM 16-bit mono ที่ self.rate ประมาณ self.frames Sample ต่อครั้ง"""
+    def __init__(self, pa, profile="speech", device_index=None):
+        prof = CAPTURE_PROFILES.get(profile) or CAPTURE_PROFILES["speech"]
+        self.profile = profile if profile in CAPTURE_PROFILES else "speech"
+        self.rate, self.frames = prof["rate"], prof["frames"]
+        self.resampler = None
+        fmt = pa.get_format_from_width(2)
+        try:
+            self.stream = pa.open(format=fmt, channels=1, rate=self.rate, input=True, frames_per_buffer=self.frames, input_device_index=device_index)
+            self.device_rate, self.device_frames = self.rate, self.frames
+        except Exception:
+            info = pa.get_default_input_device_info() if device_index is None else pa.get_device_info_by_index(device_index)
+            self.device_rate = int(info.get("defaultSampleRate") or 44100)
+            self.device_frames = int(round(self.frames * self.device_rate / self.rate))
+            self.stream = pa.open(format=fmt, channels=1, rate=self.device_rate, input=True, frames_per_buffer=self.device_frames, input_device_index=device_index)
+            # อุปกรณ์ Rate ต่ำกว่า Profile (เช่นหูฟัง Bluetooth HFP 8 kHz): ใช้ Rate ของอุปกรณ์ตรงๆ Resample ขึ้นไม่ได้ข้อมูลเพิ่ม
+            if self.device_rate < self.rate: self.rate, self.frames = self.device_rate, self.device_frames
+            else: self.resampler = Resampler(self.device_rate, self.rate)
+        self.warm = False            # ได้ Stream ที่เปิดค้างไว้ (AudioDeviceManager) ไม่ต้องเปิดใหม่
+        self.open_ms = None
+        self.started_at = None
+        self.first_frame_ms = None   # Time-to-first-frame: t0 ของ start() (กดปุ่ม) -> read() ครั้งแรกได้ข้อมูล
+
+    def start(self, t0=None):
+        """เริ่มอัดรอบใหม่บน Stream เดิม (หยุดไว้ด้วย pause()) t0 = เวลาที่ผู้ใช้กด สำหรับจับ Time-to-first-frame"""
+        if not self.stream.is_active(): self.stream.start_stream()
+        if self.resampler: self.resampler = Resampler(self.device_rate, self.rate)  # ไม่เอาเศษ Sample ของรอบก่อนมาต่อ
+        self.started_at = time.perf_counter() if t0 is None else t0
+        self.first_frame_ms = None
+
+    def pause(self):
+        self.stream.stop_stream()
+
+    def read(self):
+        data = self.stream.read(self.device_frames, exception_on_overflow=False)
+        if self.first_frame_ms is None and self.started_at is not None:
+            self.first_frame_ms = (time.perf_counter() - self.started_at) * 1000
+        return self.resampler.process(data) if self.resampler else data
+
+    def close(self):
+        try: self.stream.stop_stream(); self.stream.close()
+        except: pass
+
+class AudioDeviceManager:
+    """PyAudio ตัวเดียวทั้งแอป แทน PyAudio() / terminate() ทุกครั้งที่กดปุ่ม (Initialize PortAudio ใช้หลายร้อย ms บน Windows/Linux)
+    - prewarm(): Initialize + เปิด Stream ทิ้งไว้ (หยุดอยู่) ใน Background ตอนเปิดแอป
+    - acquire(): Stream ที่อุ่นไว้ start ต่อได้ทันที ไม่มี -> เปิดใหม่ (PortAudio พร้อมแล้ว เปิดแค่ Stream เร็ว), release(): หยุดไว้ไม่ปิด
+    - Hot-plug: รายการอุปกรณ์ของ PortAudio ไม่อัปเดตจนกว่าจะ Initialize ใหม่ -> เปิด/อ่าน Stream ไม่ได้ให้ Initialize ใหม่แล้วลองอีกครั้ง
+      และพอว่างนาน idle_close วินาที ปิด Stream (เลิกจองไมค์) แล้ว Initialize ใหม่ไว้เลยใน Background
+    - get_metrics(): เวลา Initialize / เปิด Stream และ Time-to-first-frame ของแต่ละครั้ง"""
+    def __init__(self, pa_factory, idle_close=AUDIO_WARM_IDLE):
+        self.pa_factory = pa_factory  # pyaudio.PyAudio
+        self.idle_close = idle_close
+        self.lock = threading.RLock()  # Initialize/เปิด Stream ทีละงาน กดระหว่าง prewarm -> รอตัวที่กำลังทำอยู่ ไม่ Initialize ซ้อน
+        self.pa = None
+        self.stream = None             # Stream ที่เปิดค้างไว้ (หยุดอยู่) รอใช้ครั้งถัดไป
+        self.in_use = False
+        self.needs_reset = False
+        self.idle_timer = None
+        self.init_ms = None
+        self.inits = 0
+        self.sessions = deque(maxlen=50)
+
+    def prewarm(self, profile="speech"):
+        threading.Thread(target=self._prewarm, args=(profile,), daemon=True).start()
+
+    def _prewarm(self, profile):
+        try:
+            with self.lock:
+                if self.in_use or self.stream is not None: return
+                stream = self._open(profile)
+                stream.pause()
+                self.stream = stream
+                self._schedule_idle()
+        except Exception as e: print(f"Audio prewarm failed: {e}")
+
+    def acquire(self, profile="speech", t0=None):
+        """-> CaptureStream ที่เริ่มอัดแล้ว ต้องคืนด้วย release() ทุกครั้ง, ไม่มีไมค์ให้ใช้ -> Exception
+        t0 = perf_counter() ตอนผู้ใช้กดปุ่ม (Time-to-first-frame รวมช่วง UI / ส่งต่อ Thread) ไม่ระบุ = นับจากตอนเรียก"""
+        if t0 is None: t0 = time.perf_counter()
+        if profile not in CAPTURE_PROFILES: profile = "speech"
+        with self.lock:
+            self._cancel_idle()
+            stream, self.stream = self.stream, None
+            if stream is not None and (stream.profile != profile or self.needs_reset):
+                stream.close(); stream = None
+            try:
+                warm = stream is not None
+                if not warm: stream = self._open(profile)
+                stream.start(t0)
+            except Exception:
+                # อุปกรณ์ถูกถอด/เปลี่ยน -> Initialize PortAudio ใหม่ให้ได้รายการอุปกรณ์ล่าสุด แล้วลองอีกครั้ง
+                if stream is not None: stream.close()
+                self.needs_reset = True
+                warm = False
+                stream = self._open(profile)
+                stream.start(t0)
+            stream.warm = warm
+            self.in_use = True
+            return stream
+
+    def release(self, stream, failed=False):
+        """คืน Stream หลังอัดเสร็จ: หยุดไว้ให้ครั้งหน้าเริ่มได้ทันที, failed (อ่านไม่ได้ระหว่างอัด) -> ปิด แล้ว Initialize ใหม่ครั้งหน้า"""
+        with self.lock:
+            self.in_use = False
+            entry = {"warm": stream.warm, "open_ms": None if stream.warm else stream.open_ms,
+                     "ttff_ms": stream.first_frame_ms, "failed": failed}
+            self.sessions.append(entry)
+            if entry["ttff_ms"] is not None:
+                print(f"Mic: first frame {entry['ttff_ms']:.0f} ms ({'warm' if stream.warm else 'cold'} stream)")
+            if not failed:
+                try: stream.pause()
+                except Exception: failed = True
+            if failed:
+                stream.close()
+                self.needs_reset = True
+                return
+            self.stream = stream
+            self._schedule_idle()
+
+    def close(self):
+        with self.lock:
+            self._cancel_idle()
+            if self.stream is not None: self.stream.close(); self.stream = None
+            if self.pa is not None:
+                try: self.pa.terminate()
+                except: pass
+                self.pa = None
+
+    def get_metrics(self):
+        ttffs = [s["ttff_ms"] for s in self.sessions if s["ttff_ms"] is not None]
+        return {
+            "inits": self.inits, "init_ms": self.init_ms,
+            "sessions": len(self.sessions), "warm_sessions": sum(1 for s in self.sessions if s["warm"]),
+            "ttff_ms": ttffs[-1] if ttffs else None,
+            "ttff_avg_ms": sum(ttffs) / len(ttffs) if ttffs else None,
+            "ttff_max_ms": max(ttffs) if ttffs else None,
+        }
+
+    def _init(self):
+        if self.pa is not None:
+            try: self.pa.terminate()
+            except: pass
+            self.pa = None
+        t0 = time.perf_counter()
+        self.pa = self.pa_factory()
+        self.init_ms = (time.perf_counter() - t0) * 1000
+        self.inits += 1
+        self.needs_reset = False
+
+    def _open(self, profile):
+        if self.pa is None or self.needs_reset: self._init()
+        t0 = time.perf_counter()
+        stream = CaptureStream(self.pa, profile)
+        stream.open_ms = (time.perf_counter() - t0) * 1000
+        return stream
+
+    def _schedule_idle(self):
+        self._cancel_idle()
+        if not self.idle_close: return
+        self.idle_timer = threading.Timer(self.idle_close, self._on_idle)
+        self.idle_timer.daemon = True
+        self.idle_timer.start()
+
+    def _cancel_idle(self):
+        if self.idle_timer is not None: self.idle_timer.cancel(); self.idle_timer = None
+
+    def _on_idle(self):
+        with self.lock:
+            if self.in_use or self.stream is None: return
+            self.stream.close(); self.stream = None
+            try: self._init()  # ครั้งหน้าเปิดแค่ Stream บนรายการอุปกรณ์ล่าสุด
+            except Exception as e: self.pa = None; print(f"Audio re-init failed: {e}")
+
+class SpeechGate:
+    """ตัดเสียงเงียบหัว/ท้ายด้วยสถานะของ VAD ก่อนส่งเข้า Recognizer: process(chunk) -> [Chunk ที่ส่งต่อได้]
+    - ก่อนพูด: เก็บแค่ Chunk ล่าสุดเท่าช่วง Onset ของ VAD (ต้นคำที่ VAD ยังไม่ยืนยัน) ที่เหลือทิ้ง
+    - เงียบหลังพูด: พักไว้ก่อน พูดต่อค่อยส่งตามไป ถ้าจบเลยส่งแค่ tail() ไม่เกิน GATE_TAIL_MS"""
+    def __init__(self, vad, chunk_ms):
+        self.vad = vad
+        self.pre = deque(maxlen=VAD_ONSET_CHUNKS)
+        self.held = []
+        self.tail_chunks = max(0, round(GATE_TAIL_MS / chunk_ms))
+        self.started = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def process(self, data):
+        self.bytes_in += len(data)
+        if self.vad.process(data):
+            out = self.held + [data]
+            if not self.started: out = list(self.pre) + out
+            self.started = True
+            self.held = []
+            self.pre.clear()
+        else:
+            if self.started: self.held.append(data)
+            else: self.pre.append(data)
+            return []
+        self.bytes_out += sum(len(c) for c in out)
+        return out
+
+    def tail(self):
+        out = self.held[:self.tail_chunks]
+        self.held = []
+        self.bytes_out += sum(len(c) for c in out)
+        return out
@@ -0,0 +1,476 @@
+# benchmark.py
+# ///////////////////////////////////////////////////////////////
+# Micro-benchmarks สำหรับวัดผลการ Optimize (ไม่ถูกใช้โดยตัวแอป)
+# รัน: python benchmark.py rollover [--years 10] [--per-month 60]
+#      python benchmark.py sync [--rows 5000] [--latency-ms 0]
+#      python benchmark.py pull [--rows 50000]
+#      python benchmark.py http [--calls 50] [--rows 2000]
+#      python benchmark.py engine [--rows 20000] [--latency-ms 150] [--kbps 500]
+#      python benchmark.py audio [--chunks 2000] [--frames 1024]
+#      python benchmark.py capture [--speech-s 2.5]
+# ///////////////////////////////////////////////////////////////
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from database import DatabaseManager
+
+# ///////////////////////////////////////////////////////////////
+# [SECTION: HELPERS]
+# ///////////////////////////////////////////////////////////////
+def _month_add(y, m, delta):
+    idx = y * 12 + (m - 1) + delta
+    return idx // 12, idx % 12 + 1
+
+def _make_ledger_db(years, per_month, seed=42):
+    """สร้าง DB ชั่วคราวที่มีรายการย้อนหลัง `years` ปี เดือนละ `per_month` รายการ"""
+    rnd = random.Random(seed)
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    db = DatabaseManager(path)
+    db.connect()
+
+    now = datetime.now()
+    sy, sm = _month_add(now.year, now.month, -(years * 12 - 1))
+    rows = []
+    for i in range(years * 12):
+        y, m = _month_add(sy, sm, i)
+        rows.append(("income", "เงินเดือน", 30000.0, "เงินเดือน", datetime(y, m, 1, 9, 0), None, str(uuid.uuid4())))
+        for _ in range(per_month):
+            d = datetime(y, m, rnd.randint(1, 28), rnd.randint(0, 23), rnd.randint(0, 59))
+            rows.append(("expense", rnd.choice(["ข้าว", "กาแฟ", "รถเมล์", "ของใช้"]), float(rnd.randint(20, 800)), "อาหาร", d, None, str(uuid.uuid4())))
+    db.conn.executemany("INSERT INTO transactions (type, item, amount, category, date, payment_id, is_deleted, uuid) VALUES (?,?,?,?,?,?,0,?)", rows)
+    db.conn.commit()
+    return db, path, (sy, sm)
+
+class _StatementCounter:
+    def __init__(self, conn):
+        self.conn = conn; self.count = 0
+    def __enter__(self):
+        self.count = 0
+        self.conn.set_trace_callback(self._cb)
+        return self
+    def __exit__(self, *exc):
+        self.conn.set_trace_callback(None)
+    def _cb(self, _stmt):
+        self.count += 1
+
+def _legacy_recalculate(db, start_date):
+    """อัลกอริทึมเดิม (Query ทีละเดือน) เก็บไว้เพื่อเทียบผลเท่านั้น"""
+    cy, cm = start_date.year, start_date.month
+    now = datetime.now()
+    while True:
+        ny, nm = _month_add(cy, cm, 1)
+        if ny > now.year + 5: break
+        if ny == now.year and nm > now.month + 1: break
+        bal = db.conn.execute(
+            "SELECT SUM(CASE WHEN type='income' THEN amount ELSE -amount END) FROM transactions WHERE type IN ('income', 'expense', 'repayment') AND (payment_id IS NULL OR type='repayment') AND strftime('%Y-%m', date) = ? AND is_deleted = 0",
+            (f"{cy}-{cm:02d}",)
+        ).fetchone()[0] or 0.0
+        rows = db.conn.execute(
+            "SELECT id, amount, is_deleted FROM transactions WHERE strftime('%Y-%m', date)=? AND (item='ยอดยกมา' OR item='Balance Forward') ORDER BY id",
+            (f"{ny}-{nm:02d}",)
+        ).fetchall()
+        exist = rows[0] if rows else None
+        for r_dup in rows[1:]:
+            if r_dup[2] == 0: db.conn.execute("UPDATE transactions SET is_deleted=1 WHERE id=?", (r_dup[0],))
+        if bal > 0:
+            if exist:
+                if abs(exist[1] - bal) > 0.01 or exist[2] == 1:
+                    db.conn.execute("UPDATE transactions SET amount=?, is_deleted=0 WHERE id=?", (bal, exist[0]))
+            else:
+                db.conn.execute(
+                    "INSERT INTO transactions (type, item, amount, category, date, payment_id, is_deleted, uuid) VALUES (?,?,?,?,?,NULL,0,?)",
+                    ("income", "ยอดยกมา", bal, "Others", datetime(ny, nm, 1), str(uuid.uuid4()))
+                )
+        elif exist and exist[2] == 0:
+            db.conn.execute("UPDATE transactions SET is_deleted=1 WHERE id=?", (exist[0],))
+        cy, cm = ny, nm
+    db.conn.commit()
+
+def _legacy_apply_transactions(cm, data_dict):
+    """การ Apply แบบเดิม (SELECT + UPDATE/INSERT ทีละแถว) เก็บไว้เพื่อเทียบผลเท่านั้น"""
+    for uid, val in data_dict.items():
+        pid = cm.card_map.get(val.get('payment_uuid'))
+        rev, upd = cm._rev_of(val)
+        exist_id = cm.db.get_id_by_uuid("transactions", uid)
+        if exist_id:
+            if val.get('is_deleted', 0) == 1: cm.db.conn.execute("UPDATE transactions SET is_deleted=1, rev=?, updated_at=? WHERE id=?", (rev, upd, exist_id))
+            else: cm.db.conn.execute("UPDATE transactions SET type=?, item=?, amount=?, category=?, date=?, payment_id=?, is_deleted=0, rev=?, updated_at=? WHERE id=?", (val['type'], val['item'], val['amount'], val['category'], val['date'], pid, rev, upd, exist_id))
+        else:
+            if val.get('is_deleted', 0) == 0: cm.db.conn.execute("INSERT INTO transactions (type, item, amount, category, date, payment_id, is_deleted, uuid, rev, updated_at) VALUES (?,?,?,?,?,?,0,?,?,?)", (val['type'], val['item'], val['amount'], val['category'], val['date'], pid, uid, rev, upd))
+    cm.db.conn.commit()
+
+def _make_cloud_dataset(rows, seed=42):
+    """ข้อมูลแบบเดียวกับที่ force_push ส่งขึ้น Cloud (Transaction `rows` รายการ)"""
+    rnd = random.Random(seed)
+    trans = {}
+    for i in range(rows):
+        uid = str(uuid.uuid4())
+        d = datetime(rnd.randint(2020, 2025), rnd.randint(1, 12), rnd.randint(1, 28), rnd.randint(0, 23), rnd.randint(0, 59))
+        trans[uid] = {"type": "expense", "item": rnd.choice(["ข้าว", "กาแฟ", "รถเมล์", "ของใช้"]), "amount": float(rnd.randint(20, 800)),
+                      "category": "อาหาร", "date": str(d), "is_deleted": 0, "uuid": uid, "rev": 1, "updated_at": 1_700_000_000_000 + i}
+    return {"transactions": trans, "last_update": 1_700_000_000_000 + rows}
+
+def _timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter(); fn(); dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+# ///////////////////////////////////////////////////////////////
+# [SECTION: BENCHMARKS]
+# ///////////////////////////////////////////////////////////////
+def bench_rollover(years=10, per_month=60, repeat=5):
+    db, path, (sy, sm) = _make_ledger_db(years, per_month)
+    try:
+        start = datetime(sy, sm, 1)
+        total_rows = db.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        print(f"Ledger: {years} years, {total_rows} transactions")
+
+        # รอบแรกสร้างแถวยอดยกมาทั้งหมด, รอบถัดไปคือกรณีแก้ไขรายการเก่า (ไม่มีอะไรเปลี่ยน)
+        with _StatementCounter(db.conn) as sc:
+            t_first = _timed(lambda: db.recalculate_rollovers_from(start), 1)
+        print(f"  single-pass (initial build) : {t_first * 1000:8.2f} ms, {sc.count} statements")
+
+        with _StatementCounter(db.conn) as sc:
+            t_new = _timed(lambda: db.recalculate_rollovers_from(start), repeat)
+        print(f"  single-pass (edit oldest)   : {t_new * 1000:8.2f} ms, {sc.count // repeat} statements")
+
+        with _StatementCounter(db.conn) as sc:
+            t_old = _timed(lambda: _legacy_recalculate(db, start), repeat)
+        print(f"  legacy per-month loop       : {t_old * 1000:8.2f} ms, {sc.count // repeat} statements")
+        if t_new > 0: print(f"  speedup: {t_old / t_new:.1f}x")
+    finally:
+        db.conn.close()
+        os.remove(path)
+
+def bench_sync(rows=5000, latency_ms=0):
+    # Full Sync (GET + PUT ทั้งก้อน) vs Delta Sync (Query ตาม updated_at + PATCH เฉพาะที่เปลี่ยน) ผ่าน Firebase Stub
+    from cloud import CloudManager
+    from firebase_stub import FirebaseStub
+
+    stub = FirebaseStub(latency_ms=latency_ms).start()
+    paths = []
+    try:
+        def make_client():
+            fd, path = tempfile.mkstemp(suffix=".db"); os.close(fd); os.remove(path)
+            paths.append(path)
+            db = DatabaseManager(path); db.connect()
+            return db, CloudManager(db, {"firebase_url": stub.base_url})
+
+        db_a, cm_a = make_client()
+        db_b, cm_b = make_client()
+        rnd = random.Random(42)
+        for i in range(rows):
+            db_a.add_transaction("expense", f"item{i}", float(rnd.randint(20, 800)), "อาหาร", datetime(2025, rnd.randint(1, 12), rnd.randint(1, 28)))
+        print(f"Sync: {rows} transactions, latency {latency_ms} ms")
+
+        def run(label, cm, mode=None):
+            cm.config = {"firebase_url": stub.base_url, "sync_mode": mode} if mode else {"firebase_url": stub.base_url}
+            stub.reset_stats()
+            t0 = time.perf_counter(); cm.sync_now(); dt = time.perf_counter() - t0
+            st = stub.get_stats()
+            print(f"  {label:<28}: {dt * 1000:8.2f} ms, {st['requests']:2d} requests, up {st['bytes_in']:>9,} B, down {st['bytes_out']:>9,} B")
+
+        run("bootstrap A (full)", cm_a)
+        run("bootstrap B (full)", cm_b)
+        run("idle, full", cm_a, "full")
+        run("idle, delta", cm_a)
+        db_a.add_transaction("expense", "coffee", 55.0, "อาหาร", datetime.now())
+        run("+1 record, full", cm_a, "full")
+        db_a.add_transaction("expense", "tea", 40.0, "อาหาร", datetime.now())
+        run("+1 record, delta", cm_a)
+        run("pull +2 records, delta", cm_b)
+    finally:
+        stub.stop()
+        for path in paths:
+            try: os.remove(path)
+            except: pass
+
+def bench_pull(rows=50000):
+    # force_pull ข้อมูล `rows` รายการผ่าน Firebase Stub: Apply แบบกลุ่ม (executemany) vs แบบเดิมทีละแถว
+    import requests
+    from cloud import CloudManager
+    from firebase_stub import FirebaseStub
+
+    stub = FirebaseStub().start()
+    paths = []
+    try:
+        def make_client():
+            fd, path = tempfile.mkstemp(suffix=".db"); os.close(fd); os.remove(path)
+            paths.append(path)
+            db = DatabaseManager(path); db.connect()
+            return db, CloudManager(db, {"firebase_url": stub.base_url})
+
+        dataset = _make_cloud_dataset(rows)
+        requests.put(f"{stub.base_url}/.json", json=dataset, timeout=120)
+        print(f"Pull: {rows} transactions from the stub")
+
+        db, cm = make_client()
+        stub.reset_stats()
+        with _StatementCounter(db.conn) as sc:
+            t0 = time.perf_counter(); cm.force_pull(); t_pull = time.perf_counter() - t0
+        n = db.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        print(f"  force_pull (bulk)           : {t_pull * 1000:8.2f} ms, {sc.count} statements, {n} rows, down {stub.get_stats()['bytes_out']:,} B")
+
+        # เทียบเฉพาะขั้น Apply (ไม่รวม HTTP/JSON) บน DB ว่าง แล้ว Apply ชุดเดิมซ้ำ (hash ตรงกันทุกแถว -> ไม่เขียน)
+        trans = dataset["transactions"]
+        db_new, cm_new = make_client()
+        cm_new._refresh_mappings()
+        with _StatementCounter(db_new.conn) as sc:
+            t0 = time.perf_counter(); cm_new._apply_transactions_to_local(trans); t_new = time.perf_counter() - t0
+        print(f"  bulk apply (empty DB)       : {t_new * 1000:8.2f} ms, {sc.count} statements")
+        with _StatementCounter(db_new.conn) as sc:
+            t0 = time.perf_counter(); written = cm_new._apply_transactions_to_local(trans); t_same = time.perf_counter() - t0
+        print(f"  bulk re-apply unchanged     : {t_same * 1000:8.2f} ms, {sc.count} statements, {written} rows written")
+
+        db_old, cm_old = make_client()
+        cm_old._refresh_mappings()
+        with _StatementCounter(db_old.conn) as sc:
+            t0 = time.perf_counter(); _legacy_apply_transactions(cm_old, trans); t_old = time.perf_counter() - t0
+        print(f"  legacy apply (empty DB)     : {t_old * 1000:8.2f} ms, {sc.count} statements")
+        with _StatementCounter(db_old.conn) as sc:
+            t0 = time.perf_counter(); _legacy_apply_transactions(cm_old, trans); t_old_same = time.perf_counter() - t0
+        print(f"  legacy re-apply unchanged   : {t_old_same * 1000:8.2f} ms, {sc.count} statements")
+        if t_new > 0: print(f"  speedup: {t_old / t_new:.1f}x (empty DB), {t_old_same / max(t_same, 1e-9):.1f}x (unchanged)")
+
+        # Peak memory (tracemalloc): force_pull แบบ Stream vs โหลดทั้ง Root ด้วย resp.json() แบบเดิม
+        # Stub แยก Process -> หน่วยความจำฝั่ง Server ไม่ถูกนับรวม
+        port = 18765 + os.getpid() % 1000
+        proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "firebase_stub.py"), "--port", str(port)], stdout=subprocess.DEVNULL)
+        url = f"http://127.0.0.1:{port}"
+        for _ in range(100):
+            try: requests.put(f"{url}/.json", json=dataset, timeout=120); break
+            except requests.ConnectionError: time.sleep(0.1)
+        db_mem, cm_mem = make_client()
+        cm_mem.base_url = url
+        tracemalloc.start()
+        cm_mem.force_pull()
+        _, peak_stream = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        tracemalloc.start()
+        whole = cm_mem._request("GET", "") or {}
+        copies = [cm_mem._ensure_dict(whole.get(coll)) for coll in ("categories", "cards", "transactions", "recurring")]
+        _, peak_whole = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del whole, copies
+        proc.terminate(); proc.wait()
+        print(f"  peak memory, streamed pull  : {peak_stream / 1e6:8.2f} MB")
+        print(f"  peak memory, resp.json()    : {peak_whole / 1e6:8.2f} MB (download only, before apply)")
+        for d in (db, db_new, db_old, db_mem): d.conn.close()
+    finally:
+        stub.stop()
+        for path in paths:
+            try: os.remove(path)
+            except: pass
+
+def bench_http(calls=50, rows=2000):
+    # Connection ใหม่ทุก Request (requests.get แบบเดิม) vs Session เดียว (Keep-alive) และขนาด Body เมื่อเปิด gzip
+    import requests
+    from cloud import CloudManager
+    from firebase_stub import FirebaseStub
+
+    stub = FirebaseStub().start()
+    try:
+        requests.put(f"{stub.base_url}/.json", json=_make_cloud_dataset(rows), timeout=60)
+        print(f"HTTP: {calls} small GETs, {rows}-row collection")
+
+        t0 = time.perf_counter()
+        for _ in range(calls): requests.get(f"{stub.base_url}/last_update.json", timeout=10).json()
+        t_bare = time.perf_counter() - t0
+        print(f"  new connection per call     : {t_bare * 1000 / calls:8.2f} ms/call")
+
+        cm = CloudManager(None, {"firebase_url": stub.base_url})
+        t0 = time.perf_counter()
+        for _ in range(calls): cm._request("GET", "last_update")
+        t_pool = time.perf_counter() - t0
+        print(f"  pooled session (keep-alive) : {t_pool * 1000 / calls:8.2f} ms/call")
+
+        for label, headers in (("identity", {"Accept-Encoding": "identity"}), ("gzip", {})):
+            stub.reset_stats()
+            data = requests.get(f"{stub.base_url}/transactions.json", headers=headers, timeout=60).json()
+            print(f"  GET collection, {label:<9}  : down {stub.get_stats()['bytes_out']:>10,} B")
+
+        for gz in (False, True):
+            cm.config["cloud_gzip_upload"] = gz
+            cm.metrics.clear()
+            cm._request("PUT", "transactions", data)
+            print(f"  PUT collection, gzip={str(gz):<5}  : up   {cm.get_metrics()['bytes_up']:>10,} B")
+        cm.close()
+    finally:
+        stub.stop()
+
+def bench_engine(rows=20000, latency_ms=150, kbps=500):
+    # force_push / force_pull: CloudManager (ทีละ Request) vs AsyncCloudManager (ขนานราย Collection + ช่วงเดือน)
+    # kbps = Bandwidth ต่อ Connection ของ Stub: Request ขนานกันได้ Bandwidth รวมมากกว่า เหมือน Firebase จริงบนเน็ตที่ Latency สูง
+    from cloud import CloudManager
+    from cloud_async import AsyncCloudManager
+    from firebase_stub import FirebaseStub
+
+    stub = FirebaseStub(latency_ms=latency_ms, kbps=kbps).start()
+    paths = []
+    try:
+        def make_client(cls):
+            fd, path = tempfile.mkstemp(suffix=".db"); os.close(fd); os.remove(path)
+            paths.append(path)
+            db = DatabaseManager(path); db.connect()
+            return db, cls(db, {"firebase_url": stub.base_url})
+
+        src, cm_src = make_client(CloudManager)
+        cm_src._refresh_mappings()
+        cm_src._apply_transactions_to_local(_make_cloud_dataset(rows)["transactions"])
+        print(f"Engine: {rows} transactions, stub latency {latency_ms} ms, {kbps or 'unlimited'} kB/s per connection")
+
+        for cls in (CloudManager, AsyncCloudManager):
+            cm_src.__class__ = cls
+            stub.reset_stats()
+            t0 = time.perf_counter(); cm_src.force_push(); t_push = time.perf_counter() - t0
+            n_push = stub.get_stats()["requests"]
+            db, cm = make_client(cls)
+            stub.reset_stats()
+            t0 = time.perf_counter(); cm.force_pull(); t_pull = time.perf_counter() - t0
+            n = db.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+            print(f"  {cls.__name__:<18}: push {t_push * 1000:8.2f} ms ({n_push} requests), "
+                  f"pull {t_pull * 1000:8.2f} ms ({stub.get_stats()['requests']} requests), {n} rows")
+            db.conn.close()
+        src.conn.close()
+    finally:
+        stub.stop()
+        for path in paths:
+            try: os.remove(path)
+            except: pass
+
+def bench_audio(chunks=2000, frames=1024, rate=44100):
+    # เวลาต่อ Chunk ของ record_thread: struct.unpack + Generator (เดิม) vs memoryview / NumPy และ VAD ทั้งชุด
+    import math
+    import struct
+    from array import array
+    import audio
+
+    rnd = random.Random(42)
+    pool = []
+    for k in range(32):
+        amp = 2500 if k % 4 else 60
+        pool.append(array("h", [max(-32768, min(32767, int(amp * math.sin(i * 0.025 * (k + 1)) + rnd.gauss(0, 80)))) for i in range(frames)]).tobytes())
+    budget_us = frames * 1e6 / rate
+
+    def old_rms(data):
+        shorts = struct.unpack("%dh" % (len(data) // 2), data)
+        return math.sqrt(sum(s**2 for s in shorts) / len(shorts))
+
+    cases = [("struct.unpack + generator (old)", old_rms),
+             ("memoryview rms", lambda d: audio._rms_py(audio.as_samples(d))),
+             ("memoryview rms + zcr", lambda d: (audio._rms_py(audio.as_samples(d)), audio._zcr_py(audio.as_samples(d))))]
+    if audio.HAS_NUMPY:
+        cases += [("numpy rms", lambda d: audio._rms_np(audio.as_samples(d))),
+                  ("numpy rms + zcr", lambda d: (audio._rms_np(audio.as_samples(d)), audio._zcr_np(audio.as_samples(d))))]
+    vad = audio.VoiceActivityDetector(rate, frames)
+    cases.append((f"VoiceActivityDetector.process ({'numpy' if audio.HAS_NUMPY else 'pure'})", vad.process))
+
+    print(f"Audio: {chunks} chunks of {frames} frames @ {rate} Hz (budget {budget_us / 1000:.1f} ms per chunk), numpy={audio.HAS_NUMPY}")
+    for label, fn in cases:
+        t0 = time.perf_counter()
+        for i in range(chunks): fn(pool[i % len(pool)])
+        per = (time.perf_counter() - t0) * 1e6 / chunks
+        print(f"  {label:<36}: {per:8.1f} us/chunk ({per * 100 / budget_us:5.2f}% of real time)")
+
+def bench_capture(speech_s=2.5):
+    # ข้อมูลที่ส่งเข้า Recognizer ต่อการพูดหนึ่งครั้ง: 44.1 kHz ตั้งแต่เริ่มพูดถึงเงียบ 2 วินาที (เดิม) vs Profile 16 kHz + SpeechGate
+    import math
+    from array import array
+    import audio
+    from recognizer import SPEECH_END_TIMEOUT
+
+    rnd = random.Random(7)
+    def synth(rate, seconds, voiced):
+        n = int(seconds * rate)
+        if not voiced: return array("h", [int(rnd.gauss(0, 60)) for _ in range(n)])
+        # เสียงพูดสมมติ: 180 Hz + Harmonic, เว้นวรรคระหว่างคำ 150 ms ทุก 600 ms
+        return array("h", [int((2200 * math.sin(2 * math.pi * 180 * i / rate) + 800 * math.sin(2 * math.pi * 540 * i / rate))
+                               * (0.05 if (i % int(0.6 * rate)) > int(0.45 * rate) else 1.0) + rnd.gauss(0, 60)) for i in range(n)])
+    sources = {rate: synth(rate, 1.0, False) + synth(rate, speech_s, True) + synth(rate, 3.0, False) for rate in (44100, 16000)}
+
+    def run(rate, frames, end_timeout, src_rate, gated):
+        pcm = sources[src_rate]
+        vad = audio.VoiceActivityDetector(rate, frames)
+        gate = audio.SpeechGate(vad, 1000.0 * frames / rate)
+        resampler = audio.Resampler(src_rate, rate) if src_rate != rate else None
+        step = int(round(frames * src_rate / rate))
+        sent, spoken, silent_for, chunk_s = 0, False, 0.0, frames / rate
+        t0 = time.perf_counter(); n = 0
+        for i in range(0, len(pcm) - step, step):
+            data = pcm[i:i + step].tobytes()
+            if resampler: data = resampler.process(data)
+            n += 1
+            if gated:
+                out = gate.process(data)
+                if out: spoken, silent_for = True, 0.0; sent += sum(len(c) for c in out)
+                elif spoken:
+                    silent_for += chunk_s
+                    if silent_for > end_timeout: break
+            else:
+                # แบบเดิม: ส่งทุก Chunk ตั้งแต่ VAD เริ่มพูด รวมเงียบท้ายจนครบ end_timeout
+                if vad.process(data): spoken, silent_for = True, 0.0; sent += len(data)
+                elif spoken:
+                    sent += len(data); silent_for += chunk_s
+                    if silent_for > end_timeout: break
+        if gated: sent += sum(len(c) for c in gate.tail())
+        return sent, (time.perf_counter() - t0) * 1e6 / max(n, 1)
+
+    print(f"Capture: {speech_s}s of speech between 1s leading / 3s trailing silence")
+    base = None
+    for label, args in (("44.1 kHz, no trim, 2.0s end (old)", (44100, 1024, 2.0, 44100, False)),
+                        ("16 kHz native, SpeechGate", (16000, 512, SPEECH_END_TIMEOUT, 16000, True)),
+                        ("16 kHz resampled from 44.1k, Gate", (16000, 512, SPEECH_END_TIMEOUT, 44100, True))):
+        sent, per_chunk = run(*args)
+        base = base or sent
+        print(f"  {label:<36}: {sent:>9,} B PCM ({sent * 100 / base:5.1f}%), {per_chunk:7.1f} us/chunk")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Money Tracker micro-benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_roll = sub.add_parser("rollover", help="recalculate_rollovers_from on a multi-year ledger")
+    p_roll.add_argument("--years", type=int, default=10)
+    p_roll.add_argument("--per-month", type=int, default=60)
+
+    p_sync = sub.add_parser("sync", help="full vs delta cloud sync against the local Firebase stub")
+    p_sync.add_argument("--rows", type=int, default=5000)
+    p_sync.add_argument("--latency-ms", type=int, default=0)
+
+    p_pull = sub.add_parser("pull", help="force_pull of a large synthetic dataset from the local Firebase stub")
+    p_pull.add_argument("--rows", type=int, default=50000)
+
+    p_http = sub.add_parser("http", help="pooled keep-alive session and gzip vs plain requests against the local Firebase stub")
+    p_http.add_argument("--calls", type=int, default=50)
+    p_http.add_argument("--rows", type=int, default=2000)
+
+    p_engine = sub.add_parser("engine", help="sequential vs asyncio cloud engine (force_push / force_pull) with stub latency")
+    p_engine.add_argument("--rows", type=int, default=20000)
+    p_engine.add_argument("--latency-ms", type=int, default=150)
+    p_engine.add_argument("--kbps", type=int, default=500)
+
+    p_audio = sub.add_parser("audio", help="per-chunk RMS / zero-crossing / VAD cost of the voice record loop")
+    p_audio.add_argument("--chunks", type=int, default=2000)
+    p_audio.add_argument("--frames", type=int, default=1024)
+
+    p_capture = sub.add_parser("capture", help="PCM bytes per utterance for 44.1 kHz vs the 16 kHz capture profile with VAD trimming")
+    p_capture.add_argument("--speech-s", type=float, default=2.5)
+
+    args = parser.parse_args()
+    if args.cmd == "rollover": bench_rollover(args.years, args.per_month)
+    elif args.cmd == "sync": bench_sync(args.rows, args.latency_ms)
+    elif args.cmd == "pull": bench_pull(args.rows)
+    elif args.cmd == "http": bench_http(args.calls, args.rows)
+    elif args.cmd == "engine": bench_engine(args.rows, args.latency_ms, args.kbps)
+    elif args.cmd == "audio": bench_audio(args.chunks, args.frames)
+    elif args.cmd == "capture": bench_capture(args.speech_s)
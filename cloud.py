@@ -1,9 +1,130 @@
 # cloud.py
+import codecs
+import gzip
 import json
+import queue
+import re
 import requests
 import time
 import threading
+from collections import deque
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from database import DIGEST_MOD
+
+# (ชื่อ Node บน Cloud, ชื่อตารางในเครื่อง) เรียงตามลำดับที่ต้อง Apply (Cards ก่อน Transaction เพื่อ Map payment_uuid)
+SYNC_COLLECTIONS = [
+    ("categories", "categories"),
+    ("cards", "credit_cards"),
+    ("transactions", "transactions"),
+    ("recurring", "recurring_expenses"),
+]
+SERVER_TIMESTAMP = {".sv": "timestamp"}
+FULL_SYNC_INTERVAL = 24 * 3600  # วินาที: Full Sync เป็นระยะ เพื่อรับข้อมูลจาก Client รุ่นเก่าที่ไม่มี updated_at
+APPLY_CHUNK = 2000       # แถวต่อ Transaction ตอน Apply ข้อมูลจาก Cloud
+OUTBOX_BATCH = 500       # รายการต่อ PATCH ตอนส่ง Outbox (Ack ทีละก้อน ค้างกลางทางแล้วไม่ต้องส่งซ้ำ)
+TOMBSTONE_RETENTION_DAYS = 90  # วัน: เก็บแถวที่ลบแล้ว (Sync แล้ว) ไว้นานเท่านี้ก่อนลบจริง เปลี่ยนได้ด้วย config["tombstone_retention_days"]
+SYNC_DEBOUNCE = 1.0      # วินาที: รอให้การแก้ไขต่อเนื่องจบก่อนค่อย Sync
+SYNC_MAX_WAIT = 5.0      # วินาที: แก้ไขไม่หยุดก็ยัง Sync อย่างน้อยทุกๆ ช่วงนี้
+SYNC_RETRY_MIN = 2.0     # วินาที: Backoff ครั้งแรกเมื่อ Sync ไม่สำเร็จ (Offline)
+SYNC_RETRY_MAX = 300.0   # วินาที: Backoff สูงสุด
+
+STREAM_CHUNK = 64 * 1024  # bytes ต่อครั้งตอนอ่าน Response แบบ Stream
+HTTP_TIMEOUT = (5, 30)    # วินาที (connect, read) เปลี่ยนได้ด้วย config["cloud_timeout"] (ตัวเลขเดียว หรือ [connect, read])
+HTTP_RETRIES = 3          # ครั้ง (เชื่อมต่อไม่ได้ / 429 / 5xx) เปลี่ยนได้ด้วย config["cloud_retries"]
+GZIP_MIN_BYTES = 1024     # Body ที่เล็กกว่านี้ไม่คุ้มบีบอัด
+HTTP_POOL_SIZE = 8        # Connection ค้างไว้ต่อ Host (AsyncCloudManager ยิงพร้อมกันหลาย Request)
+
+LAYOUT_MONTHLY = "monthly"  # meta/layout: Transaction อยู่ที่ transactions/<YYYY-MM>/<uuid> (ไม่มี = transactions/<uuid> แบบเดิม)
+LAZY_MONTHS = 3             # Layout รายเดือน: เครื่องใหม่ดึงเฉพาะ N เดือนล่าสุด เดือนเก่าดึงตอนเลื่อนปฏิทินไปถึง
+MONTH_KEY = re.compile(r"^\d{4}-\d{2}$")
+
+def iter_json_object(chunks):
+    """อ่าน JSON Object ชั้นนอกสุดทีละ (key, value) จาก Stream ของ bytes โดยไม่ต้องโหลดทั้งก้อน
+    (แต่ละ value ยัง parse ด้วย json ปกติ -> หน่วยความจำขึ้นกับขนาด Record เดียว ไม่ใช่ทั้ง Collection)
+    Firebase ส่ง null มาถ้า Node ว่าง -> ไม่ yield อะไร"""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    it = iter(chunks)
+    buf, pos, eof = "", 0, False
+
+    def more():
+        nonlocal buf, pos, eof
+        if eof: return False
+        chunk = next(it, None)
+        if chunk is None:
+            eof = True; buf += utf8.decode(b"", final=True)
+        else:
+            buf = buf[pos:] + utf8.decode(chunk); pos = 0
+        return True
+
+    def skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n": pos += 1
+            if pos < len(buf) or not more(): return
+
+    def read_value():
+        # raw_decode ที่จบพอดีท้าย buffer อาจเป็นตัวเลขที่ยังมาไม่ครบ -> อ่านเพิ่มก่อน
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                if end < len(buf) or eof:
+                    pos = end; return value
+            except json.JSONDecodeError:
+                if eof: raise
+            more()
+
+    skip_ws()
+    if buf.startswith("null", pos) or pos >= len(buf): return
+    if buf[pos] != "{":
+        # ไม่ใช่ Object (เช่น Firebase ส่ง Array มา) -> parse ทั้งก้อนแบบเดิม
+        value = read_value()
+        for item in (enumerate(value) if isinstance(value, list) else ()):
+            if item[1] is not None: yield str(item[0]), item[1]
+        return
+    pos += 1
+    while True:
+        skip_ws()
+        if buf[pos] == "}": return
+        if buf[pos] == ",": pos += 1; skip_ws()
+        key = read_value()
+        skip_ws()
+        pos += 1  # ':'
+        skip_ws()
+        yield key, read_value()
+
+def tx_month(rec):
+    # Shard ของ Record = เดือนของ date (Marker ย้ายเดือนอยู่ที่ Shard เดิม)
+    return rec.get("moved_from") or str(rec.get("date"))[:7]
+
+def _newer_tx(a, b):
+    # uuid เดียวกันเจอหลายที่ (ย้ายเดือน / ค้างแบบเดิมระหว่าง Migrate) -> ของจริงชนะ Marker แล้วดู rev
+    if a is None: return b
+    if bool(a.get("moved_to")) != bool(b.get("moved_to")): return b if a.get("moved_to") else a
+    return b if int(b.get("rev") or 0) > int(a.get("rev") or 0) else a
+
+def split_transactions(node):
+    """Node transactions บน Cloud (แบบเดิม / รายเดือน / ปนกันระหว่าง Migrate)
+    -> ({uuid: record}, {uuid: [Shard ที่เจอ ('' = แบบเดิม)]})"""
+    records, where = {}, {}
+    for key, val in (node or {}).items():
+        if not isinstance(val, dict): continue
+        items = val.items() if MONTH_KEY.match(key) else ((key, val),)
+        for uid, rec in items:
+            if not isinstance(rec, dict): continue
+            records[uid] = _newer_tx(records.get(uid), rec)
+            where.setdefault(uid, []).append(key if MONTH_KEY.match(key) else "")
+    return records, where
+
+def _month_cutoff(months_back=LAZY_MONTHS):
+    # 'YYYY-MM' ของ N-1 เดือนก่อนเดือนนี้ (LAZY_MONTHS=3 ตอนเดือน 10 -> เดือน 08)
+    now = datetime.now()
+    m = now.year * 12 + now.month - months_back
+    return f"{m // 12:04d}-{m % 12 + 1:02d}"
 
 class CloudManager:
     def __init__(self, db, config):
@@ -16,26 +137,103 @@ class CloudManager:
         self.cat_map = {}
         self.card_map = {}
 
-    def _request(self, method, path, data=None, params=None):
-        if not self.base_url: return None
+        # Sync / Push / Pull ทีละงานเท่านั้น (ใช้ sqlite connection และ Firebase root เดียวกัน)
+        self.sync_lock = threading.Lock()
+        self.last_error = None
+
+        # HTTP: Session เดียว (Keep-alive + Connection pool + Retry) และสถิติของแต่ละ Request
+        self.session = None
+        self.metrics = deque(maxlen=500)
+
+    def _cfg(self, key, default):
+        return self.config.get(key, default) if self.config else default
+
+    def _timeout(self):
+        # config["cloud_timeout"]: ตัวเลขเดียว (ใช้ทั้ง connect และ read) หรือ [connect, read]
+        value = self._cfg("cloud_timeout", HTTP_TIMEOUT)
+        if isinstance(value, (int, float, str)): return float(value)
+        return tuple(float(v) for v in value)
+
+    def _get_session(self):
+        if self.session is None:
+            retries = int(self._cfg("cloud_retries", HTTP_RETRIES))
+            retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=frozenset({"GET", "PUT", "PATCH", "DELETE"}), raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+            self.session = session
+        return self.session
+
+    def close(self):
+        if self.session: self.session.close(); self.session = None
+
+    def _send(self, method, path, data=None, params=None, stream=False):
         url = f"{self.base_url}/{path}.json"
-        
         req_params = {}
         if self.secret_key: req_params["auth"] = self.secret_key
         if params: req_params.update(params)
-        
+
+        headers, body = {}, None
+        if method in ("PUT", "PATCH"):
+            # JSON แบบกระชับ + UTF-8 (ไม่ escape ภาษาไทยเป็น \uXXXX), gzip ถ้า Backend รองรับ (config["cloud_gzip_upload"])
+            body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            headers["Content-Type"] = "application/json; charset=utf-8"
+            if self._cfg("cloud_gzip_upload", False) and len(body) >= GZIP_MIN_BYTES:
+                body = gzip.compress(body, 6)
+                headers["Content-Encoding"] = "gzip"
+
+        timeout = self._timeout()
+        t0 = time.perf_counter()
+        status = None
         try:
-            if method == "GET":
-                resp = requests.get(url, params=req_params, timeout=10)
-            else:
-                resp = requests.put(url, json=data, params=req_params, timeout=10)
-            
-            if resp.status_code == 200:
-                return resp.json()
-            else:
-                raise Exception(f"Cloud Error {resp.status_code}: {resp.text}")
-        except Exception as e:
-            raise e
+            resp = self._get_session().request(method, url, params=req_params, data=body, headers=headers, timeout=timeout, stream=stream)
+            status = resp.status_code
+            return resp
+        finally:
+            # stream=True: เวลาถึงได้รับ Header (ตัวข้อมูลอ่านทีหลัง)
+            down = 0
+            if status is not None:
+                down = int(resp.headers.get("Content-Length") or (0 if stream else len(resp.content)))
+            self.metrics.append({"method": method, "path": path, "status": status, "ms": (time.perf_counter() - t0) * 1000,
+                                 "bytes_up": len(body or b""), "bytes_down": down})
+
+    def _request(self, method, path, data=None, params=None):
+        if not self.base_url: return None
+        
+        # เขียนแบบ print=silent -> Firebase ตอบ 204 ไม่ส่งข้อมูลที่เขียนกลับมา (ประหยัด Bandwidth)
+        if method in ("PUT", "PATCH"): params = dict(params or {}, print="silent")
+        
+        resp = self._send(method, path, data, params)
+        if resp.status_code == 204:
+            return None
+        if resp.status_code == 200:
+            return resp.json()
+        else:
+            raise Exception(f"Cloud Error {resp.status_code}: {resp.text}")
+
+    def _stream(self, path, params=None):
+        # GET แบบ Stream -> yield (key, value) ของ Object ชั้นแรกทีละรายการ (ใช้กับ Collection ใหญ่)
+        if not self.base_url: return
+        with self._send("GET", path, params=params, stream=True) as resp:
+            if resp.status_code != 200: raise Exception(f"Cloud Error {resp.status_code}: {resp.text}")
+            yield from iter_json_object(resp.iter_content(STREAM_CHUNK))
+
+    def get_metrics(self, reset=False):
+        """สรุปสถิติ HTTP ล่าสุด (สูงสุด 500 Request): จำนวน, เวลา (ms), bytes ของ Body ขึ้น/ลงตามที่ส่งจริง (หลัง gzip)"""
+        items = list(self.metrics)
+        if reset: self.metrics.clear()
+        times = [m["ms"] for m in items]
+        by_method = {}
+        for m in items: by_method[m["method"]] = by_method.get(m["method"], 0) + 1
+        return {
+            "requests": len(items), "errors": sum(1 for m in items if m["status"] is None or m["status"] >= 400),
+            "total_ms": sum(times), "avg_ms": sum(times) / len(times) if times else 0, "max_ms": max(times, default=0),
+            "bytes_up": sum(m["bytes_up"] for m in items), "bytes_down": sum(m["bytes_down"] for m in items),
+            "by_method": by_method,
+        }
 
     def _ensure_dict(self, data):
         if data is None: return {}
@@ -76,6 +274,118 @@ class CloudManager:
                     
         return merged
 
+    # --- Layout รายเดือน (transactions/<YYYY-MM>/<uuid>) ---
+    def _monthly(self):
+        return bool(self.db) and self.db.get_setting("cloud_layout", "") == LAYOUT_MONTHLY
+
+    def _loaded_filter(self):
+        # None = เครื่องนี้มีครบทุกเดือน, ไม่งั้น f(ym) -> True ถ้าดึงเดือนนั้นมาแล้ว
+        raw = self.db.get_setting("cloud_months_loaded", "") if self.db else ""
+        if not raw: return None
+        state = json.loads(raw)
+        start, extra = state.get("from") or "", set(state.get("months") or [])
+        return lambda ym: ym >= start or ym in extra
+
+    def _set_loaded(self, start=None, months=()):
+        # start=None -> มีครบทุกเดือน
+        if start is None: self.db.set_setting("cloud_months_loaded", "")
+        else: self.db.set_setting("cloud_months_loaded", json.dumps({"from": start, "months": sorted(months)}))
+
+    def _note_meta(self, cloud_meta):
+        # จำ Layout ของ Cloud + Digest ของเดือนที่เครื่องนี้ยังไม่ได้ดึง (ใช้ประกอบ meta ของเครื่อง) -> True ถ้าเป็นรายเดือน
+        if not self.db or not isinstance(cloud_meta, dict): return self._monthly()
+        layout = cloud_meta.get("layout") or ""
+        if layout != self.db.get_setting("cloud_layout", ""): self.db.set_setting("cloud_layout", layout)
+        is_loaded = self._loaded_filter()
+        if is_loaded:
+            months = (cloud_meta.get("transactions") or {}).get("months") or {}
+            self.db.set_setting("cloud_months_meta", json.dumps({ym: d for ym, d in months.items() if not is_loaded(ym)}))
+        return layout == LAYOUT_MONTHLY
+
+    def _start_lazy(self, cloud_meta):
+        # เครื่องที่ยังไม่มี Transaction เลย: ดึงเฉพาะเดือนล่าสุด -> คืนเดือนที่ต้องดึงตอนนี้
+        self._set_loaded(_month_cutoff())
+        self._note_meta(cloud_meta)
+        is_loaded = self._loaded_filter()
+        return sorted(ym for ym in ((cloud_meta or {}).get("transactions") or {}).get("months") or {} if is_loaded(ym))
+
+    def _load_months(self, months):
+        # ดึง Shard ของเดือนที่ยังไม่มีในเครื่องมา Apply แล้วจำว่าดึงแล้ว -> จำนวนแถวที่เขียน
+        months = sorted(set(months))
+        if not months: return 0
+        data = self._get_months(months)
+        written = 0
+        old_notify = self.db.on_data_changed
+        self.db.on_data_changed = None
+        try:
+            self._refresh_mappings()
+            written = self._apply_transactions_to_local(data)
+        finally:
+            self.db.on_data_changed = old_notify
+        state = json.loads(self.db.get_setting("cloud_months_loaded", "") or "{}")
+        if state: self._set_loaded(state.get("from") or "", set(state.get("months") or []) | set(months))
+        return written
+
+    def _get_months(self, months):
+        # {uuid: record} ของ Shard รายเดือน (Shard หนึ่งเล็ก ดึงทั้งก้อน ไม่ต้องมี Index)
+        data = {}
+        for ym in months:
+            for uid, rec in self._ensure_dict(self._request("GET", f"transactions/{ym}")).items():
+                if isinstance(rec, dict): data[uid] = _newer_tx(data.get(uid), rec)
+        return data
+
+    def _get_flat_transactions(self):
+        # Record ที่ยังอยู่แบบเดิม (transactions/<uuid>) เช่นเขียนจาก Client รุ่นเก่าหลัง Migrate: shallow ได้แค่ชื่อ Key
+        keys = self._ensure_dict(self._request("GET", "transactions", params={"shallow": "true"}))
+        flat = {uid: self._request("GET", f"transactions/{uid}") for uid in keys if not MONTH_KEY.match(uid)}
+        return {uid: rec for uid, rec in flat.items() if isinstance(rec, dict)}
+
+    def _nest_months(self, records):
+        shards = {}
+        for uid, rec in records.items(): shards.setdefault(tx_month(rec), {})[uid] = rec
+        return shards
+
+    def _move_marker(self, uid, rec, old_ym):
+        # แทนสำเนาที่ Shard เดิมเมื่อย้ายเดือน -> เครื่องที่ยังไม่ได้ดึงเดือนใหม่จะลบสำเนาเก่าของตัวเองทิ้ง
+        return {"uuid": uid, "rev": rec.get("rev", 0), "moved_from": old_ym, "moved_to": tx_month(rec), "updated_at": SERVER_TIMESTAMP}
+
+    def month_pending(self, ym):
+        """True ถ้าเดือนนี้ยังไม่ได้ดึงจาก Cloud (Layout รายเดือน และเครื่องนี้ดึงมาไม่ครบ)"""
+        if not self.db or not self.base_url or not self._monthly(): return False
+        is_loaded = self._loaded_filter()
+        return is_loaded is not None and not is_loaded(ym)
+
+    def ensure_month(self, ym):
+        """ดึง Transaction ของเดือนเก่าที่ยังไม่มีในเครื่อง (เลื่อนปฏิทินไปถึง) -> จำนวนแถวที่เขียน"""
+        with self.sync_lock:
+            try:
+                return self._load_months([ym]) if self.month_pending(ym) else 0
+            except Exception as e:
+                print(f"Load month {ym} failed: {e}")
+                return 0
+
+    def migrate_layout(self, callback=None):
+        """ย้าย Transaction บน Cloud จาก transactions/<uuid> ไปเป็น transactions/<YYYY-MM>/<uuid>
+        ทีละ APPLY_CHUNK รายการ (แต่ละก้อนย้ายใน PATCH เดียว ค้างกลางทางแล้วสั่งใหม่ได้) แล้วค่อยเขียน meta/layout"""
+        with self.sync_lock:
+            try:
+                if callback: callback("Migrating: Reading Cloud Data...")
+                moved = 0
+                for batch in self._chunked((k, v) for k, v in self._stream("transactions") if not MONTH_KEY.match(k)):
+                    patch = {}
+                    for uid, rec in batch.items():
+                        patch[f"{tx_month(rec)}/{uid}"] = rec
+                        patch[uid] = None
+                    self._request("PATCH", "transactions", patch)
+                    moved += len(batch)
+                    if callback: callback(f"Migrating: {moved} moved")
+                # Layout ใหม่มีผลเมื่อมี meta/layout เท่านั้น (ระหว่างย้าย เครื่องอื่นยังอ่านแบบเดิมและแบบปนกันได้)
+                self._request("PATCH", "", {"meta/layout": LAYOUT_MONTHLY, "last_update": SERVER_TIMESTAMP})
+                self.db.set_setting("cloud_layout", LAYOUT_MONTHLY)
+                if callback: callback(f"Monthly layout ready ({moved} moved)", "green")
+            except Exception as e:
+                if callback: callback(f"Error: {e}", "red")
+
     # --- Manual Actions for Settings UI ---
 
     def test_connection(self):
@@ -87,90 +397,174 @@ class CloudManager:
 
     def force_push(self, callback=None):
         """ส่งข้อมูลจากเครื่องขึ้น Cloud (ทับของเก่า)"""
-        try:
-            if callback: callback("Pushing: Reading Local Data...")
-            local_cats = self._get_local_categories_dict()
-            local_cards = self._get_local_cards_dict()
-            local_trans = self._get_local_transactions_dict()
-            local_recs = self._get_local_recurring_dict()
-
-            payload = {
-                "categories": local_cats,
-                "cards": local_cards,
-                "transactions": local_trans,
-                "recurring": local_recs,
-                "last_update": time.time()
-            }
-            
-            if callback: callback("Pushing: Uploading...")
-            self._request("PUT", "", payload)
-            if callback: callback("Push Success!", "green")
-        except Exception as e:
-            if callback: callback(f"Error: {e}", "red")
+        with self.sync_lock:
+            try:
+                if self._note_meta(self._request("GET", "meta")) and self._loaded_filter():
+                    # ทับทั้ง Cloud ต้องมีครบทุกเดือนก่อน
+                    if callback: callback("Pushing: Loading Older Months...")
+                    self._load_months(json.loads(self.db.get_setting("cloud_months_meta", "") or "{}"))
+                    self._set_loaded(None)
+                self._push_all(callback)
+                self.db.clear_sync_journal()
+                last_update = self._request("GET", "last_update")
+                self._set_watermark(last_update + 1 if isinstance(last_update, (int, float)) else None)
+                if callback: callback("Push Success!", "green")
+            except Exception as e:
+                if callback: callback(f"Error: {e}", "red")
+
+    def _push_all(self, callback=None):
+        # PUT ทั้ง Root ในครั้งเดียว (AsyncCloudManager แยกส่งทีละ Collection พร้อมกัน)
+        if callback: callback("Pushing: Reading Local Data...")
+        monthly = self._monthly()
+        payload = {"last_update": SERVER_TIMESTAMP}
+        for coll, table in SYNC_COLLECTIONS:
+            records = self._get_local_dict(table)
+            for rec in records.values(): rec["updated_at"] = SERVER_TIMESTAMP
+            payload[coll] = self._nest_months(records) if monthly and coll == "transactions" else records
+        payload["meta"] = self._local_meta()
+
+        if callback: callback("Pushing: Uploading...")
+        self._request("PUT", "", payload)
 
     def force_pull(self, callback=None):
-        """ดึงข้อมูลจาก Cloud ลงเครื่อง (ทับของเก่า)"""
-        try:
-            if callback: callback("Pulling: Fetching Cloud Data...")
-            cloud_data = self._request("GET", "") or {}
+        """ดึงข้อมูลจาก Cloud ลงเครื่อง (ทับของเก่า)
+        อ่านทีละ Collection แบบ Stream แล้ว Apply ทีละ APPLY_CHUNK รายการ -> หน่วยความจำคงที่ ไม่ขึ้นกับขนาดบัญชี"""
+        with self.sync_lock:
+            try:
+                if callback: callback("Pulling: Fetching Cloud Data...")
+                last_update = self._request("GET", "last_update")
+                cloud_meta = self._request("GET", "meta")
             
-            cloud_cats = self._ensure_dict(cloud_data.get("categories"))
-            cloud_cards = self._ensure_dict(cloud_data.get("cards"))
-            cloud_trans = self._ensure_dict(cloud_data.get("transactions"))
-            cloud_recs = self._ensure_dict(cloud_data.get("recurring"))
-
-            if callback: callback("Pulling: Overwriting Local DB...")
+                if callback: callback("Pulling: Overwriting Local DB...")
             
-            # ปิด Listener ชั่วคราว
-            old_notify = self.db.on_data_changed
-            self.db.on_data_changed = None
+                # ปิด Listener ชั่วคราว
+                old_notify = self.db.on_data_changed
+                self.db.on_data_changed = None
+                # ล้างแล้ว Stream ลงทีละก้อน (แต่ละก้อน commit) -> ดาวน์โหลดไม่ครบ กู้ข้อมูลเดิมทั้งหมดกลับจากสำเนา
+                snap = self.db.snapshot()
             
-            try:
-                # 1. ล้างข้อมูลเก่า
-                self.db.clear_all_transactions()
-                self.db.clear_all_recurring()
-                self.db.clear_all_cards()
-                self.db.clear_all_categories()
+                try:
+                    # 1. ล้างข้อมูลเก่า
+                    self.db.clear_all_transactions()
+                    self.db.clear_all_recurring()
+                    self.db.clear_all_cards()
+                    self.db.clear_all_categories()
+                    self.db.clear_sync_journal()
                 
-                # 2. ลงข้อมูลใหม่ (Cards & Cats ก่อน เพื่อสร้าง Map)
-                self._apply_categories_to_local(cloud_cats)
-                self._apply_cards_to_local(cloud_cards)
-                
-                self._refresh_mappings()
-                
-                # 3. ลง Transaction & Recurring
-                self._apply_transactions_to_local(cloud_trans)
-                self._apply_recurring_to_local(cloud_recs)
-                
-            finally:
-                self.db.on_data_changed = old_notify
+                    # 2. ลงข้อมูลใหม่ (Cards & Cats ก่อน เพื่อสร้าง Map) แล้วตามด้วย Transaction & Recurring
+                    #    Layout รายเดือน: Transaction เฉพาะเดือนล่าสุด เดือนเก่าดึงทีหลังด้วย ensure_month
+                    self._set_loaded(None)
+                    months = self._start_lazy(cloud_meta) if self._note_meta(cloud_meta) else None
+                    mark = self._pull_all(callback, months)
+                    if isinstance(last_update, (int, float)): mark = max(mark or 0, last_update)
+                    self._set_watermark(mark)
+                except Exception:
+                    self.db.restore(snap); snap = None
+                    raise
+                finally:
+                    if snap is not None: snap.close()
+                    self.db.on_data_changed = old_notify
 
-            if callback: callback("Pull Success!", "green")
-        except Exception as e:
-            if callback: callback(f"Error: {e}", "red")
+                if callback: callback("Pull Success!", "green")
+            except Exception as e:
+                if callback: callback(f"Error: {e}", "red")
+
+    def _pull_all(self, callback=None, months=None):
+        # Stream ทีละ Collection ตามลำดับ SYNC_COLLECTIONS -> คืน updated_at สูงสุดที่เห็น
+        # months = Shard ที่ต้องดึง (Layout รายเดือน) / None = ทั้ง Collection
+        mark = None
+        for coll, table in SYNC_COLLECTIONS:
+            done = 0
+            if coll == "transactions" and months is not None:
+                items = self._get_months(months)
+                for uid, rec in self._get_flat_transactions().items(): items[uid] = _newer_tx(items.get(uid), rec)
+                items = items.items()
+            else: items = self._stream(coll)
+            for batch in self._chunked(items):
+                mark = max([mark or 0] + [v["updated_at"] for v in batch.values() if isinstance(v.get("updated_at"), (int, float))])
+                self._apply_to_local(table, batch)
+                done += len(batch)
+                if callback: callback(f"Pulling: {coll} {done}")
+        return mark
+
+    def _chunked(self, items):
+        # (uid, record) -> dict ละไม่เกิน APPLY_CHUNK รายการ (ข้ามค่าที่ไม่ใช่ Record)
+        batch = {}
+        for uid, val in items:
+            if not isinstance(val, dict): continue
+            batch[uid] = val
+            if len(batch) >= APPLY_CHUNK:
+                yield batch
+                batch = {}
+        if batch: yield batch
 
     def compare_data(self):
-        """เปรียบเทียบจำนวนข้อมูล Local vs Cloud"""
+        """เปรียบเทียบ Local vs Cloud จาก Digest (GET meta ครั้งเดียว) -> จำนวน, ตรงกันไหม และเดือนที่ต่างกัน"""
+        labels = (("Transactions", "transactions", "transactions"), ("Cards", "cards", "credit_cards"),
+                  ("Categories", "categories", "categories"), ("Recurring", "recurring", "recurring_expenses"))
         try:
-            cloud_data = self._request("GET", "") or {}
-            
-            c_trans = len(self._ensure_dict(cloud_data.get("transactions")))
-            c_cards = len(self._ensure_dict(cloud_data.get("cards")))
-            c_cats = len(self._ensure_dict(cloud_data.get("categories")))
-            c_recs = len(self._ensure_dict(cloud_data.get("recurring")))
-            
-            l_trans = len(self._get_local_transactions_dict())
-            l_cards = len(self._get_local_cards_dict())
-            l_cats = len(self._get_local_categories_dict())
-            l_recs = len(self._get_local_recurring_dict())
-            
-            return (f"Transactions: Local={l_trans} / Cloud={c_trans}\n"
-                    f"Cards: Local={l_cards} / Cloud={c_cards}\n"
-                    f"Categories: Local={l_cats} / Cloud={c_cats}\n"
-                    f"Recurring: Local={l_recs} / Cloud={c_recs}")
+            cloud_meta = self._request("GET", "meta")
+            if not isinstance(cloud_meta, dict):
+                # Cloud ยังไม่มี meta (ยังไม่เคย Sync ด้วยเวอร์ชันนี้) -> นับจาก Stream แทน
+                lines = []
+                for label, coll, table in labels:
+                    c_count = sum(1 for _ in self._stream(coll))
+                    l_count = self.db.conn.execute(f"SELECT COUNT(*) FROM {table} WHERE uuid IS NOT NULL").fetchone()[0]
+                    lines.append(f"{label}: Local={l_count} / Cloud={c_count}")
+                return "\n".join(lines + ["(No digest on Cloud yet, Sync to create it)"])
+
+            monthly = self._note_meta(cloud_meta)
+            local_meta = self._local_meta()
+            diff = self.diff_meta(cloud_meta, local_meta)
+            lines = []
+            for label, coll, _ in labels:
+                c, l = cloud_meta.get(coll) or {}, local_meta[coll]
+                lines.append(f"{label}: Local={l['count']} / Cloud={c.get('count', 0)}" + (" (differs)" if coll in diff["collections"] else ""))
+            if diff["months"]: lines.append("Months differ: " + ", ".join(diff["months"]))
+            elif not diff["collections"]: lines.append("In sync")
+            pending = self.db.get_outbox_counts()
+            if pending: lines.append("Outbox: " + ", ".join(f"{n} {op}" for op, n in sorted(pending.items())) + " waiting to upload")
+            if monthly:
+                start = json.loads(self.db.get_setting("cloud_months_loaded", "") or "{}").get("from")
+                lines.append("Layout: monthly" + (f" (loaded from {start})" if start else ""))
+            return "\n".join(lines)
         except Exception as e:
             return f"Error Comparing: {e}"
 
+    def _local_meta(self):
+        digest = self.db.get_sync_digest()
+        meta = {coll: digest[table] for coll, table in SYNC_COLLECTIONS}
+        if not self._monthly(): return meta
+        meta["layout"] = LAYOUT_MONTHLY
+        is_loaded = self._loaded_filter()
+        if is_loaded:
+            # เดือนที่ยังไม่ได้ดึงใช้ Digest ล่าสุดของ Cloud แทน แล้วรวมยอดใหม่
+            months = {ym: d for ym, d in (meta["transactions"].get("months") or {}).items() if is_loaded(ym)}
+            cached = json.loads(self.db.get_setting("cloud_months_meta", "") or "{}")
+            months.update({ym: d for ym, d in cached.items() if not is_loaded(ym)})
+            tx = {"count": sum(int(d.get("count") or 0) for d in months.values()),
+                  "hash": f"{sum(int(str(d.get('hash') or '0'), 16) for d in months.values()) % DIGEST_MOD:x}"}
+            if months: tx["months"] = months
+            meta["transactions"] = tx
+        return meta
+
+    def diff_meta(self, cloud_meta, local_meta):
+        """-> {"collections": [ชื่อ Node ที่ต่างกัน], "months": ["YYYY-MM" ของ Transaction ที่ต่างกัน]} (ใช้ Resync เฉพาะเดือนได้)"""
+        cloud_meta = cloud_meta if isinstance(cloud_meta, dict) else {}
+        key = lambda d: (int((d or {}).get("count") or 0), str((d or {}).get("hash") or "0"))
+        colls = [coll for coll, _ in SYNC_COLLECTIONS if key(cloud_meta.get(coll)) != key(local_meta.get(coll))]
+        c_months = (cloud_meta.get("transactions") or {}).get("months") or {}
+        l_months = (local_meta.get("transactions") or {}).get("months") or {}
+        months = sorted(ym for ym in set(c_months) | set(l_months) if key(c_months.get(ym)) != key(l_months.get(ym)))
+        return {"collections": colls, "months": months}
+
+    def sync_needed(self):
+        """เช็คแบบถูกๆ: มีของในเครื่องรอส่ง หรือ Digest บน Cloud ไม่ตรงกับในเครื่อง -> (needed, cloud_meta)"""
+        if self.db.has_sync_changes(): return True, None
+        cloud_meta = self._request("GET", "meta")
+        self._note_meta(cloud_meta)
+        return bool(self.diff_meta(cloud_meta, self._local_meta())["collections"]), cloud_meta
+
     # --- Sync Logic (Auto) ---
     def sync_data(self, callback=None):
         if self.config:
@@ -181,89 +575,307 @@ class CloudManager:
             if callback: callback("No Firebase URL configured")
             return
 
-        def process():
+        threading.Thread(target=self.sync_now, args=(callback,), daemon=True).start()
+
+    def sync_now(self, callback=None):
+        """Sync แบบ Blocking: Delta (เฉพาะที่เปลี่ยน) ถ้ามี Watermark แล้ว ไม่งั้น Full Sync -> คืน True ถ้าสำเร็จ"""
+        with self.sync_lock:
             try:
                 if callback: callback("Syncing...")
-                cloud_data = self._request("GET", "") or {}
-                
-                cloud_cats = self._ensure_dict(cloud_data.get("categories"))
-                cloud_cards = self._ensure_dict(cloud_data.get("cards"))
-                cloud_trans = self._ensure_dict(cloud_data.get("transactions"))
-                cloud_recs = self._ensure_dict(cloud_data.get("recurring"))
-
-                local_cats = self._get_local_categories_dict()
-                local_cards = self._get_local_cards_dict()
-                local_trans = self._get_local_transactions_dict()
-                local_recs = self._get_local_recurring_dict()
-
-                # [FIX] ใช้ฟังก์ชัน _merge_with_priority แทนการรวม Dict ธรรมดา
-                merged_cats = self._merge_with_priority(cloud_cats, local_cats)
-                merged_cards = self._merge_with_priority(cloud_cards, local_cards)
-                merged_trans = self._merge_with_priority(cloud_trans, local_trans)
-                merged_recs = self._merge_with_priority(cloud_recs, local_recs)
-
-                full_payload = {
-                    "categories": merged_cats, "cards": merged_cards,
-                    "transactions": merged_trans, "recurring": merged_recs,
-                    "last_update": time.time()
-                }
-                
-                # 1. Update Cloud (Push ผสม)
-                self._request("PUT", "", full_payload)
-
-                if self.db:
-                    old_notify = self.db.on_data_changed
-                    self.db.on_data_changed = None
-                    try:
-                        # 2. Update Local (Apply ผสมลง DB)
-                        self._apply_categories_to_local(merged_cats)
-                        self._apply_cards_to_local(merged_cards)
-                        self._refresh_mappings()
-                        self._apply_transactions_to_local(merged_trans)
-                        self._apply_recurring_to_local(merged_recs)
-                        
-                        # ลบข้อมูลขยะจริง ๆ ออกจาก DB (Vacuum)
-                        self.db.purge_deleted_data()
-                    finally:
-                        self.db.on_data_changed = old_notify
-
+                progress = (lambda table, done, total: callback(f"Syncing: {table} {done}/{total}")) if callback else None
+                if self._full_sync_due(): self._full_sync(progress)
+                else:
+                    needed, cloud_meta = self.sync_needed()
+                    if needed: self._delta_sync(progress, cloud_meta)
+                self.last_error = None
                 if callback: callback("Sync Complete!")
+                return True
             except Exception as e:
-                import traceback
-                traceback.print_exc()
+                self.last_error = e
+                # Offline ไม่ต้องพิมพ์ Traceback ทุกครั้งที่ Retry
+                if not isinstance(e, requests.RequestException):
+                    import traceback
+                    traceback.print_exc()
                 if callback: callback(f"Error: {str(e)}")
+                return False
+
+    def _full_sync_due(self):
+        if not self.db: return True
+        if self.config and self.config.get("sync_mode", "delta") == "full": return True
+        if not self.db.get_setting("sync_watermark", ""): return True
+        # มีของค้างใน Outbox (เช่นเพิ่งกลับมา Online) -> ส่งแบบ Delta ก่อน, Full Sync ตามรอบถัดไปที่ไม่มีของค้าง
+        if self.db.has_sync_changes(): return False
+        try: last_full = float(self.db.get_setting("sync_last_full", "0"))
+        except: last_full = 0
+        return time.time() - last_full > FULL_SYNC_INTERVAL
+
+    def _purge_tombstones(self):
+        days = float(self._cfg("tombstone_retention_days", TOMBSTONE_RETENTION_DAYS))
+        self.db.purge_synced_tombstones(int((time.time() - days * 86400) * 1000))
+
+    def _set_watermark(self, server_ms, cloud_data=None):
+        # Watermark = เวลา Server (ms) ล่าสุดที่รับรู้แล้ว -> รอบหน้าขอเฉพาะ updated_at >= ค่านี้
+        marks = [server_ms] if isinstance(server_ms, (int, float)) else []
+        for coll, _ in SYNC_COLLECTIONS:
+            for v in self._ensure_dict((cloud_data or {}).get(coll)).values():
+                if isinstance(v, dict) and isinstance(v.get("updated_at"), (int, float)): marks.append(v["updated_at"])
+        if marks: self.db.set_setting("sync_watermark", str(int(max(marks))))
+        self.db.set_setting("sync_last_full", str(time.time()))
+
+    def _sync_months(self, cloud_meta):
+        # Layout รายเดือน: Shard ที่ต้องดึงรอบนี้ = เดือนที่ Digest ต่างจาก Cloud (เดือนที่ยังไม่ได้ดึงไม่นับ)
+        # เครื่องที่ยังไม่มี Transaction เริ่มแบบ Lazy, เดือนที่มีของรอส่งแต่ยังไม่ได้ดึงต้องดึงก่อน (meta เดือนนั้นจะได้ถูก)
+        if self._loaded_filter() is None and not self.db.conn.execute("SELECT 1 FROM transactions LIMIT 1").fetchone():
+            self._start_lazy(cloud_meta)
+        is_loaded = self._loaded_filter()
+        dirty = self.db.get_dirty_months()
+        if is_loaded:
+            self._load_months(ym for ym in dirty if not is_loaded(ym))
+            self._note_meta(cloud_meta)
+        # เดือนที่มีของรอส่ง (รวมเดือนเดิมที่ย้ายออก) ดึงเสมอแม้ Digest ตรง: สองเครื่องแก้แถวเดียวกันตอน Offline ได้ rev เท่ากัน
+        # Digest (uuid, rev) จึงตรงทั้งที่เนื้อหาต่าง ต้องเห็นแถวบน Cloud ก่อนส่งถึงจะ bump rev ตัดสิน Conflict ได้
+        return sorted(set(self.diff_meta(cloud_meta, self._local_meta())["months"]) | dirty)
+
+    def _full_sync(self, progress=None):
+        # ดาวน์โหลดทั้ง Root, รวมกับข้อมูลในเครื่อง แล้ว PUT กลับทั้งหมด (โหมดเดิม ใช้ตอนเริ่มต้น/เป็นระยะ)
+        # Layout รายเดือน: Transaction เฉพาะ Shard ที่ Digest ต่างกัน แล้วเขียนกลับด้วย PATCH แบบ Multi-path แทน PUT ทั้ง Root
+        cloud_meta = self._request("GET", "meta")
+        months = self._sync_months(cloud_meta) if self._note_meta(cloud_meta) else None
+        monthly = months is not None
+        cloud_data = self._fetch_root(months)
+        cloud_data["meta"] = cloud_meta
+        cloud_data["transactions"], where = split_transactions(self._ensure_dict(cloud_data.get("transactions")))
+        journal = self.db.get_sync_journal()
+
+        payload = {"last_update": SERVER_TIMESTAMP}
+        to_apply = {}
+        pushed = []
+        needs_push = False
+        for coll, table in SYNC_COLLECTIONS:
+            cloud_items = self._ensure_dict(cloud_data.get(coll))
+            local_items = self._get_local_dict(table)
+            if monthly and coll == "transactions":
+                # เทียบเฉพาะเดือนที่ดึงมา (เดือนอื่น Digest ตรงกันอยู่แล้ว)
+                local_items = {uid: v for uid, v in local_items.items() if tx_month(v) in months or uid in cloud_items}
+            # [FIX] ใช้ฟังก์ชัน _merge_with_priority แทนการรวม Dict ธรรมดา
+            merged = self._merge_with_priority(cloud_items, local_items)
+            for uid, cv in cloud_items.items():
+                # ถ้าในเครื่องไม่ได้แก้ และ Cloud มีเวอร์ชันใหม่กว่า (rev สูงกว่า) ให้ใช้ของ Cloud
+                if uid in local_items and uid not in journal[table] and isinstance(cv, dict) and int(cv.get("rev") or 0) > local_items[uid]["rev"]:
+                    merged[uid] = cv
+            to_apply[table] = {uid: v for uid, v in merged.items() if not self._same_record(local_items.get(uid), v)}
+            out = {}
+            for uid, v in merged.items():
+                if v is local_items.get(uid) and (uid in journal[table] or not self._same_record(cloud_items.get(uid), v)):
+                    v = dict(v, updated_at=SERVER_TIMESTAMP)
+                    needs_push = True
+                    if uid in journal[table]: pushed.append((table, uid, journal[table][uid]))
+                out[uid] = v
+            payload[coll] = out
+
+        if monthly:
+            # แต่ละเดือนที่ดึงมาเขียนทับทั้ง Shard, ที่อยู่นอกนั้นเขียนราย Record
+            # uuid ที่เจอที่ Shard อื่น -> Marker ย้ายเดือน, ที่ค้างแบบเดิม -> ลบ
+            shards = {ym: {} for ym in months}
+            for uid, v in payload.pop("transactions").items():
+                ym = tx_month(v)
+                if ym in shards: shards[ym][uid] = v
+                else: payload[f"transactions/{ym}/{uid}"] = v
+                for old in where.get(uid, []):
+                    if old == ym: continue
+                    if old: shards[old][uid] = self._move_marker(uid, v, old)
+                    else: payload[f"transactions/{uid}"] = None
+                    needs_push = True
+            for ym, shard in shards.items(): payload[f"transactions/{ym}"] = shard or None
+
+        # 1. Update Local (Apply เฉพาะรายการที่ต่างจากในเครื่อง) -> ในเครื่องตรงกับชุดที่จะส่ง, Digest ใช้เป็น meta ได้
+        self._apply_remote(to_apply, progress)
+        local_meta = self._local_meta()
+
+        # 2. Update Cloud (Push ผสม) เฉพาะเมื่อในเครื่องมีอะไรที่ Cloud ยังไม่มี
+        if needs_push:
+            payload["meta"] = local_meta
+            self._request("PATCH" if monthly else "PUT", "", payload)
+            self.db.clear_sync_journal(pushed)
+        elif self.diff_meta(cloud_data.get("meta"), local_meta)["collections"]:
+            self._request("PATCH", "", {"meta": local_meta})
+        if needs_push:
+            # +1: รายการทั้งหมดที่มี updated_at เท่ากับเวลาของ PUT นี้ คือข้อมูลที่เราเพิ่งเขียนเอง ไม่ต้องดึงกลับมาอีก
+            last_update = self._request("GET", "last_update")
+            self._set_watermark(last_update + 1 if isinstance(last_update, (int, float)) else None)
+        else:
+            self._set_watermark(cloud_data.get("last_update"), cloud_data)
+        self._purge_tombstones()
 
-        threading.Thread(target=process, daemon=True).start()
+    def _delta_sync(self, progress=None, cloud_meta=None):
+        # 1. ดึงเฉพาะรายการที่ updated_at >= Watermark (ต้องตั้ง ".indexOn": "updated_at" ใน Firebase Rules)
+        #    Layout รายเดือน: Transaction ดึงทั้ง Shard เฉพาะเดือนที่ Digest ต่างกัน (ปกติคือเดือนปัจจุบันเดือนเดียว)
+        wm = int(self.db.get_setting("sync_watermark", "0") or 0)
+        new_wm = wm
+        if cloud_meta is None: cloud_meta = self._request("GET", "meta")
+        months = self._sync_months(cloud_meta) if self._note_meta(cloud_meta) else None
+        journal = self.db.get_sync_journal()
+        to_apply = {}
+        resolved = []
+        displaced = {}
+        changes = self._fetch_changes(wm, months)
+        for coll, table in SYNC_COLLECTIONS:
+            remote = changes[coll]
+            local_revs = self.db.get_revs(table, remote.keys())
+            dirty = journal[table]
+            to_apply[table] = {}
+            for uid, val in remote.items():
+                if not isinstance(val, dict): continue
+                upd = val.get("updated_at")
+                if isinstance(upd, (int, float)): new_wm = max(new_wm, int(upd))
+                r_rev = int(val.get("rev") or 0)
+                if uid in dirty:
+                    # Conflict: ลบบน Cloud ชนะ, นอกนั้นของในเครื่องชนะ (กติกาเดียวกับ _merge_with_priority)
+                    if int(val.get("is_deleted", 0)) == 1:
+                        to_apply[table][uid] = val
+                        resolved.append((table, uid, dirty[uid]))
+                    elif r_rev >= dirty[uid]:
+                        self.db.bump_rev(table, uid, r_rev + 1)
+                    if val.get("moved_to"): displaced[uid] = val["moved_to"]  # ของในเครื่องชนะการย้ายเดือน
+                elif local_revs.get(uid) != r_rev or uid not in local_revs:
+                    to_apply[table][uid] = val
+        self._apply_remote(to_apply, progress)
+        self.db.clear_sync_journal(resolved)
+
+        # 2. ส่ง Outbox (รายการที่แก้ในเครื่อง) ตามลำดับ ทีละก้อน
+        #    meta (Digest) ไปกับก้อนสุดท้าย หรือส่งแยกเมื่อบน Cloud ไม่ตรง (เช่นอีกเครื่องเขียนทับตอน Sync พร้อมกัน)
+        if not self._drain_outbox(months, displaced, progress):
+            local_meta = self._local_meta()
+            if not isinstance(cloud_meta, dict) or self.diff_meta(cloud_meta, local_meta)["collections"]:
+                self._request("PATCH", "", {"meta": local_meta})
+
+        self.db.set_setting("sync_watermark", str(new_wm))
+        self._purge_tombstones()
+
+    def _drain_outbox(self, months=None, displaced=None, progress=None):
+        """ส่ง Outbox (sync_journal) ตามลำดับที่แก้ ทีละ OUTBOX_BATCH รายการต่อ PATCH แบบ Multi-path แล้ว Ack ทีละก้อน
+        หลุดกลางทาง / ปิดแอป -> ก้อนที่ส่งแล้วไม่ต้องส่งซ้ำ รอบหน้าส่งต่อจากที่ค้าง -> คืนจำนวนรายการที่ส่ง"""
+        entries = self.db.get_outbox()
+        if not entries: return 0
+        # อ่านค่าปัจจุบันของแถวตอนส่ง (แก้ซ้ำหลายครั้งระหว่าง Offline ส่งครั้งเดียว) แถวที่ถูกแก้ระหว่างส่ง rev จะไม่ตรง -> ค้างไว้รอบหน้า
+        records = {table: self._get_local_dict(table, only_dirty=True) for table in {e[0] for e in entries}}
+        moved = self.db.get_moved_transactions() if months is not None else {}
+        displaced = displaced or {}
+        colls = {table: coll for coll, table in SYNC_COLLECTIONS}
+        sent = 0
+        for i in range(0, len(entries), OUTBOX_BATCH):
+            payload = {}
+            pushed = []
+            for table, uid, rev, _ in entries[i:i + OUTBOX_BATCH]:
+                rec = records[table].get(uid)
+                if rec is None:  # แถวถูกลบออกจากเครื่องไปแล้ว ไม่มีอะไรให้ส่ง
+                    pushed.append((table, uid, rev)); continue
+                rec["updated_at"] = SERVER_TIMESTAMP
+                if months is not None and table == "transactions":
+                    ym = tx_month(rec)
+                    payload[f"transactions/{ym}/{uid}"] = rec
+                    old = moved.get(uid) or displaced.get(uid)
+                    if old and old != ym: payload[f"transactions/{old}/{uid}"] = self._move_marker(uid, rec, old)
+                else: payload[f"{colls[table]}/{uid}"] = rec
+                pushed.append((table, uid, rev))
+            sent += len(pushed)
+            payload["last_update"] = SERVER_TIMESTAMP
+            if i + OUTBOX_BATCH >= len(entries): payload["meta"] = self._local_meta()
+            self._request("PATCH", "", payload)
+            self.db.clear_sync_journal(pushed)
+            if progress: progress("outbox", sent, len(entries))
+        return sent
+
+    def _fetch_root(self, months=None):
+        # months=None -> ทั้ง Root ครั้งเดียว / Layout รายเดือน: ทีละ Node + Shard ที่ระบุ + Record แบบเดิมที่ค้าง
+        if months is None: return self._request("GET", "") or {}
+        data = {path: self._request("GET", path) for path in [coll for coll, _ in SYNC_COLLECTIONS if coll != "transactions"] + ["last_update"]}
+        node = {ym: self._ensure_dict(self._request("GET", f"transactions/{ym}")) for ym in months}
+        node.update(self._get_flat_transactions())
+        data["transactions"] = node
+        return data
+
+    def _fetch_changes(self, wm, months=None):
+        # {coll: {uuid: record}} ที่ updated_at >= wm (Layout รายเดือน: Transaction = ทั้ง Shard ของ months)
+        changes = {coll: self._ensure_dict(self._request("GET", coll, params={"orderBy": '"updated_at"', "startAt": wm}))
+                   for coll, _ in SYNC_COLLECTIONS if coll != "transactions" or months is None}
+        if months is not None: changes["transactions"] = self._get_months(months)
+        return changes
+
+    def _apply_remote(self, to_apply, progress=None):
+        if not self.db or not any(to_apply.values()): return
+        old_notify = self.db.on_data_changed
+        self.db.on_data_changed = None
+        try:
+            self._refresh_mappings()
+            for _, table in SYNC_COLLECTIONS:
+                if to_apply.get(table): self._apply_to_local(table, to_apply[table], progress)
+        finally:
+            self.db.on_data_changed = old_notify
 
     # --- Helpers ---
-    def _get_local_categories_dict(self):
+    def _dirty_filter(self, alias, table, only_dirty):
+        # only_dirty -> เฉพาะแถวที่อยู่ใน sync_journal (แก้ในเครื่องแต่ยังไม่ได้ส่งขึ้น Cloud)
+        if not only_dirty: return ""
+        return f" AND {alias}uuid IN (SELECT uuid FROM sync_journal WHERE tbl = '{table}')"
+
+    def _get_local_categories_dict(self, only_dirty=False):
         c = self.db.conn.cursor()
-        rows = c.execute("SELECT uuid, name, type, keywords, is_deleted FROM categories WHERE uuid IS NOT NULL").fetchall()
+        rows = c.execute("SELECT uuid, name, type, keywords, is_deleted, rev, updated_at FROM categories WHERE uuid IS NOT NULL" + self._dirty_filter("", "categories", only_dirty)).fetchall()
         data = {}
-        for r in rows: data[r[0]] = {"name": r[1], "type": r[2], "keywords": r[3], "is_deleted": r[4], "uuid": r[0]}
+        for r in rows: data[r[0]] = {"name": r[1], "type": r[2], "keywords": r[3], "is_deleted": r[4], "uuid": r[0], "rev": r[5] or 0, "updated_at": r[6] or 0}
         return data
 
-    def _get_local_cards_dict(self):
+    def _get_local_cards_dict(self, only_dirty=False):
         c = self.db.conn.cursor()
-        rows = c.execute("SELECT uuid, name, limit_amt, closing_day, color, is_deleted FROM credit_cards WHERE uuid IS NOT NULL").fetchall()
+        rows = c.execute("SELECT uuid, name, limit_amt, closing_day, color, is_deleted, rev, updated_at FROM credit_cards WHERE uuid IS NOT NULL" + self._dirty_filter("", "credit_cards", only_dirty)).fetchall()
         data = {}
-        for r in rows: data[r[0]] = {"name": r[1], "limit_amt": r[2], "closing_day": r[3], "color": r[4], "is_deleted": r[5], "uuid": r[0]}
+        for r in rows: data[r[0]] = {"name": r[1], "limit_amt": r[2], "closing_day": r[3], "color": r[4], "is_deleted": r[5], "uuid": r[0], "rev": r[6] or 0, "updated_at": r[7] or 0}
         return data
 
-    def _get_local_transactions_dict(self):
+    def _get_local_transactions_dict(self, only_dirty=False):
         c = self.db.conn.cursor()
-        rows = c.execute("SELECT t.uuid, t.type, t.item, t.amount, t.category, t.date, t.is_deleted, c.uuid FROM transactions t LEFT JOIN credit_cards c ON t.payment_id = c.id WHERE t.uuid IS NOT NULL").fetchall()
+        rows = c.execute("SELECT t.uuid, t.type, t.item, t.amount, t.category, t.date, t.is_deleted, c.uuid, t.rev, t.updated_at FROM transactions t LEFT JOIN credit_cards c ON t.payment_id = c.id WHERE t.uuid IS NOT NULL" + self._dirty_filter("t.", "transactions", only_dirty)).fetchall()
         data = {}
-        for r in rows: data[r[0]] = {"type": r[1], "item": r[2], "amount": r[3], "category": r[4], "date": str(r[5]), "is_deleted": r[6], "payment_uuid": r[7], "uuid": r[0]}
+        for r in rows: data[r[0]] = {"type": r[1], "item": r[2], "amount": r[3], "category": r[4], "date": str(r[5]), "is_deleted": r[6], "payment_uuid": r[7], "uuid": r[0], "rev": r[8] or 0, "updated_at": r[9] or 0}
         return data
 
-    def _get_local_recurring_dict(self):
+    def _get_local_recurring_dict(self, only_dirty=False):
         c = self.db.conn.cursor()
-        rows = c.execute("SELECT t.uuid, t.day, t.item, t.amount, t.category, t.auto_pay, t.is_deleted, c.uuid FROM recurring_expenses t LEFT JOIN credit_cards c ON t.payment_id = c.id WHERE t.uuid IS NOT NULL").fetchall()
+        rows = c.execute("SELECT t.uuid, t.day, t.item, t.amount, t.category, t.auto_pay, t.is_deleted, c.uuid, t.rev, t.updated_at FROM recurring_expenses t LEFT JOIN credit_cards c ON t.payment_id = c.id WHERE t.uuid IS NOT NULL" + self._dirty_filter("t.", "recurring_expenses", only_dirty)).fetchall()
         data = {}
-        for r in rows: data[r[0]] = {"day": r[1], "item": r[2], "amount": r[3], "category": r[4], "auto_pay": r[5], "is_deleted": r[6], "payment_uuid": r[7], "uuid": r[0]}
+        for r in rows: data[r[0]] = {"day": r[1], "item": r[2], "amount": r[3], "category": r[4], "auto_pay": r[5], "is_deleted": r[6], "payment_uuid": r[7], "uuid": r[0], "rev": r[8] or 0, "updated_at": r[9] or 0}
         return data
 
+    def _get_local_dict(self, table, only_dirty=False):
+        return {
+            "categories": self._get_local_categories_dict,
+            "credit_cards": self._get_local_cards_dict,
+            "transactions": self._get_local_transactions_dict,
+            "recurring_expenses": self._get_local_recurring_dict,
+        }[table](only_dirty)
+
+    def _apply_to_local(self, table, data_dict, progress=None):
+        # progress(table, done, total) ใช้กับตารางใหญ่ (Transaction / Recurring) ที่ Apply แบบกลุ่ม
+        if table == "transactions": self._apply_transactions_to_local(data_dict, progress)
+        elif table == "recurring_expenses": self._apply_recurring_to_local(data_dict, progress)
+        elif table == "credit_cards":
+            self._apply_cards_to_local(data_dict)
+            self._refresh_mappings()
+        else: self._apply_categories_to_local(data_dict)
+
+    def _same_record(self, a, b):
+        # เทียบข้อมูลโดยไม่สน updated_at (ในเครื่องเก็บเวลาแก้ไขของเครื่อง ส่วน Cloud เป็นเวลา Server)
+        # และค่า None (Firebase ไม่เก็บ null จึงไม่มี key นั้นกลับมา)
+        if a is None or b is None or not isinstance(a, dict) or not isinstance(b, dict): return a is b
+        return ({k: v for k, v in a.items() if k != "updated_at" and v is not None} ==
+                {k: v for k, v in b.items() if k != "updated_at" and v is not None})
+
+    def _rev_of(self, val):
+        # rev/updated_at ของเวอร์ชันจาก Cloud (ข้อมูลจาก Client รุ่นเก่าไม่มีสองฟิลด์นี้ -> 0)
+        upd = val.get('updated_at')
+        return int(val.get('rev') or 0), (upd if isinstance(upd, (int, float)) else 0)
+
     def _refresh_mappings(self):
         self.cat_map = {} 
         self.card_map = {}
@@ -274,14 +886,15 @@ class CloudManager:
         for uid, val in data_dict.items():
             exist_id = self.db.get_id_by_uuid("categories", uid)
             is_del = val.get("is_deleted", 0)
+            rev, upd = self._rev_of(val)
             
             if exist_id:
                 # กรณีมี UUID นี้อยู่แล้ว: อัปเดตข้อมูลตามปกติ
                 if is_del == 1:
-                    self.db.conn.execute("UPDATE categories SET is_deleted=1 WHERE id=?", (exist_id,))
+                    self.db.conn.execute("UPDATE categories SET is_deleted=1, rev=?, updated_at=? WHERE id=?", (rev, upd, exist_id))
                 else:
-                    self.db.conn.execute("UPDATE categories SET name=?, type=?, keywords=?, is_deleted=0 WHERE id=?", 
-                                         (val['name'], val['type'], val.get('keywords', ''), exist_id))
+                    self.db.conn.execute("UPDATE categories SET name=?, type=?, keywords=?, is_deleted=0, rev=?, updated_at=? WHERE id=?", 
+                                         (val['name'], val['type'], val.get('keywords', ''), rev, upd, exist_id))
             else:
                 # กรณีไม่มี UUID นี้: (เช็คก่อนว่ามีชื่อซ้ำไหม)
                 if is_del == 0:
@@ -296,14 +909,14 @@ class CloudManager:
                         # เจอชื่อซ้ำ! ให้ Merge โดยการอัปเดต UUID ของตัวเก่าในเครื่อง ให้ตรงกับ Cloud
                         local_id = collision[0]
                         self.db.conn.execute(
-                            "UPDATE categories SET uuid=?, keywords=?, is_deleted=0 WHERE id=?", 
-                            (uid, val.get('keywords', ''), local_id)
+                            "UPDATE categories SET uuid=?, keywords=?, is_deleted=0, rev=?, updated_at=? WHERE id=?", 
+                            (uid, val.get('keywords', ''), rev, upd, local_id)
                         )
                     else:
                         # ไม่ซ้ำ -> สร้างใหม่ตามปกติ
                         self.db.conn.execute(
-                            "INSERT INTO categories (name, type, keywords, is_deleted, uuid) VALUES (?,?,?,0,?)",
-                            (val['name'], val['type'], val.get('keywords', ''), uid)
+                            "INSERT INTO categories (name, type, keywords, is_deleted, uuid, rev, updated_at) VALUES (?,?,?,0,?,?,?)",
+                            (val['name'], val['type'], val.get('keywords', ''), uid, rev, upd)
                         )
         self.db.conn.commit()
 
@@ -311,13 +924,14 @@ class CloudManager:
         for uid, val in data_dict.items():
             exist_id = self.db.get_id_by_uuid("credit_cards", uid)
             is_del = val.get("is_deleted", 0)
+            rev, upd = self._rev_of(val)
 
             if exist_id:
                 if is_del == 1:
-                    self.db.conn.execute("UPDATE credit_cards SET is_deleted=1 WHERE id=?", (exist_id,))
+                    self.db.conn.execute("UPDATE credit_cards SET is_deleted=1, rev=?, updated_at=? WHERE id=?", (rev, upd, exist_id))
                 else:
-                    self.db.conn.execute("UPDATE credit_cards SET name=?, limit_amt=?, closing_day=?, color=?, is_deleted=0 WHERE id=?",
-                                         (val['name'], val['limit_amt'], val['closing_day'], val['color'], exist_id))
+                    self.db.conn.execute("UPDATE credit_cards SET name=?, limit_amt=?, closing_day=?, color=?, is_deleted=0, rev=?, updated_at=? WHERE id=?",
+                                         (val['name'], val['limit_amt'], val['closing_day'], val['color'], rev, upd, exist_id))
             else:
                 if is_del == 0:
                     # [FIX] ป้องกันบัตรชื่อซ้ำ:
@@ -330,35 +944,181 @@ class CloudManager:
                         # เจอชื่อซ้ำ! Merge เข้าตัวเดิม
                         local_id = collision[0]
                         self.db.conn.execute(
-                            "UPDATE credit_cards SET uuid=?, limit_amt=?, closing_day=?, color=?, is_deleted=0 WHERE id=?",
-                            (uid, val['limit_amt'], val['closing_day'], val['color'], local_id)
+                            "UPDATE credit_cards SET uuid=?, limit_amt=?, closing_day=?, color=?, is_deleted=0, rev=?, updated_at=? WHERE id=?",
+                            (uid, val['limit_amt'], val['closing_day'], val['color'], rev, upd, local_id)
                         )
                     else:
                         # ไม่ซ้ำ -> สร้างใหม่
                         self.db.conn.execute(
-                            "INSERT INTO credit_cards (name, limit_amt, closing_day, color, is_deleted, uuid) VALUES (?,?,?,?,0,?)",
-                            (val['name'], val['limit_amt'], val['closing_day'], val['color'], uid)
+                            "INSERT INTO credit_cards (name, limit_amt, closing_day, color, is_deleted, uuid, rev, updated_at) VALUES (?,?,?,?,0,?,?,?)",
+                            (val['name'], val['limit_amt'], val['closing_day'], val['color'], uid, rev, upd)
                         )
         self.db.conn.commit()
 
-    def _apply_transactions_to_local(self, data_dict):
-        for uid, val in data_dict.items():
-            pid = self.card_map.get(val.get('payment_uuid'))
-            exist_id = self.db.get_id_by_uuid("transactions", uid)
-            if exist_id:
-                if val.get('is_deleted', 0) == 1: self.db.conn.execute("UPDATE transactions SET is_deleted=1 WHERE id=?", (exist_id,))
-                else: self.db.conn.execute("UPDATE transactions SET type=?, item=?, amount=?, category=?, date=?, payment_id=?, is_deleted=0 WHERE id=?", (val['type'], val['item'], val['amount'], val['category'], val['date'], pid, exist_id))
-            else:
-                if val.get('is_deleted', 0) == 0: self.db.conn.execute("INSERT INTO transactions (type, item, amount, category, date, payment_id, is_deleted, uuid) VALUES (?,?,?,?,?,?,0,?)", (val['type'], val['item'], val['amount'], val['category'], val['date'], pid, uid))
-        self.db.conn.commit()
+    def _apply_transactions_to_local(self, data_dict, progress=None):
+        # ym/ymd ใส่มาด้วยเลย Trigger จะได้ไม่ต้อง UPDATE แถวซ้ำ (ถ้ารูปแบบวันที่แปลก Trigger ยังแก้ให้ถูกเอง)
+        cols = ("type", "item", "amount", "category", "date", "payment_id", "ym", "ymd")
+        def to_row(val):
+            d = str(val.get('date'))
+            return (val.get('type'), val.get('item'), float(val.get('amount') or 0), val.get('category'), d, self.card_map.get(val.get('payment_uuid')), d[:7], d[:10])
+        # Marker ย้ายเดือน (Layout รายเดือน): ไม่ได้ของจริงมาด้วย = ย้ายไปเดือนที่เครื่องนี้ยังไม่ได้ดึง
+        # -> ลบสำเนาเก่าที่ยังอยู่เดือนเดิมทิ้ง (ไม่จด Journal) ได้ของจริงกลับมาเมื่อดึงเดือนนั้น
+        markers = [(uid, v["moved_from"], int(v.get("rev") or 0)) for uid, v in data_dict.items() if isinstance(v, dict) and v.get("moved_to")]
+        dropped = 0
+        if markers:
+            data_dict = {uid: v for uid, v in data_dict.items() if not (isinstance(v, dict) and v.get("moved_to"))}
+            dropped = self.db.conn.executemany("""
+                DELETE FROM transactions WHERE uuid = ? AND ym = ? AND COALESCE(rev, 0) <= ?
+                AND uuid NOT IN (SELECT uuid FROM sync_journal WHERE tbl = 'transactions')""", markers).rowcount
+            self.db.conn.commit()
+        return dropped + self._bulk_apply("transactions", cols, to_row, data_dict, progress)
+
+    def _apply_recurring_to_local(self, data_dict, progress=None):
+        cols = ("day", "item", "amount", "category", "payment_id", "auto_pay")
+        to_row = lambda val: (int(val.get('day') or 0), val.get('item'), float(val.get('amount') or 0), val.get('category'), self.card_map.get(val.get('payment_uuid')), int(val.get('auto_pay') or 0))
+        return self._bulk_apply("recurring_expenses", cols, to_row, data_dict, progress)
+
+    def _row_hash(self, is_deleted, rev, upd, row):
+        # ลายนิ้วมือของค่าที่การ Apply จะเขียนลงแถว (แถวที่ถูกลบ สนแค่ rev/updated_at)
+        if is_deleted: return hash((1, rev or 0, upd or 0))
+        return hash((0, rev or 0, upd or 0) + tuple(row))
+
+    def _bulk_apply(self, table, cols, to_row, data_dict, progress=None):
+        """Apply ข้อมูลจาก Cloud แบบกลุ่ม: โหลด uuid -> (id, hash) ใน Query เดียว ข้ามแถวที่ไม่เปลี่ยน
+        ที่เหลือเขียนด้วย executemany ทีละ APPLY_CHUNK แถว (Commit ทุก Chunk ให้ UI อ่านแทรกได้) -> คืนจำนวนแถวที่เขียน"""
+        conn = self.db.conn
+        existing = {}
+        sql = f"SELECT uuid, id, is_deleted, rev, updated_at, {', '.join(cols)} FROM {table} WHERE uuid IS NOT NULL"
+        if len(data_dict) <= APPLY_CHUNK:
+            # ชุดเล็ก (Delta / Stream ทีละ Chunk) -> โหลดเฉพาะ uuid ที่เกี่ยว ไม่ต้องอ่านทั้งตาราง
+            rows = conn.execute(sql + " AND uuid IN (SELECT value FROM json_each(?))", (json.dumps(list(data_dict)),))
+        else:
+            rows = conn.execute(sql)
+        for r in rows:
+            existing[r[0]] = (r[1], self._row_hash(r[2], r[3], r[4], r[5:]))
 
-    def _apply_recurring_to_local(self, data_dict):
+        inserts, updates, deletes = [], [], []
         for uid, val in data_dict.items():
-            pid = self.card_map.get(val.get('payment_uuid'))
-            exist_id = self.db.get_id_by_uuid("recurring_expenses", uid)
-            if exist_id:
-                if val.get('is_deleted', 0) == 1: self.db.conn.execute("UPDATE recurring_expenses SET is_deleted=1 WHERE id=?", (exist_id,))
-                else: self.db.conn.execute("UPDATE recurring_expenses SET day=?, item=?, amount=?, category=?, payment_id=?, auto_pay=?, is_deleted=0 WHERE id=?", (val['day'], val['item'], val['amount'], val['category'], pid, val.get('auto_pay',0), exist_id))
-            else:
-                if val.get('is_deleted', 0) == 0: self.db.conn.execute("INSERT INTO recurring_expenses (day, item, amount, category, payment_id, auto_pay, is_deleted, uuid) VALUES (?,?,?,?,?,?,0,?)", (val['day'], val['item'], val['amount'], val['category'], pid, val.get('auto_pay',0), uid))
-        self.db.conn.commit()
\ No newline at end of file
+            if not isinstance(val, dict): continue
+            rev, upd = self._rev_of(val)
+            is_del = val.get('is_deleted', 0) == 1
+            row = None if is_del else to_row(val)
+            exist = existing.get(uid)
+            if exist:
+                if exist[1] == self._row_hash(is_del, rev, upd, row): continue
+                if is_del: deletes.append((rev, upd, exist[0]))
+                else: updates.append(row + (rev, upd, exist[0]))
+            elif not is_del:
+                inserts.append(row + (uid, rev, upd))
+
+        batches = [
+            (f"UPDATE {table} SET is_deleted=1, rev=?, updated_at=? WHERE id=?", deletes),
+            (f"UPDATE {table} SET {', '.join(c + '=?' for c in cols)}, is_deleted=0, rev=?, updated_at=? WHERE id=?", updates),
+            (f"INSERT INTO {table} ({', '.join(cols)}, is_deleted, uuid, rev, updated_at) VALUES ({', '.join('?' * len(cols))}, 0, ?, ?, ?)", inserts),
+        ]
+        total = len(inserts) + len(updates) + len(deletes)
+        done = 0
+        for sql, rows in batches:
+            for i in range(0, len(rows), APPLY_CHUNK):
+                chunk = rows[i:i + APPLY_CHUNK]
+                conn.executemany(sql, chunk)
+                conn.commit()
+                done += len(chunk)
+                if progress: progress(table, done, total)
+        return total
+
+class SyncWorker:
+    # Thread เดียวสำหรับ Auto Sync ทั้งแอป (แทนการเปิด Thread ใหม่ทุกครั้งที่ข้อมูลเปลี่ยน)
+    # - คำขอที่เข้ามาติดๆ กันถูกรวมเป็นรอบเดียว (Debounce) แต่รอไม่เกิน max_wait
+    # - Sync ทีละรอบเท่านั้น คำขอที่เข้ามาระหว่าง Sync จะรอรอบถัดไป
+    # - Sync ไม่สำเร็จ (Offline) -> ลองใหม่แบบ Exponential Backoff จนกว่าจะสำเร็จ
+    def __init__(self, cloud, on_status=None, debounce=SYNC_DEBOUNCE, max_wait=SYNC_MAX_WAIT):
+        self.cloud = cloud
+        self.on_status = on_status  # on_status(stats: dict) เรียกจาก Thread ของ Worker
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.state = "idle"  # idle / waiting / syncing / offline / error
+        self.batch = 0       # จำนวนคำขอที่รวมไว้ในรอบปัจจุบันแต่ยังไม่ได้ Sync
+        self.requests = 0
+        self.runs = 0
+        self.failures = 0
+        self.last_duration = None
+        self.last_sync = None
+        self.retry_in = 0
+
+    def request(self, callback=None):
+        with self.lock:
+            self.requests += 1
+            self.queue.put(callback)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._loop, daemon=True)
+                self.thread.start()
+        self._report()
+
+    def _take(self, callbacks, timeout=None):
+        # ดึงคำขอจาก Queue เข้ารอบปัจจุบัน -> คืน False ถ้าหมดเวลาโดยไม่มีคำขอใหม่
+        try: cb = self.queue.get(timeout=timeout) if timeout is None or timeout > 0 else self.queue.get_nowait()
+        except queue.Empty: return False
+        self.batch += 1
+        if cb: callbacks.append(cb)
+        return True
+
+    def _loop(self):
+        while True:
+            callbacks = []
+            self._take(callbacks)
+            self._set_state("waiting")
+            start = last = time.monotonic()
+            while self._take(callbacks, min(last + self.debounce, start + self.max_wait) - time.monotonic()):
+                last = time.monotonic()
+
+            delay = SYNC_RETRY_MIN
+            while True:
+                while self._take(callbacks, 0): pass
+                if self.cloud.config:
+                    self.cloud.base_url = self.cloud.config.get("firebase_url", "").rstrip('/')
+                    self.cloud.secret_key = self.cloud.config.get("cloud_key", "")
+                if not self.cloud.base_url or not self.cloud.db:
+                    for cb in callbacks: cb("No Firebase URL configured")
+                    self.batch = 0; break
+
+                self._set_state("syncing")
+                t0 = time.perf_counter()
+                ok = self.cloud.sync_now(callback=lambda msg: [cb(msg) for cb in callbacks] if callbacks else None)
+                self.last_duration = time.perf_counter() - t0
+                self.runs += 1
+                if ok:
+                    self.batch, self.retry_in, self.last_sync = 0, 0, time.time()
+                    break
+                self.failures += 1
+                self.retry_in = delay
+                self._set_state("offline" if isinstance(self.cloud.last_error, requests.RequestException) else "error")
+                time.sleep(delay)
+                delay = min(delay * 2, SYNC_RETRY_MAX)
+            self._set_state("idle")
+
+    def _set_state(self, state):
+        self.state = state
+        self._report()
+
+    def _report(self):
+        if not self.on_status: return
+        try: self.on_status(self.get_stats())
+        except Exception as e: print(f"Sync Status Error: {e}")
+
+    def get_stats(self):
+        err = self.cloud.last_error
+        try: pending = sum(self.cloud.db.get_outbox_counts().values()) if self.cloud.db else 0
+        except: pending = 0
+        return {
+            "state": self.state,
+            "queue": self.queue.qsize() + self.batch,
+            "pending": pending,
+            "requests": self.requests, "runs": self.runs, "failures": self.failures,
+            "last_duration": self.last_duration, "last_sync": self.last_sync,
+            "retry_in": self.retry_in if self.state in ("offline", "error") else 0,
+            "last_error": str(err) if err else None,
+        }
@@ -0,0 +1,258 @@
+# cloud_async.py
+# ///////////////////////////////////////////////////////////////
+# Cloud Engine แบบ asyncio: รับส่ง categories / cards / transactions / recurring พร้อมกัน
+# และแบ่ง Transaction จำนวนมากตามช่วงเดือนยิงขนานกัน (Layout รายเดือน: ยิงทีละ Shard ขนานกัน)
+# - HTTP ใช้ requests Session เดียวกับ CloudManager รันใน Thread pool (asyncio.to_thread) เพราะไม่มี aiohttp
+# - การเขียน SQLite ทำใน Thread ที่เรียกเท่านั้น ทีละขั้น (Cards ก่อน Transaction เพื่อ Map payment_uuid)
+# - callback(msg) แบบเดิม: ข้อความรวมสถานะราย Collection หลายบรรทัด
+# ///////////////////////////////////////////////////////////////
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cloud import CloudManager, SYNC_COLLECTIONS, SERVER_TIMESTAMP, APPLY_CHUNK, HTTP_POOL_SIZE, MONTH_KEY, _newer_tx
+
+CLOUD_PARALLEL = HTTP_POOL_SIZE  # Request พร้อมกันสูงสุด
+MONTH_SHARD_MIN = 2000           # Transaction น้อยกว่านี้ส่ง/ดึงก้อนเดียว ไม่ต้องแบ่งตามช่วงเดือน
+
+class _Progress:
+    # รวมสถานะของแต่ละ Collection เป็นข้อความเดียว (อัปเดตหน้าจอไม่เกิน ~10 ครั้ง/วินาที)
+    def __init__(self, callback, title):
+        self.callback = callback
+        self.title = title
+        self.parts = {coll: "..." for coll, _ in SYNC_COLLECTIONS}
+        self.last = 0
+
+    def set(self, coll, text, force=False):
+        self.parts[coll] = text
+        now = time.monotonic()
+        if not self.callback or (not force and now - self.last < 0.1): return
+        self.last = now
+        self.callback(self.title + "\n" + "\n".join(f"{c}: {t}" for c, t in self.parts.items()))
+
+class AsyncCloudManager(CloudManager):
+    def _run(self, coro):
+        try: asyncio.get_running_loop()
+        except RuntimeError: return asyncio.run(coro)
+        # ถูกเรียกจากใน Event loop อื่น -> รันใน Thread แยก
+        with ThreadPoolExecutor(1) as ex: return ex.submit(asyncio.run, coro).result()
+
+    async def _call(self, sem, method, path, data=None, params=None):
+        async with sem:
+            return await asyncio.to_thread(self._request, method, path, data, params)
+
+    def _shard_ranges(self, meta):
+        # แบ่งเดือนที่มี Transaction (จาก meta ของ Digest) เป็นช่วงติดกันไม่เกิน CLOUD_PARALLEL ช่วง จำนวนแถวใกล้เคียงกัน
+        # -> [(ym แรก, ym สุดท้าย)] หรือ None ถ้าน้อยเกินกว่าจะคุ้มแบ่ง
+        tx = (meta or {}).get("transactions") if isinstance(meta, dict) else None
+        months = (tx or {}).get("months")
+        total = int((tx or {}).get("count") or 0)
+        if not isinstance(months, dict) or total < MONTH_SHARD_MIN: return None
+        ranges, start, acc = [], None, 0
+        for ym in sorted(months):
+            start = start or ym
+            acc += int((months[ym] or {}).get("count") or 0)
+            if acc >= total * (len(ranges) + 1) / CLOUD_PARALLEL:
+                ranges.append((start, ym)); start = None
+        if start: ranges.append((start, max(months)))
+        return ranges
+
+    # --- Layout รายเดือน: ดึงหลาย Shard พร้อมกัน ---
+    async def _shards(self, sem, months, on_done=None):
+        # -> {ym: {uuid: record}}
+        async def one(ym):
+            data = self._ensure_dict(await self._call(sem, "GET", f"transactions/{ym}"))
+            if on_done: on_done(ym, data)
+            return data
+        return dict(zip(months, await asyncio.gather(*(one(ym) for ym in months))))
+
+    async def _flat_records(self, sem):
+        # Record แบบเดิมที่ค้างอยู่ (ดู CloudManager._get_flat_transactions)
+        keys = [k for k in self._ensure_dict(await self._call(sem, "GET", "transactions", params={"shallow": "true"})) if not MONTH_KEY.match(k)]
+        recs = await asyncio.gather(*(self._call(sem, "GET", f"transactions/{k}") for k in keys))
+        return {k: r for k, r in zip(keys, recs) if isinstance(r, dict)}
+
+    def _get_months(self, months):
+        async def run():
+            data = {}
+            for shard in (await self._shards(asyncio.Semaphore(CLOUD_PARALLEL), list(months))).values():
+                for uid, rec in shard.items():
+                    if isinstance(rec, dict): data[uid] = _newer_tx(data.get(uid), rec)
+            return data
+        return self._run(run())
+
+    # --- Sync (Delta / Full): ดึงทุก Collection พร้อมกัน ---
+    def _fetch_changes(self, wm, months=None):
+        async def run():
+            sem = asyncio.Semaphore(CLOUD_PARALLEL)
+            params = {"orderBy": '"updated_at"', "startAt": wm}
+            colls = [coll for coll, _ in SYNC_COLLECTIONS if coll != "transactions" or months is None]
+            results = await asyncio.gather(self._shards(sem, months or []), *(self._call(sem, "GET", coll, params=params) for coll in colls))
+            changes = {coll: self._ensure_dict(r) for coll, r in zip(colls, results[1:])}
+            if months is not None:
+                changes["transactions"] = {}
+                for shard in results[0].values():
+                    for uid, rec in shard.items():
+                        if isinstance(rec, dict): changes["transactions"][uid] = _newer_tx(changes["transactions"].get(uid), rec)
+            return changes
+        return self._run(run())
+
+    def _fetch_root(self, months=None):
+        # Full Sync ต้องเห็น Tombstone ทุกตัว จึงไม่แบ่งตามช่วงเดือนแบบ Force Pull (meta นับเฉพาะแถวที่ยังไม่ถูกลบ)
+        # Layout รายเดือน: เฉพาะ Shard ที่ระบุ + Record แบบเดิมที่ค้าง (รูปเดียวกับ Node transactions)
+        async def run():
+            sem = asyncio.Semaphore(CLOUD_PARALLEL)
+            paths = [coll for coll, _ in SYNC_COLLECTIONS if coll != "transactions" or months is None] + ["meta", "last_update"]
+            results = await asyncio.gather(*(self._call(sem, "GET", path) for path in paths),
+                                           self._shards(sem, months or []), self._flat_records(sem) if months is not None else asyncio.sleep(0))
+            data = {path: r for path, r in zip(paths, results) if r is not None}
+            if months is not None: data["transactions"] = dict(results[-2], **results[-1])
+            return data
+        return self._run(run())
+
+    # --- Force Pull: ดาวน์โหลดพร้อมกัน, Apply ตามลำดับที่ต้องการ ---
+    def _pull_all(self, callback=None, months=None):
+        return self._run(self._pull_all_async(callback, months))
+
+    async def _pull_all_async(self, callback, months):
+        sem = asyncio.Semaphore(CLOUD_PARALLEL)
+        board = _Progress(callback, "Pulling")
+        mark = 0
+
+        def apply(table, data):
+            nonlocal mark
+            for batch in self._chunked(data.items()):
+                mark = max([mark] + [v["updated_at"] for v in batch.values() if isinstance(v.get("updated_at"), (int, float))])
+                self._apply_to_local(table, batch)
+
+        # meta ใช้แบ่งช่วงเดือนเฉพาะ Layout เดิม (months=None) -> ยิงพร้อม Collection อื่นเฉพาะตอนที่จะใช้
+        meta_task = asyncio.create_task(self._call(sem, "GET", "meta")) if months is None else None
+        tasks = {coll: asyncio.create_task(self._call(sem, "GET", coll)) for coll in ("categories", "cards", "recurring")}
+        for coll, table in (("categories", "categories"), ("cards", "credit_cards")):
+            data = self._ensure_dict(await tasks[coll])
+            apply(table, data)
+            board.set(coll, f"{len(data)} done", force=True)
+
+        if months is not None: await self._pull_shards(sem, board, months, apply)
+        elif not await self._pull_ranges(sem, board, await meta_task, apply):
+            board.set("transactions", "downloading", force=True)
+            for batch in self._chunked(self._stream("transactions")):
+                apply("transactions", batch)
+        board.set("transactions", "done", force=True)
+
+        data = self._ensure_dict(await tasks["recurring"])
+        apply("recurring_expenses", data)
+        board.set("recurring", f"{len(data)} done", force=True)
+        return mark or None
+
+    async def _pull_shards(self, sem, board, months, apply):
+        # Layout รายเดือน: Shard มีอยู่แล้ว ยิงทีละเดือนพร้อมกัน (ไม่ต้องใช้ Index "date") + Record แบบเดิมที่ค้าง
+        flat = asyncio.create_task(self._flat_records(sem))
+        done = 0
+
+        def on_shard(ym, data):
+            nonlocal done
+            done += 1
+            board.set("transactions", f"{done}/{len(months)} months")
+
+        data = {}
+        for shard in list((await self._shards(sem, months, on_shard)).values()) + [await flat]:
+            for uid, rec in shard.items():
+                if isinstance(rec, dict): data[uid] = _newer_tx(data.get(uid), rec)
+        apply("transactions", data)
+
+    async def _pull_ranges(self, sem, board, meta, apply):
+        # Layout เดิม: แบ่งตามช่วงเดือนด้วย Query -> False ถ้าไม่คุ้มแบ่ง / ไม่สำเร็จ (ให้ดึงทั้ง Collection แทน)
+        ranges = self._shard_ranges(meta)
+        if not ranges: return False
+        expected = int((meta.get("transactions") or {}).get("count") or 0)
+        live, done = 0, 0
+        shards = [asyncio.create_task(self._get_range(sem, *r)) for r in ranges]
+        try:
+            for fut in asyncio.as_completed(shards):
+                data = await fut
+                apply("transactions", data)
+                live += sum(1 for v in data.values() if isinstance(v, dict) and int(v.get("is_deleted") or 0) == 0)
+                done += 1
+                board.set("transactions", f"{done}/{len(ranges)} parts")
+        except Exception as e:
+            # เช่น Rules ยังไม่มี .indexOn "date" (Firebase ตอบ 400) -> ใช้วิธีดึงทั้ง Collection แทน
+            print(f"Shard pull failed: {e}")
+            for t in shards: t.cancel()
+            return False
+        # meta ไม่ตรงกับข้อมูลจริง (เช่นวันที่รูปแบบแปลก / เครื่องอื่นเขียนระหว่างนี้) -> ดึงทั้ง Collection อีกรอบ
+        return live == expected
+
+    async def _get_range(self, sem, first, last):
+        # Shard ตามช่วงเดือนด้วย orderBy="date" (Firebase Rules ต้องมี ".indexOn": ["updated_at", "date"] ที่ transactions)
+        params = {"orderBy": '"date"', "startAt": json.dumps(first), "endAt": json.dumps(last + "\uf8ff")}
+        return self._ensure_dict(await self._call(sem, "GET", "transactions", params=params))
+
+    # --- Force Push: ส่งแต่ละ Collection พร้อมกัน, Transaction แบ่งรายเดือน ---
+    def _push_all(self, callback=None):
+        return self._run(self._push_all_async(callback))
+
+    async def _push_all_async(self, callback):
+        sem = asyncio.Semaphore(CLOUD_PARALLEL)
+        board = _Progress(callback, "Pushing")
+
+        async def put(coll, records):
+            await self._call(sem, "PUT", coll, records)
+            board.set(coll, f"{len(records)} done", force=True)
+
+        meta = self._local_meta()
+        monthly = self._monthly()
+        jobs = []
+        for coll, table in SYNC_COLLECTIONS:
+            records = self._get_local_dict(table)
+            for rec in records.values(): rec["updated_at"] = SERVER_TIMESTAMP
+            ranges = self._shard_ranges(meta) if coll == "transactions" and not monthly else None
+            if monthly and coll == "transactions": jobs.append(self._push_shards(sem, board, records))
+            elif ranges: jobs.append(self._push_ranges(sem, board, records, ranges))
+            else: jobs.append(put(coll, records))
+        await asyncio.gather(*jobs)
+        # เขียน meta + last_update หลังสุด: last_update มากกว่าเวลาของทุก Shard -> Watermark (+1) ข้ามของที่เพิ่งส่งเอง
+        await self._call(sem, "PATCH", "", {"meta": meta, "last_update": SERVER_TIMESTAMP})
+
+    async def _push_ranges(self, sem, board, records, ranges):
+        # แทนที่ทั้ง Collection โดยไม่ PUT ก้อนใหญ่: PATCH ตามช่วงเดือนพร้อมกัน + ลบ uuid ที่มีบน Cloud แต่ไม่มีในเครื่อง
+        cloud_keys = self._ensure_dict(await self._call(sem, "GET", "transactions", params={"shallow": "true"}))
+        parts = [{} for _ in ranges]
+        for uid, rec in records.items():
+            ym = str(rec.get("date"))[:7]
+            parts[next((i for i, (_, last) in enumerate(ranges) if ym <= last), len(ranges) - 1)][uid] = rec
+        stale = [uid for uid in cloud_keys if uid not in records]
+        for i in range(0, len(stale), APPLY_CHUNK): parts.append({uid: None for uid in stale[i:i + APPLY_CHUNK]})
+        done = 0
+
+        async def patch(part):
+            nonlocal done
+            await self._call(sem, "PATCH", "transactions", part)
+            done += 1
+            board.set("transactions", f"{done}/{len(parts)} parts")
+
+        await asyncio.gather(*(patch(part) for part in parts if part))
+        board.set("transactions", f"{len(records)} done", force=True)
+
+    async def _push_shards(self, sem, board, records):
+        # Layout รายเดือน: PUT ทีละ Shard พร้อมกัน + ลบ Shard / Record แบบเดิมที่มีบน Cloud แต่ไม่มีในเครื่อง
+        shards = self._nest_months(records)
+        cloud_keys = self._ensure_dict(await self._call(sem, "GET", "transactions", params={"shallow": "true"}))
+        stale = {k: None for k in cloud_keys if k not in shards}
+        done = 0
+
+        async def put(ym, shard):
+            nonlocal done
+            await self._call(sem, "PUT", f"transactions/{ym}", shard)
+            done += 1
+            board.set("transactions", f"{done}/{len(shards)} months")
+
+        await asyncio.gather(*(put(ym, shard) for ym, shard in shards.items()))
+        if stale: await self._call(sem, "PATCH", "transactions", stale)
+        board.set("transactions", f"{len(records)} done", force=True)
+
+def create_cloud_manager(db, config):
+    # config["cloud_engine"]: "sync" (ค่าเริ่มต้น, CloudManager เดิม ทีละ Request) หรือ "async" (เปิดใช้เอง)
+    engine = (config or {}).get("cloud_engine", "sync")
+    return (AsyncCloudManager if engine == "async" else CloudManager)(db, config)
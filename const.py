@@ -17,6 +17,11 @@ COLOR_ALERT = "#D32F2F"
 # --- CONFIG CONSTANTS ---
 CONFIG_FILE = "tracker_config.json"
 DEFAULT_DB_NAME = "modern_money.db"
+SEARCH_PAGE_SIZE = 50
+TRANS_PAGE_SIZE = 40
+WATCH_MIN_INTERVAL = 0.5  # วินาที (ตัวเฝ้าดู DB: ช่วงถี่สุดหลังพบการเปลี่ยนแปลง)
+WATCH_MAX_INTERVAL = 8.0  # วินาที (ช่วงห่างสุดตอน idle)
+VISUALIZER_FPS = 20       # ครั้ง/วินาที สูงสุดที่ Visualizer ตอนอัดเสียงส่ง Update ไปที่ UI
 
 # --- TRANSLATIONS ---
 TRANSLATIONS = {
@@ -45,6 +50,8 @@ TRANSLATIONS = {
         "cloud_config": "Cloud Configuration", "json_key": "JSON Key File", "sheet_name": "Sheet Name",
         "sync_actions": "Sync Actions", "status": "Status", "btn_check": "Check Connection",
         "btn_compare": "Compare Data", "btn_pull": "Pull from Cloud (Overwrite Local)", "btn_push": "Push to Cloud (Overwrite Cloud)",
+        "btn_layout": "Store Transactions by Month", "confirm_layout": "Move Cloud transactions to a monthly layout? Update the app on every device first.",
+        "async_engine": "Parallel Sync (Experimental, applies after restart)",
         "msg_lib_missing": "Libraries 'gspread' or 'oauth2client' missing!",
         "msg_success": "Success", "msg_error": "Error", "msg_processing": "Processing...",
         "confirm_action": "Confirm Action", "confirm_push": "Overwrite Cloud data with Local data?", "confirm_pull": "Overwrite Local data with Cloud data?",
@@ -57,7 +64,8 @@ TRANSLATIONS = {
         "simple_mode": "Simple",
         "full_mode": "Full Dashboard",
         "no_trans_today": "No transactions today",
-        "press_mic": "Press buttons below to record"
+        "press_mic": "Press buttons below to record",
+        "load_more": "Load more"
     },
     "th": {
         "app_title": "Money Tracker",
@@ -84,6 +92,8 @@ TRANSLATIONS = {
         "cloud_config": "ตั้งค่าการเชื่อมต่อ ", "json_key": "ไฟล์กุญแจ (JSON Key)",
         "sync_actions": "คำสั่งการเชื่อมต่อ", "status": "สถานะ", "btn_check": "ตรวจสอบการเชื่อมต่อ",
         "btn_compare": "เปรียบเทียบข้อมูล", "btn_pull": "ดึงจาก Cloud ลงเครื่อง (ทับข้อมูลเก่า)", "btn_push": "ส่งจากเครื่องขึ้น Cloud (ทับข้อมูลบน Cloud)",
+        "btn_layout": "จัดเก็บรายการบน Cloud แยกรายเดือน", "confirm_layout": "ย้ายรายการบน Cloud ไปเก็บแยกรายเดือน? (อัปเดตแอปทุกเครื่องก่อน)",
+        "async_engine": "Sync แบบขนาน (ทดลอง, มีผลหลังเปิดแอปใหม่)",
         "msg_lib_missing": "ไม่พบไลบรารี gspread หรือ oauth2client",
         "msg_success": "สำเร็จ", "msg_error": "เกิดข้อผิดพลาด", "msg_processing": "กำลังดำเนินการ...",
         "confirm_action": "ยืนยันการทำรายการ", "confirm_push": "คุณต้องการส่งข้อมูลขึ้น Cloud (ทับข้อมูลบน Cloud) ใช่หรือไม่?", "confirm_pull": "คุณต้องการดึงข้อมูลจาก Cloud (ทับข้อมูลในเครื่อง) ใช่หรือไม่?",
@@ -96,6 +106,7 @@ TRANSLATIONS = {
         "simple_mode": "Simple (จดไว)",
         "full_mode": "Full Dashboard",
         "no_trans_today": "ยังไม่มีรายการวันนี้",
-        "press_mic": "กดปุ่มด้านล่างเพื่อเริ่มบันทึก"
+        "press_mic": "กดปุ่มด้านล่างเพื่อเริ่มบันทึก",
+        "load_more": "โหลดเพิ่ม"
     }
 }
\ No newline at end of file
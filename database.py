@@ -1,10 +1,34 @@
 # database.py
 import sqlite3
+import threading
 import uuid
+import re
 import calendar
 from datetime import datetime, timedelta
 from utils import parse_db_date
 
+# คอลัมน์ข้อมูลของแต่ละตารางที่ Sync (การแก้คอลัมน์เหล่านี้ในเครื่อง = ต้องส่งขึ้น Cloud)
+SYNC_COLUMNS = {
+    "transactions": "type, item, amount, category, date, payment_id, is_deleted",
+    "recurring_expenses": "day, item, amount, category, payment_id, auto_pay, is_deleted",
+    "categories": "name, type, keywords, is_deleted",
+    "credit_cards": "name, limit_amt, closing_day, color, is_deleted",
+}
+
+# Digest ของข้อมูลที่ Sync: ต่อแถว h = x*x mod P โดย x = (เลขจาก 10 ตัวแรกของ uuid + rev * 40503) mod P
+# ผลรวมของ h (mod DIGEST_MOD) ต่อตาราง/เดือน -> เทียบกับ Cloud ได้โดยไม่ต้องดาวน์โหลดข้อมูล (คำนวณด้วย SQL ล้วน Trigger จึงใช้ได้กับทุก Writer)
+DIGEST_PRIME = 2147483647
+DIGEST_MOD = 1 << 60
+
+def _digest_sql(row):
+    hexval = lambda pos: f"(instr('0123456789abcdef', lower(substr({row}.uuid, {pos}, 1))) - 1)"
+    uid_num = " + ".join(f"{hexval(pos)} * {16 ** k}" for k, pos in enumerate((11, 10, 8, 7, 6, 5, 4, 3, 2, 1)))
+    x = f"(({uid_num}) + COALESCE({row}.rev, 0) * 40503) % {DIGEST_PRIME}"
+    return f"(({x}) * ({x}) % {DIGEST_PRIME})"
+
+# ตารางที่ poll_changes() เฝ้าดู (settings ไม่รวม เพราะ Watermark ของยอดยกมาเขียนทุกครั้งที่ refresh)
+WATCHED_TABLES = ("transactions", "recurring_expenses", "credit_cards", "categories")
+
 class DatabaseManager:
     def __init__(self, db_path):
         self.db_path = db_path
@@ -12,7 +36,19 @@ class DatabaseManager:
         self.on_data_changed = None
         self.uuid_fixed = False
 
+        # ตัวนับการทำงานของ check_and_rollover (ใช้ตรวจว่า refresh ที่ไม่มีอะไรเปลี่ยนไม่ต้องคำนวณซ้ำ)
+        self.rollover_runs = 0
+        self.rollover_skips = 0
+        self.has_fts = False
+
+        # สำหรับ poll_changes(): เวอร์ชันของแต่ละตารางที่ UI รับรู้แล้ว + PRAGMA data_version ล่าสุด
+        # mark_changes_seen (Thread ที่เขียน) กับ poll_changes (sync_loop) อ่าน-เทียบ-เขียนสองค่านี้ -> ต้องถือ Lock
+        self.seen_versions = {}
+        self.last_data_version = None
+        self._changes_lock = threading.Lock()
+
     def _notify(self):
+        self.mark_changes_seen()
         if self.on_data_changed:
             try: self.on_data_changed()
             except: pass
@@ -26,6 +62,7 @@ class DatabaseManager:
         self.migrate_db()
         self.cleanup_duplicate_recurring()
         self.add_defaults()
+        self.mark_changes_seen()
 
     def create_tables(self):
         c = self.conn.cursor()
@@ -34,6 +71,10 @@ class DatabaseManager:
         c.execute('''CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)''')
         c.execute('''CREATE TABLE IF NOT EXISTS recurring_expenses (id INTEGER PRIMARY KEY, day INTEGER, item TEXT, amount REAL, category TEXT, payment_id INTEGER, auto_pay INTEGER, is_deleted INTEGER DEFAULT 0, uuid TEXT UNIQUE)''')
         c.execute('''CREATE TABLE IF NOT EXISTS credit_cards (id INTEGER PRIMARY KEY, name TEXT, limit_amt REAL, closing_day INTEGER, color TEXT, is_deleted INTEGER DEFAULT 0, uuid TEXT UNIQUE)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS sync_journal (tbl TEXT, uuid TEXT, rev INTEGER, ym TEXT, seq INTEGER, op TEXT, PRIMARY KEY (tbl, uuid))''')
+        c.execute('''CREATE TABLE IF NOT EXISTS change_log (tbl TEXT PRIMARY KEY, version INTEGER DEFAULT 0)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS sync_digest (tbl TEXT, ym TEXT, cnt INTEGER DEFAULT 0, hash INTEGER DEFAULT 0, PRIMARY KEY (tbl, ym))''')
+        c.execute('''CREATE TABLE IF NOT EXISTS monthly_totals (ym TEXT, payment_id INTEGER, type TEXT, total REAL DEFAULT 0, tx_count INTEGER DEFAULT 0, PRIMARY KEY (ym, payment_id, type))''')
         self.conn.commit()
 
     def migrate_db(self):
@@ -41,10 +82,10 @@ class DatabaseManager:
         c = self.conn.cursor()
         
         tables = {
-            "transactions": ["is_deleted INTEGER DEFAULT 0", "payment_id INTEGER DEFAULT NULL", "uuid TEXT"],
-            "recurring_expenses": ["is_deleted INTEGER DEFAULT 0", "payment_id INTEGER DEFAULT NULL", "auto_pay INTEGER DEFAULT 0", "uuid TEXT"],
-            "categories": ["is_deleted INTEGER DEFAULT 0", "uuid TEXT"],
-            "credit_cards": ["is_deleted INTEGER DEFAULT 0", "uuid TEXT"]
+            "transactions": ["is_deleted INTEGER DEFAULT 0", "payment_id INTEGER DEFAULT NULL", "uuid TEXT", "ym TEXT", "ymd TEXT", "rev INTEGER DEFAULT 0", "updated_at INTEGER"],
+            "recurring_expenses": ["is_deleted INTEGER DEFAULT 0", "payment_id INTEGER DEFAULT NULL", "auto_pay INTEGER DEFAULT 0", "uuid TEXT", "rev INTEGER DEFAULT 0", "updated_at INTEGER"],
+            "categories": ["is_deleted INTEGER DEFAULT 0", "uuid TEXT", "rev INTEGER DEFAULT 0", "updated_at INTEGER"],
+            "credit_cards": ["is_deleted INTEGER DEFAULT 0", "uuid TEXT", "rev INTEGER DEFAULT 0", "updated_at INTEGER"]
         }
         for table, cols in tables.items():
             for col_def in cols:
@@ -68,6 +109,289 @@ class DatabaseManager:
             except Exception as e: 
                 print(f"Migration Error ({table}): {e}")
         self.conn.commit()
+        self.migrate_date_keys()
+        self.migrate_monthly_totals()
+        self.migrate_rollover_watermark()
+        self.migrate_search_index()
+        self.migrate_change_log()
+        self.migrate_sync_journal()
+        self.migrate_sync_digest()
+
+    def migrate_date_keys(self):
+        # ym ('YYYY-MM') / ymd ('YYYY-MM-DD') ถูกเก็บคู่กับ date เพื่อให้ query รายเดือน/รายวันใช้ Index ได้
+        # (strftime()/date() บนคอลัมน์ทำให้ SQLite ต้อง Scan ทั้งตาราง)
+        c = self.conn.cursor()
+        try:
+            c.execute("UPDATE transactions SET is_deleted=0 WHERE is_deleted IS NULL")
+            c.execute("UPDATE transactions SET ym=strftime('%Y-%m', date), ymd=date(date) WHERE ym IS NULL OR ymd IS NULL")
+
+            # WHEN: ถ้าผู้เขียนใส่ ym/ymd มาถูกแล้ว (เช่น Apply ข้อมูลจาก Cloud แบบกลุ่ม) ไม่ต้อง UPDATE แถวซ้ำ
+            c.execute("DROP TRIGGER IF EXISTS trg_transactions_date_keys_ins")
+            c.execute("DROP TRIGGER IF EXISTS trg_transactions_date_keys_upd")
+            c.execute("""
+                CREATE TRIGGER trg_transactions_date_keys_ins AFTER INSERT ON transactions
+                WHEN NEW.ym IS NOT strftime('%Y-%m', NEW.date) OR NEW.ymd IS NOT date(NEW.date)
+                BEGIN
+                    UPDATE transactions SET ym=strftime('%Y-%m', NEW.date), ymd=date(NEW.date) WHERE id=NEW.id;
+                END
+            """)
+            c.execute("""
+                CREATE TRIGGER trg_transactions_date_keys_upd AFTER UPDATE OF date ON transactions
+                WHEN NEW.ym IS NOT strftime('%Y-%m', NEW.date) OR NEW.ymd IS NOT date(NEW.date)
+                BEGIN
+                    UPDATE transactions SET ym=strftime('%Y-%m', NEW.date), ymd=date(NEW.date) WHERE id=NEW.id;
+                END
+            """)
+
+            c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_month ON transactions (is_deleted, ym, type, payment_id)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_day ON transactions (is_deleted, ymd)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_card ON transactions (payment_id, is_deleted, ymd)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_transactions_list ON transactions (is_deleted, ym, date)")
+            self.conn.commit()
+        except Exception as e:
+            print(f"Migration Error (date keys): {e}")
+
+    def migrate_monthly_totals(self):
+        # monthly_totals = ยอดรวมต่อ (เดือน, บัตร [0 = เงินสด], type) อัปเดตด้วย Trigger ใน Transaction เดียวกับการเขียน
+        # จึงครอบคลุมทั้ง add/update/delete และการ Apply ข้อมูลจาก Cloud
+        # วันที่แปลงเป็นเดือนไม่ได้ (strftime = NULL) ไม่นับ: ไม่งั้น INSERT OR IGNORE เพิ่มแถว (NULL, ...) ใหม่ทุกครั้ง (NULL ไม่ซ้ำกับอะไรเลย)
+        c = self.conn.cursor()
+        try:
+            for name in ("ins", "del", "upd"): c.execute(f"DROP TRIGGER IF EXISTS trg_monthly_totals_{name}")
+            c.execute("DELETE FROM monthly_totals WHERE ym IS NULL")
+            c.execute("""
+                CREATE TRIGGER trg_monthly_totals_ins AFTER INSERT ON transactions
+                WHEN NEW.is_deleted = 0 AND strftime('%Y-%m', NEW.date) IS NOT NULL
+                BEGIN
+                    INSERT OR IGNORE INTO monthly_totals (ym, payment_id, type, total, tx_count) VALUES (strftime('%Y-%m', NEW.date), COALESCE(NEW.payment_id, 0), NEW.type, 0, 0);
+                    UPDATE monthly_totals SET total = total + NEW.amount, tx_count = tx_count + 1
+                    WHERE ym = strftime('%Y-%m', NEW.date) AND payment_id = COALESCE(NEW.payment_id, 0) AND type = NEW.type;
+                END
+            """)
+            c.execute("""
+                CREATE TRIGGER trg_monthly_totals_del AFTER DELETE ON transactions
+                WHEN OLD.is_deleted = 0 AND strftime('%Y-%m', OLD.date) IS NOT NULL
+                BEGIN
+                    UPDATE monthly_totals SET total = total - OLD.amount, tx_count = tx_count - 1
+                    WHERE ym = strftime('%Y-%m', OLD.date) AND payment_id = COALESCE(OLD.payment_id, 0) AND type = OLD.type;
+                END
+            """)
+            c.execute("""
+                CREATE TRIGGER trg_monthly_totals_upd AFTER UPDATE OF type, amount, date, payment_id, is_deleted ON transactions
+                WHEN OLD.type IS NOT NEW.type OR OLD.amount IS NOT NEW.amount OR OLD.date IS NOT NEW.date
+                     OR OLD.payment_id IS NOT NEW.payment_id OR OLD.is_deleted IS NOT NEW.is_deleted
+                BEGIN
+                    UPDATE monthly_totals SET total = total - OLD.amount, tx_count = tx_count - 1
+                    WHERE OLD.is_deleted = 0 AND ym = strftime('%Y-%m', OLD.date) AND payment_id = COALESCE(OLD.payment_id, 0) AND type = OLD.type;
+                    INSERT OR IGNORE INTO monthly_totals (ym, payment_id, type, total, tx_count)
+                    SELECT strftime('%Y-%m', NEW.date), COALESCE(NEW.payment_id, 0), NEW.type, 0, 0
+                    WHERE NEW.is_deleted = 0 AND strftime('%Y-%m', NEW.date) IS NOT NULL;
+                    UPDATE monthly_totals SET total = total + NEW.amount, tx_count = tx_count + 1
+                    WHERE NEW.is_deleted = 0 AND ym = strftime('%Y-%m', NEW.date) AND payment_id = COALESCE(NEW.payment_id, 0) AND type = NEW.type;
+                END
+            """)
+            self.conn.commit()
+
+            # ตารางเพิ่งถูกสร้าง (DB เก่า) -> คำนวณยอดตั้งต้นจากข้อมูลจริง
+            has_totals = c.execute("SELECT 1 FROM monthly_totals LIMIT 1").fetchone()
+            has_trans = c.execute("SELECT 1 FROM transactions WHERE is_deleted = 0 LIMIT 1").fetchone()
+            if has_trans and not has_totals: self.rebuild_monthly_totals()
+        except Exception as e:
+            print(f"Migration Error (monthly totals): {e}")
+
+    def migrate_rollover_watermark(self):
+        # data_version นับการเขียนที่มีผลต่อยอดคงเหลือ (ไม่นับแถวยอดยกมา ซึ่งเป็นผลลัพธ์ของการคำนวณเอง)
+        # rollover_dirty_from = เดือนเก่าที่สุดที่ถูกแก้ไขตั้งแต่การคำนวณยอดยกมาครั้งล่าสุด
+        c = self.conn.cursor()
+        try:
+            c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('data_version', '0')")
+            c.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('rollover_dirty_from', '')")
+            c.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_rollover_dirty_ins AFTER INSERT ON transactions
+                WHEN NEW.is_deleted = 0 AND NEW.item NOT IN ('ยอดยกมา', 'Balance Forward')
+                BEGIN
+                    UPDATE settings SET value = CAST(value AS INTEGER) + 1 WHERE key = 'data_version';
+                    UPDATE settings SET value = strftime('%Y-%m', NEW.date)
+                    WHERE key = 'rollover_dirty_from' AND (value = '' OR value > strftime('%Y-%m', NEW.date));
+                END
+            """)
+            c.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_rollover_dirty_del AFTER DELETE ON transactions
+                WHEN OLD.is_deleted = 0 AND OLD.item NOT IN ('ยอดยกมา', 'Balance Forward')
+                BEGIN
+                    UPDATE settings SET value = CAST(value AS INTEGER) + 1 WHERE key = 'data_version';
+                    UPDATE settings SET value = strftime('%Y-%m', OLD.date)
+                    WHERE key = 'rollover_dirty_from' AND (value = '' OR value > strftime('%Y-%m', OLD.date));
+                END
+            """)
+            c.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_rollover_dirty_upd AFTER UPDATE OF type, item, amount, date, payment_id, is_deleted ON transactions
+                WHEN (OLD.item NOT IN ('ยอดยกมา', 'Balance Forward') OR NEW.item NOT IN ('ยอดยกมา', 'Balance Forward'))
+                     AND (OLD.type IS NOT NEW.type OR OLD.item IS NOT NEW.item OR OLD.amount IS NOT NEW.amount OR OLD.date IS NOT NEW.date
+                          OR OLD.payment_id IS NOT NEW.payment_id OR OLD.is_deleted IS NOT NEW.is_deleted)
+                BEGIN
+                    UPDATE settings SET value = CAST(value AS INTEGER) + 1 WHERE key = 'data_version';
+                    UPDATE settings SET value = MIN(strftime('%Y-%m', OLD.date), strftime('%Y-%m', NEW.date))
+                    WHERE key = 'rollover_dirty_from' AND (value = '' OR value > MIN(strftime('%Y-%m', OLD.date), strftime('%Y-%m', NEW.date)));
+                END
+            """)
+            self.conn.commit()
+        except Exception as e:
+            print(f"Migration Error (rollover watermark): {e}")
+
+    def migrate_change_log(self):
+        # change_log = ตัวนับการเขียนต่อตาราง (Trigger) ใช้บอกว่าตารางไหนเปลี่ยน แทนการดู mtime ของไฟล์ DB/WAL
+        c = self.conn.cursor()
+        try:
+            for tbl in WATCHED_TABLES:
+                c.execute("INSERT OR IGNORE INTO change_log (tbl, version) VALUES (?, 0)", (tbl,))
+                for op in ("INSERT", "UPDATE", "DELETE"):
+                    c.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS trg_change_log_{tbl}_{op.lower()} AFTER {op} ON {tbl}
+                        BEGIN
+                            UPDATE change_log SET version = version + 1 WHERE tbl = '{tbl}';
+                        END
+                    """)
+            self.conn.commit()
+        except Exception as e:
+            print(f"Migration Error (change log): {e}")
+
+    def migrate_sync_journal(self):
+        # ทุกแถวที่ Sync มี rev (เลขเวอร์ชัน) + updated_at (ms) และการแก้ไขในเครื่องจะถูกจดลง sync_journal
+        # แยกการเขียนจาก Cloud ออกจากการแก้ไขในเครื่องด้วย rev/updated_at: Cloud จะเขียนค่าสองคอลัมน์นี้มาเองเสมอ
+        # ส่วนการแก้ไขปกติไม่แตะ -> Trigger จะเพิ่ม rev และจดลง Journal ให้
+        # sync_journal.ym (เฉพาะ transactions) = เดือนของแถวตอนที่อยู่บน Cloud ก่อนแก้ในเครื่อง ('' = แถวใหม่ยังไม่เคยส่ง)
+        # -> Layout รายเดือนรู้ว่าต้องย้ายออกจาก Shard ไหนเมื่อแก้วันที่ข้ามเดือน
+        # sync_journal ใช้เป็น Outbox ถาวร: seq = ลำดับการแก้ล่าสุด (ส่งตามลำดับนี้), op = 'upsert' / 'delete'
+        # แก้แถวเดิมซ้ำหลายครั้งระหว่าง Offline -> รวมเป็นรายการเดียว (ส่งค่าล่าสุดครั้งเดียว)
+        c = self.conn.cursor()
+        now_ms = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+        try:
+            cols_now = [r[1] for r in c.execute("PRAGMA table_info(sync_journal)").fetchall()]
+            added = [col for col in ("ym", "seq", "op") if col not in cols_now]
+            for col in added:
+                c.execute(f"ALTER TABLE sync_journal ADD COLUMN {col} {'INTEGER' if col == 'seq' else 'TEXT'}")
+            if added:
+                c.execute("UPDATE sync_journal SET seq = rowid WHERE seq IS NULL")
+                for tbl in SYNC_COLUMNS:
+                    c.execute(f"DROP TRIGGER IF EXISTS trg_sync_journal_{tbl}_ins")
+                    c.execute(f"DROP TRIGGER IF EXISTS trg_sync_journal_{tbl}_upd")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_sync_journal_seq ON sync_journal (seq)")
+            next_seq = "(SELECT COALESCE(MAX(seq), 0) + 1 FROM sync_journal)"
+            op = "CASE WHEN NEW.is_deleted = 1 THEN 'delete' ELSE 'upsert' END"
+            for tbl, cols in SYNC_COLUMNS.items():
+                new_ym = "''" if tbl == "transactions" else "NULL"
+                old_ym = f"COALESCE((SELECT ym FROM sync_journal WHERE tbl = '{tbl}' AND uuid = NEW.uuid), OLD.ym)" if tbl == "transactions" else "NULL"
+                c.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_sync_journal_{tbl}_ins AFTER INSERT ON {tbl}
+                    WHEN NEW.uuid IS NOT NULL AND (NEW.rev IS NULL OR NEW.rev = 0)
+                    BEGIN
+                        UPDATE {tbl} SET rev = 1, updated_at = {now_ms} WHERE id = NEW.id;
+                        INSERT OR REPLACE INTO sync_journal (tbl, uuid, rev, ym, seq, op) VALUES ('{tbl}', NEW.uuid, 1, {new_ym}, {next_seq}, {op});
+                    END
+                """)
+                c.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_sync_journal_{tbl}_upd AFTER UPDATE OF {cols} ON {tbl}
+                    WHEN NEW.uuid IS NOT NULL AND NEW.rev IS OLD.rev AND NEW.updated_at IS OLD.updated_at
+                    BEGIN
+                        UPDATE {tbl} SET rev = COALESCE(OLD.rev, 0) + 1, updated_at = {now_ms} WHERE id = NEW.id;
+                        INSERT OR REPLACE INTO sync_journal (tbl, uuid, rev, ym, seq, op) VALUES ('{tbl}', NEW.uuid, COALESCE(OLD.rev, 0) + 1, {old_ym}, {next_seq}, {op});
+                    END
+                """)
+            self.conn.commit()
+        except Exception as e:
+            print(f"Migration Error (sync journal): {e}")
+
+    def migrate_sync_digest(self):
+        # sync_digest = จำนวน + ผลรวม Hash ของ (uuid, rev) ของแถวที่ยังไม่ถูกลบ ต่อตาราง (Transaction แยกรายเดือน)
+        # Transaction ที่วันที่แปลงเป็นเดือนไม่ได้ไม่นับ (เหมือน monthly_totals) ทั้งใน Trigger และ rebuild_sync_digest ให้ตรงกันเสมอ
+        c = self.conn.cursor()
+        try:
+            exists = c.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='trg_sync_digest_transactions_ins'").fetchone()
+            # แถว ym = NULL = Trigger รุ่นก่อน (INSERT OR IGNORE ได้แถวใหม่ทุกครั้ง) หรือ rebuild ที่นับวันที่เสีย -> สร้างใหม่ทั้งหมด
+            stale = c.execute("SELECT 1 FROM sync_digest WHERE ym IS NULL LIMIT 1").fetchone()
+            for tbl in SYNC_COLUMNS:
+                ym = lambda row: f"strftime('%Y-%m', {row}.date)" if tbl == "transactions" else "''"
+                live = lambda row: f"{row}.uuid IS NOT NULL AND COALESCE({row}.is_deleted, 0) = 0 AND {ym(row)} IS NOT NULL"
+                for name in ("ins", "del", "upd"): c.execute(f"DROP TRIGGER IF EXISTS trg_sync_digest_{tbl}_{name}")
+                add = f"""
+                    INSERT OR IGNORE INTO sync_digest (tbl, ym, cnt, hash) SELECT '{tbl}', {ym('NEW')}, 0, 0 WHERE {live('NEW')};
+                    UPDATE sync_digest SET cnt = cnt + 1, hash = (hash + {_digest_sql('NEW')}) % {DIGEST_MOD}
+                    WHERE tbl = '{tbl}' AND ym = {ym('NEW')} AND {live('NEW')};"""
+                sub = f"""
+                    UPDATE sync_digest SET cnt = cnt - 1, hash = (hash - {_digest_sql('OLD')} + {DIGEST_MOD}) % {DIGEST_MOD}
+                    WHERE tbl = '{tbl}' AND ym = {ym('OLD')} AND {live('OLD')};"""
+                watch = "uuid, rev, is_deleted" + (", date" if tbl == "transactions" else "")
+                c.execute(f"CREATE TRIGGER trg_sync_digest_{tbl}_ins AFTER INSERT ON {tbl} BEGIN {add} END")
+                c.execute(f"CREATE TRIGGER trg_sync_digest_{tbl}_del AFTER DELETE ON {tbl} BEGIN {sub} END")
+                c.execute(f"""
+                    CREATE TRIGGER trg_sync_digest_{tbl}_upd AFTER UPDATE OF {watch} ON {tbl}
+                    WHEN OLD.uuid IS NOT NEW.uuid OR OLD.rev IS NOT NEW.rev OR OLD.is_deleted IS NOT NEW.is_deleted OR {ym('OLD')} IS NOT {ym('NEW')}
+                    BEGIN {sub} {add} END
+                """)
+            if not exists or stale: self.rebuild_sync_digest()
+            self.conn.commit()
+        except Exception as e:
+            print(f"Migration Error (sync digest): {e}")
+
+    def rebuild_sync_digest(self):
+        self.conn.execute("DELETE FROM sync_digest")
+        for tbl in SYNC_COLUMNS:
+            ym = "strftime('%Y-%m', t.date)" if tbl == "transactions" else "''"
+            self.conn.execute(f"""
+                INSERT INTO sync_digest (tbl, ym, cnt, hash)
+                SELECT '{tbl}', {ym}, COUNT(*), SUM({_digest_sql('t')}) % {DIGEST_MOD}
+                FROM {tbl} t WHERE t.uuid IS NOT NULL AND COALESCE(t.is_deleted, 0) = 0 AND {ym} IS NOT NULL GROUP BY {ym}
+            """)
+        self.conn.commit()
+
+    def migrate_search_index(self):
+        # FTS5 (trigram) สำหรับค้นหา item/category -> ค้นคำไทยที่ไม่มีเว้นวรรคได้ ถ้า SQLite ไม่รองรับจะ fallback เป็น LIKE
+        c = self.conn.cursor()
+        try:
+            exists = c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='transactions_fts'").fetchone()
+            c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(item, category, content='transactions', content_rowid='id', tokenize='trigram')")
+            c.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_ins AFTER INSERT ON transactions
+                BEGIN
+                    INSERT INTO transactions_fts (rowid, item, category) VALUES (NEW.id, NEW.item, NEW.category);
+                END
+            """)
+            c.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_del AFTER DELETE ON transactions
+                BEGIN
+                    INSERT INTO transactions_fts (transactions_fts, rowid, item, category) VALUES ('delete', OLD.id, OLD.item, OLD.category);
+                END
+            """)
+            c.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_upd AFTER UPDATE OF item, category ON transactions
+                BEGIN
+                    INSERT INTO transactions_fts (transactions_fts, rowid, item, category) VALUES ('delete', OLD.id, OLD.item, OLD.category);
+                    INSERT INTO transactions_fts (rowid, item, category) VALUES (NEW.id, NEW.item, NEW.category);
+                END
+            """)
+            if not exists: c.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+            self.conn.commit()
+            self.has_fts = True
+        except Exception as e:
+            self.conn.rollback()
+            print(f"Search index unavailable, using LIKE: {e}")
+
+    def rebuild_monthly_totals(self):
+        """คำนวณตาราง monthly_totals ใหม่ทั้งหมดจาก transactions (ใช้ซ่อมกรณียอดเพี้ยน)"""
+        try:
+            self.conn.execute("DELETE FROM monthly_totals")
+            self.conn.execute("""
+                INSERT INTO monthly_totals (ym, payment_id, type, total, tx_count)
+                SELECT ym, COALESCE(payment_id, 0), type, SUM(amount), COUNT(*)
+                FROM transactions WHERE is_deleted = 0 AND ym IS NOT NULL
+                GROUP BY ym, COALESCE(payment_id, 0), type
+            """)
+            self.conn.commit()
+            return True
+        except Exception as e:
+            print(f"Rebuild Totals Error: {e}")
+            return False
 
     def cleanup_duplicate_recurring(self):
         try:
@@ -117,7 +441,8 @@ class DatabaseManager:
             if not existing:
                 self.add_category(n, t, k)
             else:
-                self.conn.execute("UPDATE categories SET is_deleted=0 WHERE id=?", (existing[0],))
+                # เฉพาะที่ถูกลบไว้: UPDATE ที่ไม่เปลี่ยนอะไรก็ยัง bump rev + ลง sync_journal (ส่งหมวดหมู่ตั้งต้นซ้ำทุกครั้งที่เปิดแอป)
+                self.conn.execute("UPDATE categories SET is_deleted=0 WHERE id=? AND is_deleted IS NOT 0", (existing[0],))
         self.conn.commit()
 
     def get_id_by_uuid(self, table, uid):
@@ -174,57 +499,130 @@ class DatabaseManager:
         self.conn.commit()
         self._notify()
 
+    def snapshot(self):
+        """สำเนาทั้งฐานข้อมูลในหน่วยความจำ ก่อนงานที่ล้างแล้วเขียนใหม่หลายขั้น (แต่ละขั้น commit เอง) -> ส่งให้ restore() ถ้าล้มกลางทาง"""
+        snap = sqlite3.connect(":memory:", check_same_thread=False)
+        self.conn.commit()
+        self.conn.backup(snap)
+        return snap
+
+    def restore(self, snap):
+        # เขียนสำเนากลับทับทั้งไฟล์ (รวม settings เช่น sync_watermark) แล้วทิ้งสำเนา
+        self.conn.rollback()
+        snap.backup(self.conn)
+        snap.close()
+        self.mark_changes_seen()
+
     def get_transactions(self, date_filter=None, month_filter=None):
         query = """
             SELECT t.id, t.type, t.item, t.amount, t.category, t.date, c.name 
             FROM transactions t
             LEFT JOIN credit_cards c ON t.payment_id = c.id
-            WHERE (t.is_deleted IS NULL OR t.is_deleted = 0) 
+            WHERE t.is_deleted = 0 
         """
         params = []
         if date_filter:
-            query += " AND date(t.date) = date(?)"
+            query += " AND t.ymd = date(?)"
             params.append(date_filter)
         elif month_filter: 
-            query += " AND strftime('%Y-%m', t.date) = ?"
+            query += " AND t.ym = ?"
             params.append(month_filter)
         query += " ORDER BY t.date DESC"
         return self.conn.execute(query, tuple(params)).fetchall()
 
-    def search_transactions(self, keyword):
+    def get_transactions_page(self, month_filter=None, after=None, limit=40, date_filter=None):
+        # Keyset pagination: after = (date, id) ของแถวสุดท้ายในหน้าก่อน -> ไม่ต้อง OFFSET/นับแถวซ้ำ
         query = """
             SELECT t.id, t.type, t.item, t.amount, t.category, t.date, c.name 
             FROM transactions t
             LEFT JOIN credit_cards c ON t.payment_id = c.id
-            WHERE (t.is_deleted IS NULL OR t.is_deleted = 0)
-            AND (t.item LIKE ? OR t.category LIKE ? OR CAST(t.amount AS TEXT) LIKE ?)
-            ORDER BY t.date DESC
+            WHERE t.is_deleted = 0 
         """
-        kw = f"%{keyword}%"
-        return self.conn.execute(query, (kw, kw, kw)).fetchall()
+        params = []
+        if date_filter:
+            query += " AND t.ymd = date(?)"
+            params.append(date_filter)
+        elif month_filter: 
+            query += " AND t.ym = ?"
+            params.append(month_filter)
+        if after:
+            query += " AND (t.date < ? OR (t.date = ? AND t.id < ?))"
+            params.extend([after[0], after[0], after[1]])
+        query += " ORDER BY t.date DESC, t.id DESC LIMIT ?"
+        params.append(limit)
+        return self.conn.execute(query, tuple(params)).fetchall()
+
+    def _parse_amount_query(self, keyword):
+        # รองรับ "120", "100-500", ">100", "<=50" -> (เงื่อนไข SQL, params) หรือ None ถ้าไม่ใช่ตัวเลข
+        kw = keyword.replace(",", "").strip()
+        num = r"(\d+(?:\.\d+)?)"
+        m = re.fullmatch(num + r"\s*-\s*" + num, kw)
+        if m:
+            lo, hi = sorted((float(m.group(1)), float(m.group(2))))
+            return "t.amount BETWEEN ? AND ?", [lo, hi]
+        m = re.fullmatch(r"(>=|<=|>|<)\s*" + num, kw)
+        if m: return f"t.amount {m.group(1)} ?", [float(m.group(2))]
+        m = re.fullmatch(num, kw)
+        if m: return "t.amount = ?", [float(m.group(1))]
+        return None
+
+    def _build_search_filter(self, keyword):
+        keyword = keyword.strip()
+        if self.has_fts and len(keyword) >= 3:
+            # ใส่เป็น Phrase เพื่อไม่ให้ตัวอักษรพิเศษถูกตีความเป็น FTS syntax (trigram ต้องยาว >= 3 ตัวอักษร)
+            text_cond = "t.id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?)"
+            params = ['"' + keyword.replace('"', '""') + '"']
+        else:
+            kw = f"%{keyword}%"
+            text_cond = "(t.item LIKE ? OR t.category LIKE ?)"
+            params = [kw, kw]
+
+        amt = self._parse_amount_query(keyword)
+        if amt:
+            return f"({amt[0]} OR {text_cond})", amt[1] + params
+        return text_cond, params
+
+    def search_transactions(self, keyword, limit=None, offset=0):
+        cond, params = self._build_search_filter(keyword)
+        query = f"""
+            SELECT t.id, t.type, t.item, t.amount, t.category, t.date, c.name 
+            FROM transactions t
+            LEFT JOIN credit_cards c ON t.payment_id = c.id
+            WHERE t.is_deleted = 0 AND {cond}
+            ORDER BY t.date DESC, t.id DESC
+        """
+        if limit:
+            query += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return self.conn.execute(query, tuple(params)).fetchall()
+
+    def count_search_transactions(self, keyword):
+        cond, params = self._build_search_filter(keyword)
+        return self.conn.execute(f"SELECT COUNT(*) FROM transactions t WHERE t.is_deleted = 0 AND {cond}", tuple(params)).fetchone()[0]
 
     def get_summary(self, filter_str=None):
-        base = """SELECT SUM(CASE WHEN type='income' THEN amount ELSE 0 END), SUM(CASE WHEN (type='expense' OR type='repayment') THEN amount ELSE 0 END) FROM transactions WHERE (payment_id IS NULL OR type='repayment') AND (is_deleted IS NULL OR is_deleted = 0)"""
-        params = []
-        if filter_str:
-            if len(filter_str) == 7: base += " AND strftime('%Y-%m', date) = ?"; params.append(filter_str)
-            else: base += " AND date(date) = date(?)"; params.append(filter_str)
-        else: base += " AND strftime('%Y-%m', date) = strftime('%Y-%m', 'now', 'localtime')"
-        res = self.conn.execute(base, tuple(params)).fetchone()
-        return (res[0] or 0), (res[1] or 0), (res[0] or 0) - (res[1] or 0)
+        if not filter_str: filter_str = datetime.now().strftime("%Y-%m")
+        if len(filter_str) == 7:
+            # รายเดือนอ่านจาก monthly_totals (ไม่กี่แถว) แทนการ SUM transactions ทั้งเดือน
+            q = """SELECT SUM(CASE WHEN type='income' THEN total ELSE 0 END), SUM(CASE WHEN (type='expense' OR type='repayment') THEN total ELSE 0 END) FROM monthly_totals WHERE ym = ? AND (payment_id = 0 OR type='repayment')"""
+        else:
+            q = """SELECT SUM(CASE WHEN type='income' THEN amount ELSE 0 END), SUM(CASE WHEN (type='expense' OR type='repayment') THEN amount ELSE 0 END) FROM transactions WHERE (payment_id IS NULL OR type='repayment') AND is_deleted = 0 AND ymd = date(?)"""
+        res = self.conn.execute(q, (filter_str,)).fetchone()
+        inc, exp = round(res[0] or 0, 2), round(res[1] or 0, 2)
+        return inc, exp, inc - exp
     
     def get_month_balance(self, year, month):
         month_str = f"{year}-{month:02d}"
-        q = "SELECT SUM(CASE WHEN type='income' THEN amount ELSE -amount END) FROM transactions WHERE type IN ('income', 'expense', 'repayment') AND (payment_id IS NULL OR type='repayment') AND strftime('%Y-%m', date) = ? AND (is_deleted IS NULL OR is_deleted = 0)"
+        q = "SELECT SUM(CASE WHEN type='income' THEN total ELSE -total END) FROM monthly_totals WHERE type IN ('income', 'expense', 'repayment') AND (payment_id = 0 OR type='repayment') AND ym = ?"
         res = self.conn.execute(q, (month_str,)).fetchone()
-        return res[0] if res and res[0] else 0.0
+        return round(res[0], 2) if res and res[0] else 0.0
         
     def get_top_transactions(self, t_type, month_str):
-        return self.conn.execute("SELECT item, amount FROM transactions WHERE type=? AND strftime('%Y-%m', date) = ? AND (is_deleted=0 OR is_deleted IS NULL) ORDER BY amount DESC LIMIT 10", (t_type, month_str)).fetchall()
+        return self.conn.execute("SELECT item, amount FROM transactions WHERE is_deleted=0 AND ym = ? AND type=? ORDER BY amount DESC LIMIT 10", (month_str, t_type)).fetchall()
 
     def get_active_days(self, month_str):
-        q = "SELECT DISTINCT strftime('%d', date) FROM transactions WHERE strftime('%Y-%m', date) = ? AND (is_deleted=0 OR is_deleted IS NULL)"
-        return {int(r[0]) for r in self.conn.execute(q, (month_str,)).fetchall()}
+        q = "SELECT DISTINCT substr(ymd, 9, 2) FROM transactions WHERE is_deleted=0 AND ym = ?"
+        return {int(r[0]) for r in self.conn.execute(q, (month_str,)).fetchall() if r[0]}
 
     # --- Recurring ---
     def add_recurring(self, day, item, amount, category, payment_id=None, auto_pay=0, force_id=None):
@@ -255,8 +653,20 @@ class DatabaseManager:
         self._notify()
 
     def is_recurring_paid_v2(self, item, amount, category, month_str, payment_id):
-        q = "SELECT count(*) FROM transactions WHERE item=? AND amount=? AND category=? AND strftime('%Y-%m', date)=? AND (is_deleted=0 OR is_deleted IS NULL)"
-        return self.conn.execute(q, (item, amount, category, month_str)).fetchone()[0] > 0
+        q = "SELECT count(*) FROM transactions WHERE is_deleted=0 AND ym=? AND item=? AND amount=? AND category=?"
+        return self.conn.execute(q, (month_str, item, amount, category)).fetchone()[0] > 0
+
+    def get_recurring_paid_map(self, month_str):
+        """คืน set ของ id รายจ่ายประจำที่จ่ายแล้วในเดือนนั้น (Query เดียวแทนการเรียก is_recurring_paid_v2 ทีละรายการ)
+        is_deleted ของรายจ่ายประจำเป็น NULL ได้ (ข้อมูลเก่า) ต้องนับเหมือน get_recurring ไม่งั้น Auto-pay จ่ายซ้ำทุกครั้งที่วาดหน้าจอ
+        (ของ transactions ถูกแปลง NULL -> 0 ตอน migrate_db แล้ว เทียบ = 0 ตรงๆ ให้ใช้ Index ได้)"""
+        q = """
+            SELECT DISTINCT r.id
+            FROM recurring_expenses r
+            JOIN transactions t ON t.item = r.item AND t.amount = r.amount AND t.category = r.category
+            WHERE COALESCE(r.is_deleted, 0) = 0 AND t.is_deleted = 0 AND t.ym = ?
+        """
+        return {r[0] for r in self.conn.execute(q, (month_str,)).fetchall()}
 
     # --- Categories & Cards ---
     def get_categories(self, t_type=None):
@@ -317,9 +727,9 @@ class DatabaseManager:
     
     # [FIXED] Updated to support Billing Cycle Calculation for Accuracy
     def get_card_usage(self, card_id, month_filter=None):
-        qs = "SELECT SUM(amount) FROM transactions WHERE payment_id=? AND type='expense' AND (is_deleted=0 OR is_deleted IS NULL)"
-        qr = "SELECT SUM(amount) FROM transactions WHERE payment_id=? AND type='repayment' AND (is_deleted=0 OR is_deleted IS NULL)"
-        qi = "SELECT SUM(amount) FROM transactions WHERE payment_id=? AND type='income' AND (is_deleted=0 OR is_deleted IS NULL)"
+        qs = "SELECT SUM(amount) FROM transactions WHERE payment_id=? AND type='expense' AND is_deleted=0"
+        qr = "SELECT SUM(amount) FROM transactions WHERE payment_id=? AND type='repayment' AND is_deleted=0"
+        qi = "SELECT SUM(amount) FROM transactions WHERE payment_id=? AND type='income' AND is_deleted=0"
         
         # 1. Get Closing Day
         row = self.conn.execute("SELECT closing_day FROM credit_cards WHERE id=?", (card_id,)).fetchone()
@@ -346,9 +756,9 @@ class DatabaseManager:
                     # Fallback to standard calendar month logic (End of this month)
                     ny, nm = (y+1, 1) if m==12 else (y, m+1)
                     cutoff = f"{ny}-{nm:02d}-01"
-                    qs += " AND date(date) < date(?)"
-                    qr += " AND date(date) < date(?)"
-                    qi += " AND date(date) < date(?)" 
+                    qs += " AND ymd < ?"
+                    qr += " AND ymd < ?"
+                    qi += " AND ymd < ?" 
                     args.append(cutoff)
             except Exception as e: 
                 print(f"Error filtering card usage: {e}")
@@ -359,6 +769,29 @@ class DatabaseManager:
         i = self.conn.execute(qi, tuple(args)).fetchone()[0] or 0.0
         return s - r - i
 
+    def get_all_card_usages(self, month_filter=None):
+        """ยอดใช้ของบัตรทุกใบใน Query เดียว -> {card_id: usage} (คิดแบบเดียวกับ get_card_usage)"""
+        q = """
+            SELECT c.id, SUM(CASE WHEN t.type='expense' THEN t.amount WHEN t.type IN ('repayment', 'income') THEN -t.amount ELSE 0 END)
+            FROM credit_cards c
+            LEFT JOIN transactions t ON t.payment_id = c.id AND t.is_deleted = 0 {cutoff}
+            WHERE c.is_deleted = 0
+            GROUP BY c.id
+        """
+        cutoff, args = "", []
+        if month_filter:
+            try:
+                y, m = map(int, month_filter.split('-'))
+                _, max_days = calendar.monthrange(y, m)
+                # Cutoff ต่อบัตร = วันตัดรอบของเดือนนั้น (หรือสิ้นเดือนถ้าไม่ได้ตั้งวันตัดรอบ)
+                cutoff = "AND t.ymd <= ? || '-' || printf('%02d', CASE WHEN c.closing_day > 0 THEN MIN(c.closing_day, ?) ELSE ? END)"
+                args = [f"{y}-{m:02d}", max_days, max_days]
+            except Exception as e:
+                print(f"Error filtering card usage: {e}")
+
+        rows = self.conn.execute(q.format(cutoff=cutoff), tuple(args)).fetchall()
+        return {cid: (usage or 0.0) for cid, usage in rows}
+
     def get_card_transactions(self, card_id, month_str):
         # 1. Get Closing Day
         row = self.conn.execute("SELECT closing_day FROM credit_cards WHERE id=?", (card_id,)).fetchone()
@@ -366,7 +799,7 @@ class DatabaseManager:
 
         # Fallback to standard calendar month if no closing day set
         if not closing_day or closing_day < 1:
-            return self.conn.execute("SELECT id, type, item, amount, category, date FROM transactions WHERE payment_id=? AND strftime('%Y-%m', date)=? AND (is_deleted=0 OR is_deleted IS NULL) ORDER BY date DESC", (card_id, month_str)).fetchall()
+            return self.conn.execute("SELECT id, type, item, amount, category, date FROM transactions WHERE is_deleted=0 AND ym=? AND payment_id=? ORDER BY date DESC", (month_str, card_id)).fetchall()
 
         # 2. Calculate Billing Cycle
         try:
@@ -403,7 +836,7 @@ class DatabaseManager:
                 FROM transactions 
                 WHERE payment_id=? 
                 AND date >= ? AND date <= ?
-                AND (is_deleted=0 OR is_deleted IS NULL) 
+                AND is_deleted=0 
                 ORDER BY date DESC
             """
             return self.conn.execute(sql, (card_id, s_str, e_str)).fetchall()
@@ -411,7 +844,78 @@ class DatabaseManager:
         except Exception as e:
             print(f"Billing Cycle Calc Error: {e}")
             # Fallback
-            return self.conn.execute("SELECT id, type, item, amount, category, date FROM transactions WHERE payment_id=? AND strftime('%Y-%m', date)=? AND (is_deleted=0 OR is_deleted IS NULL) ORDER BY date DESC", (card_id, month_str)).fetchall()
+            return self.conn.execute("SELECT id, type, item, amount, category, date FROM transactions WHERE is_deleted=0 AND ym=? AND payment_id=? ORDER BY date DESC", (month_str, card_id)).fetchall()
+
+    def get_sync_journal(self):
+        # -> {table: {uuid: rev}} ของแถวที่แก้ไขในเครื่องและยังไม่ได้ส่งขึ้น Cloud
+        journal = {tbl: {} for tbl in SYNC_COLUMNS}
+        for tbl, uid, rev in self.conn.execute("SELECT tbl, uuid, rev FROM sync_journal").fetchall():
+            journal.setdefault(tbl, {})[uid] = rev
+        return journal
+
+    def get_moved_transactions(self):
+        # -> {uuid: เดือนเดิมบน Cloud} ของ Transaction ที่รอส่งและถูกแก้วันที่ข้ามเดือน
+        return dict(self.conn.execute("""
+            SELECT j.uuid, j.ym FROM sync_journal j JOIN transactions t ON t.uuid = j.uuid
+            WHERE j.tbl = 'transactions' AND j.ym != '' AND j.ym IS NOT t.ym
+        """).fetchall())
+
+    def get_dirty_months(self):
+        # เดือนที่ Transaction รอส่งอยู่ตอนนี้ และเดือนเดิมบน Cloud (ถ้าย้ายเดือน)
+        rows = self.conn.execute("""
+            SELECT t.ym, j.ym FROM sync_journal j JOIN transactions t ON t.uuid = j.uuid WHERE j.tbl = 'transactions'
+        """).fetchall()
+        return {ym for r in rows for ym in r if ym}
+
+    def has_sync_changes(self):
+        return self.conn.execute("SELECT 1 FROM sync_journal LIMIT 1").fetchone() is not None
+
+    def get_outbox(self):
+        # -> [(table, uuid, rev, op)] ของที่รอส่ง เรียงตามลำดับที่แก้ในเครื่อง (เก่าสุดก่อน)
+        return self.conn.execute("SELECT tbl, uuid, rev, op FROM sync_journal ORDER BY seq").fetchall()
+
+    def get_outbox_counts(self):
+        # -> {op: จำนวน} เช่น {'upsert': 3, 'delete': 1}
+        return dict(self.conn.execute("SELECT COALESCE(op, 'upsert'), COUNT(*) FROM sync_journal GROUP BY 1").fetchall())
+
+    def get_sync_digest(self):
+        # -> {table: {"count", "hash"}} (+ "months": {ym: {"count", "hash"}} ของ transactions) จากตาราง sync_digest (ไม่ต้องสแกนข้อมูล)
+        digest = {tbl: {"count": 0, "hash": 0} for tbl in SYNC_COLUMNS}
+        for tbl, ym, cnt, h in self.conn.execute("SELECT tbl, ym, cnt, hash FROM sync_digest WHERE cnt > 0").fetchall():
+            d = digest.setdefault(tbl, {"count": 0, "hash": 0})
+            d["count"] += cnt
+            d["hash"] = (d["hash"] + h) % DIGEST_MOD
+            if ym: d.setdefault("months", {})[ym] = {"count": cnt, "hash": f"{h:x}"}
+        for d in digest.values(): d["hash"] = f"{d['hash']:x}"  # เป็น String: ตัวเลขบน Firebase เป็น double เก็บ 60 bit ไม่ครบ
+        return digest
+
+    def clear_sync_journal(self, entries=None):
+        # entries = [(table, uuid, rev)] ที่ส่งสำเร็จ -> ลบเฉพาะที่ rev ยังตรง (ถ้าถูกแก้ระหว่างส่งจะยังค้างไว้ส่งรอบหน้า)
+        if entries is None: self.conn.execute("DELETE FROM sync_journal")
+        else: self.conn.executemany("DELETE FROM sync_journal WHERE tbl=? AND uuid=? AND rev=?", entries)
+        self.conn.commit()
+
+    def bump_rev(self, table, uid, rev):
+        # ใช้ตอน Conflict ที่ของในเครื่องชนะ: ให้ rev สูงกว่าฝั่ง Cloud เพื่อให้เครื่องอื่นรับเวอร์ชันนี้
+        self.conn.execute(f"UPDATE {table} SET rev=? WHERE uuid=?", (rev, uid))
+        self.conn.execute("UPDATE sync_journal SET rev=? WHERE tbl=? AND uuid=?", (rev, table, uid))
+        self.conn.commit()
+
+    def get_revs(self, table, uuids):
+        revs = {}
+        uuids = list(uuids)
+        for i in range(0, len(uuids), 500):
+            chunk = uuids[i:i + 500]
+            q = f"SELECT uuid, rev FROM {table} WHERE uuid IN ({','.join('?' * len(chunk))})"
+            revs.update(self.conn.execute(q, chunk).fetchall())
+        return revs
+
+    def purge_synced_tombstones(self, before_ms):
+        # ลบแถวที่ถูกลบ (is_deleted=1) ซึ่งส่งสถานะขึ้น Cloud แล้ว และแก้ล่าสุดก่อน before_ms โดยไม่ VACUUM ทั้งไฟล์แบบ purge_deleted_data
+        # Tombstone ที่ยังใหม่ต้องเก็บไว้: Force Push (PUT ทั้งก้อน) จะได้ส่งสถานะลบไปด้วย ไม่งั้นเครื่องอื่นที่ยังมีแถวนั้นจะส่งกลับขึ้นมาใหม่
+        for tbl in SYNC_COLUMNS:
+            self.conn.execute(f"DELETE FROM {tbl} WHERE is_deleted = 1 AND COALESCE(updated_at, 0) < ? AND uuid NOT IN (SELECT uuid FROM sync_journal WHERE tbl = ?)", (before_ms, tbl))
+        self.conn.commit()
 
     def get_setting(self, key, default=""):
         res = self.conn.execute("SELECT value FROM settings WHERE key=?", (key,)).fetchone()
@@ -419,64 +923,141 @@ class DatabaseManager:
     def set_setting(self, key, value):
         self.conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value)); self.conn.commit()
 
+    def _get_rollover_state(self):
+        keys = ("data_version", "rollover_version", "rollover_validated", "rollover_dirty_from")
+        rows = self.conn.execute(f"SELECT key, value FROM settings WHERE key IN ({','.join('?' * len(keys))})", keys).fetchall()
+        state = {k: "" for k in keys}
+        state.update({k: (v or "") for k, v in rows})
+        return state
+
+    def _set_rollover_watermark(self, horizon_ym, data_version):
+        self.conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", [
+            ("rollover_validated", horizon_ym), ("rollover_version", str(data_version)), ("rollover_dirty_from", "")
+        ])
+        self.conn.commit()
+
+    def get_change_versions(self):
+        try: return dict(self.conn.execute("SELECT tbl, version FROM change_log").fetchall())
+        except: return {}
+
+    def mark_changes_seen(self):
+        # เรียกหลังการเขียนของเราเอง (_notify) -> poll_changes จะไม่รายงานการเขียนนี้ซ้ำ
+        # ถ้า data_version เปลี่ยน แปลว่ามี Process อื่นเขียนแทรกมาก่อน ปล่อยให้ poll_changes เป็นคนรายงาน
+        with self._changes_lock:
+            try: dv = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            except: return
+            if self.last_data_version is None or dv == self.last_data_version:
+                self.last_data_version = dv
+                self.seen_versions = self.get_change_versions()
+
+    def poll_changes(self):
+        # -> set ของตารางที่เปลี่ยนตั้งแต่ครั้งก่อน (การเขียนของเราเองผ่าน _notify ถูกนับเป็น "เห็นแล้ว" ไปก่อนหน้า)
+        # PRAGMA data_version เปลี่ยนเฉพาะเมื่อ Connection อื่น commit; change_log จับการเขียนผ่าน Connection นี้ที่ไม่ได้ผ่าน _notify (เช่น Cloud)
+        with self._changes_lock:
+            self.last_data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            versions = self.get_change_versions()
+            changed = set(t for t, v in versions.items() if self.seen_versions.get(t) != v)
+            self.seen_versions = versions
+            return changed
+
+    def get_rollover_stats(self):
+        state = self._get_rollover_state()
+        return {"runs": self.rollover_runs, "skips": self.rollover_skips,
+                "validated": state["rollover_validated"], "data_version": state["data_version"]}
+
     def check_and_rollover(self, cy, cm):
-        pm = cm - 1; py = cy
-        if pm == 0: pm = 12; py -= 1
+        # คำนวณยอดยกมาใหม่เฉพาะเมื่อข้ามเดือน หรือมีการแก้ไขข้อมูลตั้งแต่ครั้งล่าสุดที่คำนวณไว้ (Watermark ใน settings)
+        now = datetime.now()
+        hy, hm = (now.year + 1, 1) if now.month == 12 else (now.year, now.month + 1)
+        horizon_ym = f"{hy}-{hm:02d}"
+
+        state = self._get_rollover_state()
+        if state["rollover_validated"] == horizon_ym and state["rollover_version"] == state["data_version"]:
+            self.rollover_skips += 1
+            return False
+
+        self.rollover_runs += 1
+        starts = [v for v in (state["rollover_dirty_from"], state["rollover_validated"]) if v]
+        if starts:
+            py, pm = map(int, min(starts).split('-'))
+        else:
+            pm = cm - 1; py = cy
+            if pm == 0: pm = 12; py -= 1
         self.recalculate_rollovers_from(datetime(py, pm, 1))
+
+        if not state["rollover_validated"]:
+            self._set_rollover_watermark(horizon_ym, self._get_rollover_state()["data_version"])
         return True
 
     def recalculate_rollovers_from(self, start_date):
-        cy, cm = start_date.year, start_date.month
+        # คำนวณยอดยกมาทุกเดือนตั้งแต่ start_date ถึงเดือนถัดไปของปัจจุบันในรอบเดียว:
+        # 1 query ยอดสุทธิรายเดือน + 1 query แถวยอดยกมาเดิม แล้วเขียนเฉพาะแถวที่เปลี่ยนด้วย executemany
         now = datetime.now()
-        has_change = False
-        
+        hy, hm = (now.year + 1, 1) if now.month == 12 else (now.year, now.month + 1)
+        start_ym = f"{start_date.year}-{start_date.month:02d}"
+        horizon_ym = f"{hy}-{hm:02d}"
+        if start_ym >= horizon_ym: return
+
+        nets = {}
+        q = """
+            SELECT ym,
+                   SUM(CASE WHEN item IN ('ยอดยกมา', 'Balance Forward') THEN 0 WHEN type='income' THEN amount ELSE -amount END),
+                   SUM(CASE WHEN item IN ('ยอดยกมา', 'Balance Forward') THEN (CASE WHEN type='income' THEN amount ELSE -amount END) ELSE 0 END)
+            FROM transactions
+            WHERE is_deleted = 0 AND ym >= ? AND ym < ?
+              AND type IN ('income', 'expense', 'repayment') AND (payment_id IS NULL OR type='repayment')
+            GROUP BY ym
+        """
+        for ym, net, bf in self.conn.execute(q, (start_ym, horizon_ym)).fetchall():
+            nets[ym] = (net or 0.0, bf or 0.0)
+
+        bf_rows = {}
+        q = "SELECT ym, id, amount, is_deleted FROM transactions WHERE ym > ? AND ym <= ? AND (item='ยอดยกมา' OR item='Balance Forward') ORDER BY ym, id"
+        for ym, tid, amt, is_del in self.conn.execute(q, (start_ym, horizon_ym)).fetchall():
+            bf_rows.setdefault(ym, []).append((tid, amt, is_del))
+
+        updates, deletes, inserts = [], [], []
+        cy, cm = start_date.year, start_date.month
+        net, carried = nets.get(start_ym, (0.0, 0.0))
+
         while True:
-            nm = cm + 1; ny = cy
-            if nm > 12: nm = 1; ny += 1
-            
-            if (ny > now.year + 5): break 
-            if (ny == now.year and nm > now.month + 1): break
-            
-            bal = self.get_month_balance(cy, cm)
+            ny, nm = (cy + 1, 1) if cm == 12 else (cy, cm + 1)
             nms = f"{ny}-{nm:02d}"
-            td = datetime(ny, nm, 1) 
-            
-            rows = self.conn.execute(
-                "SELECT id, amount, is_deleted FROM transactions WHERE strftime('%Y-%m', date)=? AND (item='ยอดยกมา' OR item='Balance Forward') ORDER BY id", 
-                (nms,)
-            ).fetchall()
-            
-            exist = None
-            if rows:
-                exist = rows[0] 
-                if len(rows) > 1:
-                    for r_dup in rows[1:]:
-                        if r_dup[2] == 0: 
-                            self.conn.execute("UPDATE transactions SET is_deleted=1 WHERE id=?", (r_dup[0],))
-                            has_change = True
+            if nms > horizon_ym: break
 
+            bal = round(net + carried, 2)
+            rows = bf_rows.get(nms, [])
+            exist = rows[0] if rows else None
+            for r_dup in rows[1:]:
+                if r_dup[2] == 0: deletes.append((r_dup[0],))
+
+            carried = 0.0
             if bal > 0:
+                carried = bal
                 if exist:
-                    current_amt = exist[1]
-                    current_status = exist[2]
-                    if abs(current_amt - bal) > 0.01 or current_status == 1:
-                        self.conn.execute("UPDATE transactions SET amount=?, is_deleted=0 WHERE id=?", (bal, exist[0]))
-                        has_change = True
-                else: 
-                    uid = str(uuid.uuid4())
-                    self.conn.execute(
-                        "INSERT INTO transactions (type, item, amount, category, date, payment_id, is_deleted, uuid) VALUES (?,?,?,?,?,NULL,0,?)", 
-                        ("income", "ยอดยกมา", bal, "Others", td, uid)
-                    )
-                    has_change = True
-            else:
-                if exist:
-                    if exist[2] == 0:
-                        self.conn.execute("UPDATE transactions SET is_deleted=1 WHERE id=?", (exist[0],))
-                        has_change = True
-            
-            cm = nm; cy = ny
-            
-        if has_change:
+                    if abs(exist[1] - bal) > 0.01 or exist[2] == 1: updates.append((bal, exist[0]))
+                    else: carried = exist[1]
+                else:
+                    inserts.append(("income", "ยอดยกมา", bal, "Others", datetime(ny, nm, 1), str(uuid.uuid4())))
+            elif exist and exist[2] == 0:
+                deletes.append((exist[0],))
+
+            net = nets.get(nms, (0.0, 0.0))[0]
+            cy, cm = ny, nm
+
+        if updates or deletes or inserts:
+            if updates: self.conn.executemany("UPDATE transactions SET amount=?, is_deleted=0 WHERE id=?", updates)
+            if deletes: self.conn.executemany("UPDATE transactions SET is_deleted=1 WHERE id=?", deletes)
+            if inserts:
+                self.conn.executemany(
+                    "INSERT INTO transactions (type, item, amount, category, date, payment_id, is_deleted, uuid) VALUES (?,?,?,?,?,NULL,0,?)",
+                    inserts
+                )
             self.conn.commit()
-            self._notify()
\ No newline at end of file
+            self._notify()
+
+        # ถ้าช่วงที่คำนวณครอบคลุมทุกเดือนที่ถูกแก้ไข และต่อจากช่วงที่เคย Validate ไว้ -> ขยับ Watermark
+        state = self._get_rollover_state()
+        dirty, validated = state["rollover_dirty_from"], state["rollover_validated"]
+        if (not dirty or dirty >= start_ym) and validated and validated >= start_ym:
+            self._set_rollover_watermark(horizon_ym, state["data_version"])
@@ -0,0 +1,208 @@
+# firebase_stub.py
+# ///////////////////////////////////////////////////////////////
+# Firebase Realtime Database REST API จำลอง (เฉพาะส่วนที่ CloudManager ใช้)
+# รองรับ Keep-alive และ gzip (Response ตาม Accept-Encoding, Request ที่มี Content-Encoding: gzip)
+# ใช้วัด Bandwidth / Latency ของการ Sync ในเครื่อง ไม่ต้องต่อ Internet
+# รัน: python firebase_stub.py [--port 8765] [--latency-ms 50] [--kbps 0]
+# ///////////////////////////////////////////////////////////////
+import argparse
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+# ///////////////////////////////////////////////////////////////
+# [SECTION: TREE HELPERS]
+# ///////////////////////////////////////////////////////////////
+def _split(path):
+    return [p for p in unquote(path).strip("/").split("/") if p]
+
+def _resolve_server_values(value, now_ms):
+    # {".sv": "timestamp"} -> เวลา Server (ms) เหมือน Firebase
+    if isinstance(value, dict):
+        if value.get(".sv") == "timestamp" and len(value) == 1: return now_ms
+        return {k: _resolve_server_values(v, now_ms) for k, v in value.items()}
+    return value
+
+def _prune(value):
+    # Firebase ไม่เก็บ null / dict ว่าง
+    if isinstance(value, dict):
+        out = {k: _prune(v) for k, v in value.items()}
+        out = {k: v for k, v in out.items() if v is not None}
+        return out or None
+    return value
+
+class _Tree:
+    def __init__(self):
+        self.root = None
+        self.lock = threading.Lock()
+        self.last_ms = 0
+
+    def now_ms(self):
+        # เวลาเพิ่มขึ้นเสมอ (ไม่ซ้ำกันระหว่าง Request) เพื่อให้ Watermark ทำงานแน่นอน
+        self.last_ms = max(self.last_ms + 1, int(time.time() * 1000))
+        return self.last_ms
+
+    def get(self, parts):
+        node = self.root
+        for p in parts:
+            if not isinstance(node, dict) or p not in node: return None
+            node = node[p]
+        return node
+
+    def set(self, parts, value):
+        if not parts:
+            self.root = _prune(value); return
+        if not isinstance(self.root, dict): self.root = {}
+        nodes = [self.root]
+        for p in parts[:-1]:
+            if not isinstance(nodes[-1].get(p), dict): nodes[-1][p] = {}
+            nodes.append(nodes[-1][p])
+        value = _prune(value)
+        if value is None: nodes[-1].pop(parts[-1], None)
+        else: nodes[-1][parts[-1]] = value
+        # ตัดเฉพาะ Node ว่างตามเส้นทางที่เขียน (ไม่ Prune ทั้ง Tree ทุกครั้ง -> PATCH หลายพัน Path ไม่ช้าแบบ O(n²))
+        for i in range(len(nodes) - 1, 0, -1):
+            if nodes[i]: break
+            nodes[i - 1].pop(parts[i - 1], None)
+        if not self.root: self.root = None
+
+# ///////////////////////////////////////////////////////////////
+# [SECTION: QUERY]
+# ///////////////////////////////////////////////////////////////
+def _apply_query(node, q):
+    if not isinstance(node, dict): return node
+    if q.get("shallow") == "true":
+        return {k: (True if isinstance(v, dict) else v) for k, v in node.items()}
+    order_by = q.get("orderBy")
+    if order_by is None: return node
+    order_by = json.loads(order_by)
+
+    if order_by in ("$key", "$priority"): key_fn = lambda kv: kv[0]
+    elif order_by == "$value": key_fn = lambda kv: kv[1]
+    else: key_fn = lambda kv: kv[1].get(order_by) if isinstance(kv[1], dict) else None
+
+    # Firebase: ค่า null เรียงก่อนสุด และไม่ผ่านเงื่อนไข startAt/endAt/equalTo
+    items = list(node.items())
+    if any(k in q for k in ("startAt", "endAt", "equalTo")):
+        items = [kv for kv in items if key_fn(kv) is not None]
+    items.sort(key=lambda kv: (key_fn(kv) is not None, key_fn(kv) if key_fn(kv) is not None else 0))
+
+    if "equalTo" in q:
+        val = json.loads(q["equalTo"]); items = [kv for kv in items if key_fn(kv) == val]
+    if "startAt" in q:
+        val = json.loads(q["startAt"]); items = [kv for kv in items if key_fn(kv) >= val]
+    if "endAt" in q:
+        val = json.loads(q["endAt"]); items = [kv for kv in items if key_fn(kv) <= val]
+    if "limitToFirst" in q: items = items[:int(q["limitToFirst"])]
+    if "limitToLast" in q: items = items[-int(q["limitToLast"]):]
+    return dict(items)
+
+# ///////////////////////////////////////////////////////////////
+# [SECTION: SERVER]
+# ///////////////////////////////////////////////////////////////
+class FirebaseStub:
+    def __init__(self, port=0, latency_ms=0, kbps=0):
+        self.tree = _Tree()
+        self.latency = latency_ms / 1000.0
+        self.kbps = kbps  # จำกัด Bandwidth ต่อ Connection (0 = ไม่จำกัด) จำลองเน็ตมือถือ / TCP Window
+        self.stats_lock = threading.Lock()
+        self.fail = None  # f(method, path) -> True ให้ตอบ 503 (จำลองเน็ตหลุด / Server ล่มกลางทาง ใช้ทดสอบ)
+        self.reset_stats()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown(); self.server.server_close()
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {"requests": 0, "bytes_in": 0, "bytes_out": 0, "by_method": {}}
+
+    def get_stats(self):
+        with self.stats_lock: return json.loads(json.dumps(self.stats))
+
+    def _count(self, method, bytes_in, bytes_out):
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            self.stats["bytes_in"] += bytes_in
+            self.stats["bytes_out"] += bytes_out
+            self.stats["by_method"][method] = self.stats["by_method"].get(method, 0) + 1
+
+    def handle(self, method, raw_path, body):
+        url = urlsplit(raw_path)
+        path = url.path
+        if not path.endswith(".json"): return 400, {"error": "path must end with .json"}
+        parts = _split(path[:-5])
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if self.fail and self.fail(method, "/".join(parts)): return 503, {"error": "injected failure"}
+
+        with self.tree.lock:
+            if method == "GET":
+                return 200, _apply_query(self.tree.get(parts), q)
+            data = json.loads(body) if body else None
+            data = _resolve_server_values(data, self.tree.now_ms())
+            if method == "PUT":
+                self.tree.set(parts, data); return 200, data
+            if method == "PATCH":
+                if not isinstance(data, dict): return 400, {"error": "PATCH body must be an object"}
+                for k, v in data.items(): self.tree.set(parts + _split(k), v)
+                return 200, data
+            if method == "DELETE":
+                self.tree.set(parts, None); return 200, None
+        return 405, {"error": "method not allowed"}
+
+    def _make_handler(self):
+        stub = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # Keep-alive: Header กับ Body เขียนแยกกัน ไม่ให้ติด Delayed ACK 40ms
+            def log_message(self, *args): pass
+            def _serve(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                if stub.latency: time.sleep(stub.latency)
+                if stub.kbps: time.sleep(len(body) / (stub.kbps * 1000.0))
+                raw = gzip.decompress(body) if body and self.headers.get("Content-Encoding") == "gzip" else body
+                code, payload = stub.handle(method, self.path, raw.decode("utf-8") if raw else "")
+                out = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                if code == 200 and method != "GET" and "print=silent" in self.path: code, out = 204, b""
+                gzipped = len(out) >= 1024 and "gzip" in (self.headers.get("Accept-Encoding") or "")
+                if gzipped: out = gzip.compress(out, 6)
+                # นับก่อนตอบกลับ เพื่อให้ Client ที่ได้ Response แล้วเห็นสถิติครบ
+                stub._count(method, len(body) + len(self.requestline) + len(str(self.headers)), len(out))
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                if gzipped: self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(out)))
+                self.end_headers()
+                if stub.kbps: time.sleep(len(out) / (stub.kbps * 1000.0))
+                self.wfile.write(out)
+            def do_GET(self): self._serve("GET")
+            def do_PUT(self): self._serve("PUT")
+            def do_PATCH(self): self._serve("PATCH")
+            def do_DELETE(self): self._serve("DELETE")
+        return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Firebase Realtime Database REST stub")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=int, default=0)
+    parser.add_argument("--kbps", type=int, default=0)
+    args = parser.parse_args()
+    stub = FirebaseStub(args.port, args.latency_ms, args.kbps)
+    print(f"Firebase stub listening on {stub.base_url}")
+    try: stub.server.serve_forever()
+    except KeyboardInterrupt: pass
@@ -4,11 +4,8 @@
 # [SECTION 1] IMPORTS & CONFIG
 # ///////////////////////////////////////////////////////////////
 import flet as ft
-import speech_recognition as sr
 import threading
 import time
-import math
-import struct
 import os
 import re
 from datetime import datetime
@@ -17,8 +14,11 @@ from datetime import datetime
 from const import *
 from utils import *
 from database import DatabaseManager
-from cloud import CloudManager
+from cloud import SyncWorker
+from cloud_async import create_cloud_manager
 from ui_components import *
+from audio import VoiceActivityDetector, AudioDeviceManager, SpeechGate
+from recognizer import create_recognizer, log_utterance, SPEECH_END_TIMEOUT
 from settings_ui import open_settings_dialog
 import dialogs
 
@@ -87,10 +87,24 @@ def main(page: ft.Page):
     current_view_mode = start_mode
     
     # [FIX 1] สร้าง CloudManager โดยใส่ config เข้าไป (db ใส่ None ไปก่อน แล้วค่อยเติมทีหลัง)
-    cloud_mgr = CloudManager(None, config)
+    cloud_mgr = create_cloud_manager(None, config)  # config["cloud_engine"]: "sync" (ค่าเริ่มต้น) / "async"
+    # Auto Sync ผ่าน Worker เดียว (Debounce + ทีละรอบ + Backoff ตอน Offline)
+    sync_status_icon = SyncStatusIcon()
+    sync_worker = SyncWorker(cloud_mgr, on_status=sync_status_icon.set_stats)
+    # PortAudio ตัวเดียวทั้งแอป Initialize + เปิด Stream รอไว้ใน Background กดไมค์แล้วเริ่มอัดได้ทันที
+    audio_mgr = AudioDeviceManager(pyaudio.PyAudio) if HAS_PYAUDIO else None
+    if audio_mgr: audio_mgr.prewarm(config.get("capture_profile", "speech"))
     
     # [NEW] ตัวแปรสำหรับ Search
     current_search_query = ""
+    search_total = 0
+    search_loaded = 0
+    last_date_grp = None
+    list_cursor = None  # (date, id) ของแถวสุดท้ายที่โหลดแล้ว สำหรับ Keyset pagination
+    list_has_more = False
+    list_loading = False
+    list_scope = None  # (month, date, search) ที่แสดงอยู่ -> refresh ใน scope เดิมโหลดเท่าจำนวนที่เลื่อนไว้แล้ว
+    trans_cache = TransactionListCache()
 
     def T(key): return TRANSLATIONS[current_lang].get(key, key)
     def safe_show_snack(msg, color="green"):
@@ -145,12 +159,12 @@ def main(page: ft.Page):
         nonlocal current_search_query
         current_search_query = ""
         txt_search.value = ""
-        refresh_ui()
+        refresh_ui(regions=("list",))
 
     def execute_search(e):
         nonlocal current_search_query
         current_search_query = txt_search.value
-        refresh_ui()
+        refresh_ui(regions=("list",))
 
     txt_search = ft.TextField(
         hint_text="Search...",
@@ -167,7 +181,8 @@ def main(page: ft.Page):
     btn_expense = ft.FloatingActionButton(text=T("expense"), icon="mic", bgcolor=COLOR_BTN_EXPENSE, width=130)
     btn_income = ft.FloatingActionButton(text=T("income"), icon="mic", bgcolor=COLOR_BTN_INCOME, width=130)
     
-    trans_list_view = ft.Column(scroll="hidden", expand=True, spacing=5)
+    trans_list_view = ft.ListView(expand=True, spacing=5)
+    btn_load_more = ft.TextButton(T("load_more"), icon="expand_more")
     recurring_list_view = ft.Column(spacing=5, scroll="hidden")
     cards_row = ft.ResponsiveRow(spacing=10, run_spacing=10, visible=False)
     simple_list_view = ft.Column(spacing=2, scroll="hidden", expand=True)
@@ -176,9 +191,17 @@ def main(page: ft.Page):
     def on_date_change(d): 
         nonlocal current_filter_date
         current_filter_date = d
-        refresh_ui()
+        refresh_ui(regions=("summary", "list", "recurring"))
 
-    cal = CalendarWidget(page, on_date_change, current_font_delta, current_font_weight_str)
+    def on_month_change(year, month):
+        # Cloud แบบแยกเดือน: เครื่องใหม่โหลดแค่ไม่กี่เดือนล่าสุด -> เลื่อนไปเดือนเก่าแล้วค่อยดึงเดือนนั้น
+        ym = f"{year:04d}-{month:02d}"
+        if not cloud_mgr.month_pending(ym): return
+        def _load():
+            if cloud_mgr.ensure_month(ym): refresh_ui(regions=("summary", "list", "recurring"))
+        threading.Thread(target=_load, daemon=True).start()
+
+    cal = CalendarWidget(page, on_date_change, current_font_delta, current_font_weight_str, on_month_change)
     
     btn_reset_filter.on_click = lambda e: [cal.reset(), clear_search(None)]
 
@@ -222,8 +245,6 @@ def main(page: ft.Page):
         card_bal.update_style(summary_font_delta, current_font_weight_str)
         card_net.update_style(summary_font_delta, current_font_weight_str)
 
-        cal.update_style(current_font_delta, current_font_weight_str)
-
         if current_filter_date:
             try:
                 dt_obj = datetime.strptime(current_filter_date, "%Y-%m-%d"); formatted = dt_obj.strftime("%d %B %Y"); txt_heading_recent.value = formatted
@@ -233,6 +254,7 @@ def main(page: ft.Page):
         txt_simple_date.value = datetime.now().strftime("%d %B %Y")
         
         btn_reset_filter.text = T("reset_filter"); 
+        btn_load_more.text = T("load_more")
         card_inc.txt_title.value = T("income"); 
         card_exp.txt_title.value = T("expense"); 
         card_bal.txt_title.value = T("balance"); 
@@ -258,6 +280,8 @@ def main(page: ft.Page):
         if not is_real_current_month: return
         
         current_day_val = real_now.day
+        paid_ids = current_db.get_recurring_paid_map(check_month)
+        paid_keys = set()
         
         for r in recs:
             try:
@@ -267,14 +291,21 @@ def main(page: ft.Page):
                 pid, auto = None, 0
             
             if auto == 1 and day <= current_day_val:
-                if not current_db.is_recurring_paid_v2(item_name, amt, cat, check_month, pid):
+                # paid_keys: กันจ่ายซ้ำเมื่อมีรายการประจำ (item, amount, category) เดียวกันหลายแถวในรอบนี้
+                if rid not in paid_ids and (item_name, amt, cat) not in paid_keys:
                     dialogs.pay_recurring_action(page, current_db, refresh_ui, item_name, amt, cat, day, check_month, pid, is_auto=True, suppress_refresh=True)
+                    paid_keys.add((item_name, amt, cat))
 
-    def refresh_ui(new_id=None):
+    def refresh_ui(new_id=None, regions=None):
+        # ทุกจุด (UI, Poller, Cloud, Dialog) ขอ refresh ผ่าน Scheduler -> รวมคำขอที่ถี่ๆ และ render ทีละครั้ง
+        refresh_scheduler.request(regions, new_id=new_id)
+
+    def render_ui(regions, new_id=None):
         if not current_db: return
         
         process_auto_pay()
         update_all_labels()
+        if "calendar" in regions: cal.update_style(current_font_delta, current_font_weight_str)
         
         now = datetime.now()
         is_current_month = (cal.year == now.year and cal.month == now.month)
@@ -292,80 +323,86 @@ def main(page: ft.Page):
         current_db.check_and_rollover(cal.year, cal.month)
         current_month_str = f"{cal.year}-{cal.month:02d}"
         
-        month_name = datetime(cal.year, cal.month, 1).strftime("%B %Y")
-        txt_summary_header.value = f"{T('overview')} ({month_name})"
-        
-        inc, exp, bal = current_db.get_summary(current_month_str)
-        
-        cards_db = current_db.get_cards()
-        total_debt = 0.0
-        
-        if cards_db:
-             for c in cards_db:
-                 total_debt += current_db.get_card_usage(c[0])
-
-        net_worth = bal - total_debt
-
-        card_inc.txt_value.value = f"+{format_currency(inc)}"
-        card_exp.txt_value.value = f"-{format_currency(exp)}"
-        card_bal.txt_value.value = f"{format_currency(bal)}"
-        
-        card_net.txt_value.value = f"{format_currency(net_worth)}"
-        card_net.txt_value.color = COLOR_INCOME if net_worth >= 0 else COLOR_EXPENSE
-        
-        try: limit = float(current_db.get_setting("budget", "10000"))
-        except: limit = 10000.0
-        _, mon_exp, _ = current_db.get_summary(current_month_str)
-        ratio = mon_exp / limit if limit > 0 else 0; pb_budget.value = min(ratio, 1.0); pb_budget.color = COLOR_PRIMARY if ratio < 0.5 else ("orange" if ratio < 0.8 else COLOR_EXPENSE); txt_budget_value.value = f"{format_currency(mon_exp)} / {format_currency(limit)}"
-        
-        cards_row.controls.clear()
-        
-        if cards_db:
-            count = len(cards_db)
-            desktop_span = 12 // min(count, 4) 
-            sm_span = 6 if count > 1 else 12 
-            dynamic_col = {"xs": 12, "sm": sm_span, "md": desktop_span}
-            for c in cards_db: 
-                usage_cumulative = current_db.get_card_usage(c[0])
-                cards_row.controls.append(MiniCardWidget(
-                    c, 
-                    lambda d: dialogs.open_pay_card_dialog(page, current_db, config, refresh_ui, d, current_filter_date),
-                    lambda d: dialogs.open_card_history_dialog(page, current_db, config, refresh_ui, d, cal.year, cal.month),
-                    usage_cumulative, 
-                    col=dynamic_col,
-                    show_balance=True 
-                ))
-            cards_row.visible = True
-        else: 
-            cards_row.visible = False
+        if "summary" in regions or "cards" in regions:
+            cards_db = current_db.get_cards()
+            card_usages = current_db.get_all_card_usages()
+
+        if "summary" in regions:
+            month_name = datetime(cal.year, cal.month, 1).strftime("%B %Y")
+            txt_summary_header.value = f"{T('overview')} ({month_name})"
+            
+            inc, exp, bal = current_db.get_summary(current_month_str)
+            total_debt = sum(card_usages.get(c[0], 0.0) for c in cards_db)
+
+            net_worth = bal - total_debt
+
+            card_inc.txt_value.value = f"+{format_currency(inc)}"
+            card_exp.txt_value.value = f"-{format_currency(exp)}"
+            card_bal.txt_value.value = f"{format_currency(bal)}"
+            
+            card_net.txt_value.value = f"{format_currency(net_worth)}"
+            card_net.txt_value.color = COLOR_INCOME if net_worth >= 0 else COLOR_EXPENSE
+            
+            try: limit = float(current_db.get_setting("budget", "10000"))
+            except: limit = 10000.0
+            mon_exp = exp
+            ratio = mon_exp / limit if limit > 0 else 0; pb_budget.value = min(ratio, 1.0); pb_budget.color = COLOR_PRIMARY if ratio < 0.5 else ("orange" if ratio < 0.8 else COLOR_EXPENSE); txt_budget_value.value = f"{format_currency(mon_exp)} / {format_currency(limit)}"
         
+        if "cards" in regions:
+            cards_row.controls.clear()
+            
+            if cards_db:
+                count = len(cards_db)
+                desktop_span = 12 // min(count, 4) 
+                sm_span = 6 if count > 1 else 12 
+                dynamic_col = {"xs": 12, "sm": sm_span, "md": desktop_span}
+                for c in cards_db: 
+                    usage_cumulative = card_usages.get(c[0], 0.0)
+                    cards_row.controls.append(MiniCardWidget(
+                        c, 
+                        lambda d: dialogs.open_pay_card_dialog(page, current_db, config, refresh_ui, d, current_filter_date),
+                        lambda d: dialogs.open_card_history_dialog(page, current_db, config, refresh_ui, d, cal.year, cal.month),
+                        usage_cumulative, 
+                        col=dynamic_col,
+                        show_balance=True 
+                    ))
+        cards_row.visible = bool(cards_row.controls) and not current_search_query
+        
+        animated_card = None
+        if "list" in regions:
+            animated_card = render_trans_list(current_month_str, new_id)
+        if "recurring" in regions and current_view_mode == "full":
+            update_recurring_list()
+        if current_search_query: txt_heading_recent.value = f"Search: '{current_search_query}' ({search_total})"
+
+        page.update()
+        if animated_card: trans_list_view.scroll_to(offset=0, duration=500); animated_card.opacity = 1; animated_card.update()
+
+    def render_trans_list(current_month_str, new_id=None):
+        nonlocal search_total, search_loaded, list_has_more, list_scope
+        scope = (current_month_str, current_filter_date, current_search_query)
+        keep_depth = (scope == list_scope); list_scope = scope
         rows = []
         if current_search_query:
-            rows = current_db.search_transactions(current_search_query)
-            txt_heading_recent.value = f"Search: '{current_search_query}' ({len(rows)})"
-            cards_row.visible = False 
+            rows = current_db.search_transactions(current_search_query, limit=max(SEARCH_PAGE_SIZE, search_loaded) if keep_depth else SEARCH_PAGE_SIZE)
+            search_total = current_db.count_search_transactions(current_search_query)
+            search_loaded = len(rows)
         else:
-            cards_row.visible = True if current_db.get_cards() else False
-            rows = current_db.get_transactions(current_filter_date, month_filter=current_month_str)
+            page_limit = max(TRANS_PAGE_SIZE, count_loaded_cards()) if keep_depth else TRANS_PAGE_SIZE
+            rows = current_db.get_transactions_page(current_month_str, limit=page_limit, date_filter=current_filter_date)
+            list_has_more = len(rows) == page_limit
         
         d_font_delta, d_font_weight = get_font_specs()
 
-        def call_delete(tid):
-            dialogs.confirm_delete(page, current_db, config, refresh_ui, tid)
-        def call_edit(data):
-            dialogs.open_edit_dialog(page, current_db, config, refresh_ui, data)
-
         if current_view_mode == "full":
-            trans_list_view.controls.clear(); animated_card = None; current_date_grp = None
-            for r in rows:
-                dt_obj = parse_db_date(r[5]); date_str = dt_obj.strftime("%d %B %Y")
-                if date_str != current_date_grp: current_date_grp = date_str; trans_list_view.controls.append(ft.Container(content=ft.Text(date_str, size=12+d_font_delta, weight="bold", color="grey"), padding=ft.padding.only(top=10, bottom=5)))
-                is_new = (r[0] == new_id)
-                card = TransactionCard(r, call_delete, call_edit, d_font_delta, d_font_weight, is_new=is_new, minimal=False)
-                trans_list_view.controls.append(card)
-                if is_new: animated_card = card
-            update_recurring_list(); page.update()
-            if animated_card: trans_list_view.scroll_to(offset=0, duration=500); animated_card.opacity = 1; animated_card.update()
+            # Diff กับรายการเดิม: การ์ดที่ไม่เปลี่ยนเป็น Control ตัวเดิม จึงไม่ถูกส่งไป Client ซ้ำ
+            new_controls, animated_card = build_trans_controls(rows, new_id=new_id, reset_group=True)
+            if has_more_rows(): new_controls.append(btn_load_more)
+            old_controls = trans_list_view.controls
+            if len(old_controls) != len(new_controls) or any(a is not b for a, b in zip(old_controls, new_controls)):
+                trans_list_view.controls = new_controls
+            trans_cache.prune(new_controls)
+            return animated_card
         
         elif current_view_mode == "simple":
             simple_list_view.controls.clear(); limit_rows = rows[:6]
@@ -393,7 +430,63 @@ def main(page: ft.Page):
                 for r in limit_rows: 
                     card = TransactionCard(r, call_delete, call_edit, d_font_delta, d_font_weight, minimal=True)
                     simple_list_view.controls.append(card)
-            page.update()
+        return None
+
+    refresh_scheduler = RefreshScheduler(render_ui)
+
+    def call_delete(tid):
+        dialogs.confirm_delete(page, current_db, config, refresh_ui, tid)
+    def call_edit(data):
+        dialogs.open_edit_dialog(page, current_db, config, refresh_ui, data)
+
+    def build_trans_controls(rows, new_id=None, reset_group=False):
+        # สร้าง TransactionCard (พร้อมหัวข้อวันที่) จาก Cache -> (controls, การ์ดที่เพิ่งบันทึก)
+        nonlocal last_date_grp, list_cursor
+        if reset_group: last_date_grp = None; list_cursor = None
+        d_font_delta, d_font_weight = get_font_specs()
+        controls = []; animated_card = None
+        for r in rows:
+            dt_obj = parse_db_date(r[5]); date_str = dt_obj.strftime("%d %B %Y")
+            if date_str != last_date_grp: last_date_grp = date_str; controls.append(trans_cache.header(date_str, d_font_delta, top_padding=10))
+            is_new = (r[0] == new_id)
+            card, _ = trans_cache.card(r, call_delete, call_edit, d_font_delta, d_font_weight, is_new=is_new, minimal=False)
+            controls.append(card)
+            if is_new: animated_card = card
+        if rows: list_cursor = (rows[-1][5], rows[-1][0])
+        return controls, animated_card
+
+    def count_loaded_cards():
+        return sum(1 for c in trans_list_view.controls if isinstance(c, TransactionCard))
+
+    def has_more_rows():
+        return (search_loaded < search_total) if current_search_query else list_has_more
+
+    def load_more_rows(e=None):
+        # โหลดหน้าถัดไปต่อท้าย (ส่งไป Client เฉพาะการ์ดชุดใหม่)
+        nonlocal search_total, search_loaded, list_has_more, list_loading
+        if not current_db or list_loading or not has_more_rows(): return
+        list_loading = True
+        try:
+            if current_search_query:
+                rows = current_db.search_transactions(current_search_query, limit=SEARCH_PAGE_SIZE, offset=search_loaded)
+                search_loaded += len(rows)
+                if not rows: search_total = search_loaded
+            else:
+                rows = current_db.get_transactions_page(f"{cal.year}-{cal.month:02d}", after=list_cursor, limit=TRANS_PAGE_SIZE, date_filter=current_filter_date)
+                list_has_more = len(rows) == TRANS_PAGE_SIZE
+            if btn_load_more in trans_list_view.controls: trans_list_view.controls.remove(btn_load_more)
+            trans_list_view.controls.extend(build_trans_controls(rows)[0])
+            if rows and has_more_rows(): trans_list_view.controls.append(btn_load_more)
+            trans_list_view.update()
+        finally:
+            list_loading = False
+
+    def on_list_scroll(e):
+        # Infinite scroll: ใกล้ถึงท้ายรายการแล้วโหลดหน้าถัดไป
+        if e.max_scroll_extent and e.pixels >= e.max_scroll_extent - 300: load_more_rows()
+
+    btn_load_more.on_click = load_more_rows
+    trans_list_view.on_scroll = on_list_scroll
 
     def update_recurring_list():
         d_font_delta, d_font_weight = get_font_specs()
@@ -411,6 +504,7 @@ def main(page: ft.Page):
         check_month = f"{cal.year}-{cal.month:02d}"
         now = datetime.now()
         current_day_ref = now.day if cal.year == now.year and cal.month == now.month else (31 if datetime(cal.year, cal.month, 1) < now else 0)
+        paid_ids = current_db.get_recurring_paid_map(check_month)
 
         for r in recs:
             try:
@@ -419,7 +513,7 @@ def main(page: ft.Page):
                 rid, day, item_name, amt, cat = r[:5]
                 pid, auto = None, 0
             
-            is_paid = current_db.is_recurring_paid_v2(item_name, amt, cat, check_month, pid)
+            is_paid = rid in paid_ids
             
             recs_data.append({'data': r, 'is_paid': is_paid, 'day': day, 'auto': auto, 'pid': pid})
 
@@ -507,6 +601,7 @@ def main(page: ft.Page):
     # [SECTION 8] VOICE SYSTEM
     # ///////////////////////////////////////////////////////////////
     def start_listen(e, t_type):
+        pressed_at = time.perf_counter()  # Time-to-first-frame นับจากกดปุ่ม (รวมเปิด Dialog + ส่งต่อให้ Thread อัดเสียง)
         now = datetime.now()
         is_current_month = (cal.year == now.year and cal.month == now.month)
         is_date_selected = (current_filter_date is not None)
@@ -545,7 +640,7 @@ def main(page: ft.Page):
         )
         page.open(dlg_listen)
 
-        def process_result(text):
+        def process_result(text, on_parsed=None):
             try: page.close(dlg_listen)
             except: pass
             
@@ -581,6 +676,8 @@ def main(page: ft.Page):
                  nums = re.findall(r"[-+]?\d*\.\d+|\d+", clean)
                  if nums: amt_val = float(nums[0])
             
+            if on_parsed: on_parsed()  # จด Latency ตั้งแต่เสียงพูดเฟรมสุดท้ายจนแยกรายการเสร็จ
+
             if amt_val == 0.0: 
                 safe_show_snack("Could not detect amount, please enter manually.", "orange")
 
@@ -669,13 +766,22 @@ def main(page: ft.Page):
                 page.update()
                 return
             
-            p = pyaudio.PyAudio()
             stream = None
+            recognizer = None
+            finished = False
             try:
-                stream = p.open(format=pyaudio.paInt16, channels=1, rate=44100, input=True, frames_per_buffer=1024)
-                frames = []
+                # Profile "speech" = 16 kHz (อุปกรณ์ไม่รองรับจะ Resample ให้), "hifi" = 44.1 kHz แบบเดิม
+                stream = audio_mgr.acquire(config.get("capture_profile", "speech"), pressed_at)
+                read_failed = False
                 silence_start = None
                 has_spoken = False
+                vad = VoiceActivityDetector(stream.rate, stream.frames)
+                gate = SpeechGate(vad, 1000.0 * stream.frames / stream.rate)  # ตัดเสียงเงียบหัว/ท้ายก่อนส่งเข้า Recognizer
+                # ส่งเสียงเข้า Recognizer ตั้งแต่เริ่มพูด (Backend แบบ Streaming ถอดไปพร้อมกัน) ไม่ต้องเก็บทั้งก้อนรอจบ
+                recognizer = create_recognizer(config)
+                try: end_timeout = float(config.get("speech_end_timeout", SPEECH_END_TIMEOUT))
+                except: end_timeout = SPEECH_END_TIMEOUT
+                last_voiced = None
                 
                 # [UPDATED] จับเวลาเริ่มต้นเพื่อ Limit 10 วินาที
                 recording_start_time = time.time()
@@ -687,39 +793,45 @@ def main(page: ft.Page):
                         if time.time() - recording_start_time > TIMEOUT_SECONDS:
                             break  # ตัดจบการบันทึกทันทีเมื่อครบ 10 วินาที
 
-                        data = stream.read(1024, exception_on_overflow=False)
-                        shorts = struct.unpack("%dh"%(len(data)//2), data)
-                        rms = math.sqrt(sum(s**2 for s in shorts) / len(shorts))
-                        visualizer.update_volume(rms)
-                        
-                        # [UPDATED] ปรับ Threshold เป็น 500 เพื่อลดเสียงรบกวน
-                        if rms > 500: 
+                        # Energy + ZCR เทียบกับ Noise floor ของห้อง (แทน Threshold คงที่ rms > 500)
+                        chunks = gate.process(stream.read())
+                        visualizer.update_volume(vad.rms)
+                        if vad.voiced: last_voiced = time.perf_counter()
+                        if chunks: 
+                            if not has_spoken: recognizer.start(stream.rate, 2)
                             has_spoken = True
                             silence_start = None
-                            frames.append(data)
+                            for c in chunks: recognizer.feed(c)
                         elif has_spoken:
-                            frames.append(data)
                             if silence_start is None: silence_start = time.time()
-                            elif time.time() - silence_start > 2.0: break
-                    except: break 
+                            elif time.time() - silence_start > end_timeout: break
+                    except: read_failed = True; break  # เช่นถอดไมค์ระหว่างอัด -> Initialize อุปกรณ์ใหม่ครั้งหน้า
                 
-                if stream: stream.stop_stream(); stream.close(); p.terminate()
+                if stream: audio_mgr.release(stream, read_failed); stream = None
                 try: page.close(dlg_listen)
                 except: pass
                 
-                if frames and has_spoken:
-                    safe_show_snack("Processing...", "blue")
-                    r = sr.Recognizer()
+                if has_spoken:
+                    for c in gate.tail(): recognizer.feed(c)
+                    timing = {"last_voiced": last_voiced or time.perf_counter(), "stopped": time.perf_counter()}
+                    if not recognizer.streaming: safe_show_snack("Processing...", "blue")
                     try: 
-                        text_res = r.recognize_google(sr.AudioData(b''.join(frames), 44100, 2), language="th")
-                        safe_show_snack(f"Raw: {text_res}", "blue") 
-                        process_result(text_res)
-                    except sr.UnknownValueError: safe_show_snack("Could not understand audio", "red")
+                        finished = True  # finish() ปิด Worker เอง (สำเร็จหรือไม่ก็ตาม)
+                        text_res = recognizer.finish()
+                        timing["text"] = time.perf_counter()
+                        if text_res:
+                            safe_show_snack(f"Raw: {text_res}", "blue") 
+                            process_result(text_res, lambda: log_utterance(recognizer, dict(timing, parsed=time.perf_counter()), gate.bytes_in))
+                        else: safe_show_snack("Could not understand audio", "red")
                     except Exception as e: safe_show_snack(f"Error: {e}", "red")
                 else: safe_show_snack("No speech detected", "orange")
             except Exception as e: 
+                if stream: audio_mgr.release(stream, True)
                 try: page.close(dlg_listen)
                 except: pass
+            finally:
+                # หลุดก่อน finish() -> หยุด Worker ของ Backend แบบ Streaming ไม่ให้ค้างรอคิวทุกครั้งที่อัดไม่สำเร็จ
+                if recognizer and not finished: recognizer.cancel()
 
         threading.Thread(target=record_thread, daemon=True).start()
 
@@ -731,7 +843,7 @@ def main(page: ft.Page):
     # ///////////////////////////////////////////////////////////////
     def build_full_view():
         sidebar = ft.Container(width=320, padding=ft.padding.only(left=20, right=20, top=10, bottom=20), bgcolor=COLOR_SURFACE, border_radius=15, content=ft.Column([
-            ft.Row([txt_app_title, ft.Container(expand=True), btn_settings], alignment="spaceBetween"),
+            ft.Row([txt_app_title, ft.Container(expand=True), sync_status_icon, btn_settings], alignment="spaceBetween"),
             cal,
             ft.Container(content=btn_reset_filter, alignment=ft.alignment.center),
             ft.Divider(),
@@ -813,7 +925,7 @@ def main(page: ft.Page):
             page.window.min_height = 800
             
         page.update()
-        refresh_ui()
+        refresh_ui(); refresh_scheduler.flush()
         main_container.opacity = 1
         main_container.update()
         
@@ -842,10 +954,10 @@ def main(page: ft.Page):
             else:
                 # ถ้าปกติ ให้ Sync ตามเดิม
                 print("App Start: Syncing with Cloud...")            
-                cloud_mgr.sync_data(callback=lambda msg: print(f"Cloud: {msg}"))
+                sync_worker.request(callback=lambda msg: print(f"Cloud: {msg}"))
             
-            # ตั้งค่าให้ Sync ทุกครั้งที่มีการแก้ไขข้อมูลใน DB
-            current_db.on_data_changed = lambda: cloud_mgr.sync_data()
+            # ตั้งค่าให้ Sync ทุกครั้งที่มีการแก้ไขข้อมูลใน DB (Worker รวมการแก้ไขติดๆ กันเป็นรอบเดียว)
+            current_db.on_data_changed = sync_worker.request
             
         cal.set_db(current_db)
         switch_view(current_view_mode, should_center=False)
@@ -865,30 +977,21 @@ def main(page: ft.Page):
             dlg.content = ft.Text(f"Could not find: {db_path}"); dlg.actions = [ft.TextButton("Create New", on_click=create_new), ft.TextButton("Browse...", on_click=lambda _: pick_dialog.pick_files(allowed_extensions=["db"]))]; page.open(dlg)
 
     def start_auto_sync():
+        # เฝ้าดูการเปลี่ยนแปลงด้วย PRAGMA data_version + change_log (แทนการ stat ไฟล์ DB/WAL ทุก 2 วินาที)
+        # การเขียนของเราเองถูกข้าม (UI refresh ไปแล้ว) และเว้นช่วงห่างขึ้นเรื่อยๆ (Backoff) เมื่อไม่มีอะไรเปลี่ยน
         def sync_loop():
-            current_conf = load_config()
-            target_path = current_conf.get("db_path", "modern_money.db")
-            
-            if not os.path.isabs(target_path):
-                base_dir = os.path.dirname(os.path.abspath(__file__))
-                target_path = os.path.join(base_dir, target_path)
-
-            last_mtime = 0
-            if os.path.exists(target_path):
-                last_mtime = os.path.getmtime(target_path)
-
+            interval = WATCH_MIN_INTERVAL
             while True:
-                time.sleep(2) 
+                time.sleep(interval)
                 try:
-                    if os.path.exists(target_path):
-                        current_mtime = os.path.getmtime(target_path)
-                        wal_path = target_path + "-wal"
-                        if os.path.exists(wal_path):
-                            current_mtime = max(current_mtime, os.path.getmtime(wal_path))
-
-                        if current_mtime != last_mtime:
-                            last_mtime = current_mtime
-                            refresh_ui()
+                    if not current_db: continue
+                    changed = current_db.poll_changes()
+                    regions = set(r for t in changed for r in TABLE_REGIONS.get(t, ()))
+                    if regions:
+                        refresh_ui(regions=regions)
+                        interval = WATCH_MIN_INTERVAL
+                    else:
+                        interval = min(interval * 2, WATCH_MAX_INTERVAL)
                 except Exception as e:
                     print(f"Sync Error: {e}")
         
@@ -14,7 +14,8 @@ from datetime import datetime
 from const import *
 from utils import *
 from database import DatabaseManager
-from cloud import CloudManager
+from cloud import SyncWorker
+from cloud_async import create_cloud_manager
 from ui_components import *
 # [CHANGE] Import settings functions separately
 import settings_ui 
@@ -92,9 +93,20 @@ def real_main(page: ft.Page):
     current_lang = config.get("lang", "th")
     
     # [FIX 1] สร้าง CloudManager โดยส่ง config เข้าไป
-    cloud_mgr = CloudManager(None, config)
+    cloud_mgr = create_cloud_manager(None, config)  # config["cloud_engine"]: "sync" (ค่าเริ่มต้น) / "async"
+    # Auto Sync ผ่าน Worker เดียว (Debounce + ทีละรอบ + Backoff ตอน Offline)
+    sync_status_icon = SyncStatusIcon()
+    sync_worker = SyncWorker(cloud_mgr, on_status=sync_status_icon.set_stats)
     
     current_search_query = ""
+    search_total = 0
+    search_loaded = 0
+    last_date_grp = None
+    list_cursor = None  # (date, id) ของแถวสุดท้ายที่โหลดแล้ว สำหรับ Keyset pagination
+    list_has_more = False
+    list_loading = False
+    list_scope = None  # (month, date, search) ที่แสดงอยู่ -> refresh ใน scope เดิมโหลดเท่าจำนวนที่เลื่อนไว้แล้ว
+    trans_cache = TransactionListCache()
 
     def T(key): return TRANSLATIONS[current_lang].get(key, key)
     def safe_show_snack(msg, color="green"):
@@ -237,8 +249,9 @@ def real_main(page: ft.Page):
         cards_db = current_db.get_cards()
         
         if cards_db:
+             card_usages = current_db.get_all_card_usages()
              for c in cards_db:
-                 usage = current_db.get_card_usage(c[0])
+                 usage = card_usages.get(c[0], 0.0)
                  mc = MiniCardWidget(
                     c, 
                     lambda d: [page.close(dlg_cards), dialogs.open_pay_card_dialog(page, current_db, config, refresh_ui, d, current_filter_date)],
@@ -319,19 +332,90 @@ def real_main(page: ft.Page):
     # --- 5. Transactions List ---
     txt_heading_recent = ft.Text(T("recent_trans"), size=16, weight="bold")
     trans_list_view = ft.Column(spacing=2) 
+    empty_list_placeholder = ft.Container(
+        content=ft.Column([
+            ft.Icon(name="note_add", size=48, color=COLOR_SURFACE),
+            ft.Text(T("no_items"), color="grey")
+        ], horizontal_alignment="center", spacing=10),
+        alignment=ft.alignment.center,
+        padding=40
+    )
     
+    def call_delete(tid):
+        dialogs.confirm_delete(page, current_db, config, refresh_ui, tid)
+    def call_edit(data):
+        dialogs.open_edit_dialog(page, current_db, config, refresh_ui, data)
+
+    def build_trans_controls(rows, new_id=None, reset_group=False):
+        # สร้างรายการ (พร้อมหัวข้อวันที่) จาก Cache โดยจำกลุ่มวันที่ล่าสุดไว้สำหรับหน้าถัดไป
+        nonlocal last_date_grp, list_cursor
+        if reset_group: last_date_grp = None; list_cursor = None
+        d_font_delta, d_font_weight = get_font_specs()
+        controls = []
+        for r in rows:
+            dt_obj = parse_db_date(r[5])
+            date_str = dt_obj.strftime("%d %B %Y")
+            
+            if date_str != last_date_grp: 
+                last_date_grp = date_str
+                controls.append(trans_cache.header(date_str, d_font_delta, top_padding=15))
+            
+            is_new = (r[0] == new_id)
+            card, _ = trans_cache.card(r, call_delete, call_edit, d_font_delta, d_font_weight, is_new=is_new, minimal=True)
+            controls.append(card)
+            
+            if is_new: 
+                card.bgcolor = "#2C2C2C"
+            elif card.bgcolor != COLOR_SURFACE:
+                card.bgcolor = COLOR_SURFACE
+        
+        if rows: list_cursor = (rows[-1][5], rows[-1][0])
+        return controls
+
+    def count_loaded_cards():
+        return sum(1 for c in trans_list_view.controls if isinstance(c, TransactionCard))
+
+    def has_more_rows():
+        return (search_loaded < search_total) if current_search_query else list_has_more
+
+    def load_more_rows(e=None):
+        # โหลดหน้าถัดไปต่อท้าย (ส่งไป Client เฉพาะการ์ดชุดใหม่)
+        nonlocal search_total, search_loaded, list_has_more, list_loading
+        if not current_db or list_loading or not has_more_rows(): return
+        list_loading = True
+        try:
+            if current_search_query:
+                rows = current_db.search_transactions(current_search_query, limit=SEARCH_PAGE_SIZE, offset=search_loaded)
+                search_loaded += len(rows)
+                if not rows: search_total = search_loaded
+            else:
+                rows = current_db.get_transactions_page(f"{cal.year}-{cal.month:02d}", after=list_cursor, limit=TRANS_PAGE_SIZE, date_filter=current_filter_date)
+                list_has_more = len(rows) == TRANS_PAGE_SIZE
+            if btn_load_more in trans_list_view.controls: trans_list_view.controls.remove(btn_load_more)
+            trans_list_view.controls.extend(build_trans_controls(rows))
+            if rows and has_more_rows(): trans_list_view.controls.append(btn_load_more)
+            trans_list_view.update()
+        finally:
+            list_loading = False
+
+    def on_list_scroll(e):
+        # Infinite scroll: ใกล้ถึงท้ายหน้าจอแล้วโหลดหน้าถัดไป
+        if e.max_scroll_extent and e.pixels >= e.max_scroll_extent - 300: load_more_rows()
+
+    btn_load_more = ft.TextButton(T("load_more"), icon="expand_more", on_click=load_more_rows)
+
     # Search UI
     def clear_search(e):
         nonlocal current_search_query
         current_search_query = ""
         txt_search.value = ""
         btn_search_icon.icon = "search"
-        refresh_ui()
+        refresh_ui(regions=("list",))
 
     def execute_search(e):
         nonlocal current_search_query
         current_search_query = txt_search.value
-        refresh_ui()
+        refresh_ui(regions=("list",))
     
     is_search_visible = False
     txt_search = ft.TextField(
@@ -364,9 +448,17 @@ def real_main(page: ft.Page):
     def on_date_change(d): 
         nonlocal current_filter_date
         current_filter_date = d
-        refresh_ui()
+        refresh_ui(regions=("summary", "list"))
     
-    cal = CalendarWidget(page, on_date_change, current_font_delta, current_font_weight_str)
+    def on_month_change(year, month):
+        # Cloud แบบแยกเดือน: เครื่องใหม่โหลดแค่ไม่กี่เดือนล่าสุด -> เลื่อนไปเดือนเก่าแล้วค่อยดึงเดือนนั้น
+        ym = f"{year:04d}-{month:02d}"
+        if not cloud_mgr.month_pending(ym): return
+        def _load():
+            if cloud_mgr.ensure_month(ym): refresh_ui(regions=("summary", "list"))
+        threading.Thread(target=_load, daemon=True).start()
+
+    cal = CalendarWidget(page, on_date_change, current_font_delta, current_font_weight_str, on_month_change)
 
     # ///////////////////////////////////////////////////////////////
     # [SECTION 5] CORE LOGIC (REFRESH & UPDATE)
@@ -392,12 +484,12 @@ def real_main(page: ft.Page):
         card_inc.txt_title.value = T("income")
         card_exp.txt_title.value = T("expense")
         card_net.txt_title.value = "Net Worth" if current_lang == "en" else "ความมั่งคั่งสุทธิ"
+        empty_list_placeholder.content.controls[1].value = T("no_items")
+        btn_load_more.text = T("load_more")
         
         for c in [card_inc, card_exp, card_net]:
             c.update_style(summary_font_delta, current_font_weight_str)
 
-        cal.update_style(current_font_delta, current_font_weight_str)
-
         try:
             base_w = int(current_font_weight_str.replace("w", ""))
             bal_w = min(base_w + 100, 900)
@@ -434,6 +526,8 @@ def real_main(page: ft.Page):
         if not is_real_current_month: return
         
         current_day_val = real_now.day
+        paid_ids = current_db.get_recurring_paid_map(check_month)
+        paid_keys = set()
         
         for r in recs:
             try:
@@ -443,14 +537,21 @@ def real_main(page: ft.Page):
                 pid, auto = None, 0
             
             if auto == 1 and day <= current_day_val:
-                if not current_db.is_recurring_paid_v2(item_name, amt, cat, check_month, pid):
+                # paid_keys: กันจ่ายซ้ำเมื่อมีรายการประจำ (item, amount, category) เดียวกันหลายแถวในรอบนี้
+                if rid not in paid_ids and (item_name, amt, cat) not in paid_keys:
                     dialogs.pay_recurring_action(page, current_db, refresh_ui, item_name, amt, cat, day, check_month, pid, is_auto=True, suppress_refresh=True)
+                    paid_keys.add((item_name, amt, cat))
+
+    def refresh_ui(new_id=None, regions=None):
+        # ทุกจุด (UI, Poller, Cloud, Dialog) ขอ refresh ผ่าน Scheduler -> รวมคำขอที่ถี่ๆ และ render ทีละครั้ง
+        refresh_scheduler.request(regions, new_id=new_id)
 
-    def refresh_ui(new_id=None):
+    def render_ui(regions, new_id=None):
         if not current_db: return
         
         process_auto_pay()
         update_all_labels()
+        if "calendar" in regions: cal.update_style(current_font_delta, current_font_weight_str)
         
         now = datetime.now()
         is_current_month = (cal.year == now.year and cal.month == now.month)
@@ -468,83 +569,64 @@ def real_main(page: ft.Page):
         month_name = datetime(cal.year, cal.month, 1).strftime("%B %Y")
         txt_month_header.value = month_name
         
-        inc, exp, bal = current_db.get_summary(current_month_str)
-        
-        cards_db = current_db.get_cards()
-        total_debt = 0.0
-        
-        if cards_db:
-             for c in cards_db:
-                 total_debt += current_db.get_card_usage(c[0])
+        if "summary" in regions:
+            inc, exp, bal = current_db.get_summary(current_month_str)
+            
+            cards_db = current_db.get_cards()
+            card_usages = current_db.get_all_card_usages()
+            total_debt = sum(card_usages.get(c[0], 0.0) for c in cards_db)
 
-        net_worth = bal - total_debt
+            net_worth = bal - total_debt
 
-        card_inc.txt_value.value = f"+{format_currency(inc)}"
-        card_exp.txt_value.value = f"-{format_currency(exp)}"
-        card_net.txt_value.value = f"{format_currency(net_worth)}"
-        card_net.txt_value.color = COLOR_INCOME if net_worth >= 0 else COLOR_EXPENSE
-        
-        txt_main_balance.value = f"{format_currency(bal)}"
-        txt_main_balance.color = COLOR_PRIMARY if bal >= 0 else COLOR_EXPENSE
-        
-        try: limit = float(current_db.get_setting("budget", "10000"))
-        except: limit = 10000.0
-        _, mon_exp, _ = current_db.get_summary(current_month_str)
-        ratio = mon_exp / limit if limit > 0 else 0
-        pb_budget.value = min(ratio, 1.0)
-        pb_budget.color = COLOR_PRIMARY if ratio < 0.5 else ("orange" if ratio < 0.8 else COLOR_EXPENSE)
-        txt_budget_value.value = f"{format_currency(mon_exp)} / {format_currency(limit)}"
-        
+            card_inc.txt_value.value = f"+{format_currency(inc)}"
+            card_exp.txt_value.value = f"-{format_currency(exp)}"
+            card_net.txt_value.value = f"{format_currency(net_worth)}"
+            card_net.txt_value.color = COLOR_INCOME if net_worth >= 0 else COLOR_EXPENSE
+            
+            txt_main_balance.value = f"{format_currency(bal)}"
+            txt_main_balance.color = COLOR_PRIMARY if bal >= 0 else COLOR_EXPENSE
+            
+            try: limit = float(current_db.get_setting("budget", "10000"))
+            except: limit = 10000.0
+            mon_exp = exp
+            ratio = mon_exp / limit if limit > 0 else 0
+            pb_budget.value = min(ratio, 1.0)
+            pb_budget.color = COLOR_PRIMARY if ratio < 0.5 else ("orange" if ratio < 0.8 else COLOR_EXPENSE)
+            txt_budget_value.value = f"{format_currency(mon_exp)} / {format_currency(limit)}"
+        
+        if "list" in regions:
+            render_trans_list(current_month_str, new_id)
+        if current_search_query:
+            txt_heading_recent.value = f"Search: '{current_search_query}' ({search_total})"
+
+        page.update()
+
+    def render_trans_list(current_month_str, new_id=None):
+        nonlocal search_total, search_loaded, list_has_more, list_scope
+        scope = (current_month_str, current_filter_date, current_search_query)
+        keep_depth = (scope == list_scope); list_scope = scope
         rows = []
         if current_search_query:
-            rows = current_db.search_transactions(current_search_query)
-            txt_heading_recent.value = f"Search: '{current_search_query}' ({len(rows)})"
+            rows = current_db.search_transactions(current_search_query, limit=max(SEARCH_PAGE_SIZE, search_loaded) if keep_depth else SEARCH_PAGE_SIZE)
+            search_total = current_db.count_search_transactions(current_search_query)
+            search_loaded = len(rows)
         else:
-            rows = current_db.get_transactions(current_filter_date, month_filter=current_month_str)
-        
-        d_font_delta, d_font_weight = get_font_specs()
+            page_limit = max(TRANS_PAGE_SIZE, count_loaded_cards()) if keep_depth else TRANS_PAGE_SIZE
+            rows = current_db.get_transactions_page(current_month_str, limit=page_limit, date_filter=current_filter_date)
+            list_has_more = len(rows) == page_limit
 
-        def call_delete(tid):
-            dialogs.confirm_delete(page, current_db, config, refresh_ui, tid)
-        def call_edit(data):
-            dialogs.open_edit_dialog(page, current_db, config, refresh_ui, data)
-
-        trans_list_view.controls.clear()
-        
-        if not rows:
-            trans_list_view.controls.append(
-                ft.Container(
-                    content=ft.Column([
-                        ft.Icon(name="note_add", size=48, color=COLOR_SURFACE),
-                        ft.Text(T("no_items"), color="grey")
-                    ], horizontal_alignment="center", spacing=10),
-                    alignment=ft.alignment.center,
-                    padding=40
-                )
-            )
+        # Diff กับรายการเดิม: การ์ดที่ไม่เปลี่ยนเป็น Control ตัวเดิม จึงไม่ถูกส่งไป Client ซ้ำ
+        new_controls = [] if rows else [empty_list_placeholder]
+        new_controls += build_trans_controls(rows, new_id=new_id, reset_group=True)
+        if has_more_rows():
+            new_controls.append(btn_load_more)
         
-        current_date_grp = None
-        for r in rows:
-            dt_obj = parse_db_date(r[5])
-            date_str = dt_obj.strftime("%d %B %Y")
-            
-            if date_str != current_date_grp: 
-                current_date_grp = date_str
-                trans_list_view.controls.append(
-                    ft.Container(
-                        content=ft.Text(date_str, size=12+d_font_delta, weight="bold", color="grey"), 
-                        padding=ft.padding.only(top=15, bottom=5)
-                    )
-                )
-            
-            is_new = (r[0] == new_id)
-            card = TransactionCard(r, call_delete, call_edit, d_font_delta, d_font_weight, is_new=is_new, minimal=True)
-            trans_list_view.controls.append(card)
-            
-            if is_new: 
-                card.bgcolor = "#2C2C2C"
+        old_controls = trans_list_view.controls
+        if len(old_controls) != len(new_controls) or any(a is not b for a, b in zip(old_controls, new_controls)):
+            trans_list_view.controls = new_controls
+        trans_cache.prune(new_controls)
 
-        page.update()
+    refresh_scheduler = RefreshScheduler(render_ui)
 
     # ///////////////////////////////////////////////////////////////
     # [SECTION 6] LOGIC - DIALOGS & ACTIONS
@@ -575,6 +657,7 @@ def real_main(page: ft.Page):
             recs_data = []
             now = datetime.now()
             current_day_ref = now.day if cal.year == now.year and cal.month == now.month else (31 if datetime(cal.year, cal.month, 1) < now else 0)
+            paid_ids = current_db.get_recurring_paid_map(check_month)
 
             for r in recs:
                 try:
@@ -583,7 +666,7 @@ def real_main(page: ft.Page):
                     rid, day, item_name, amt, cat = r[:5]
                     pid, auto = None, 0
                 
-                is_paid = current_db.is_recurring_paid_v2(item_name, amt, cat, check_month, pid)
+                is_paid = rid in paid_ids
                 recs_data.append({'data': r, 'is_paid': is_paid, 'day': day, 'auto': auto, 'pid': pid})
 
             recs_data.sort(key=lambda x: x['is_paid'])
@@ -759,7 +842,7 @@ def real_main(page: ft.Page):
             ),
             ft.Container(content=trans_list_view, padding=ft.padding.symmetric(horizontal=15)),
             ft.Container(height=80) 
-        ], scroll=ft.ScrollMode.AUTO, expand=True)
+        ], scroll=ft.ScrollMode.AUTO, expand=True, on_scroll=on_list_scroll)
 
         bottom_dock = ft.Container(
             content=ft.Row([btn_income, btn_expense], spacing=10),
@@ -809,15 +892,15 @@ def real_main(page: ft.Page):
             else:
                 # ถ้าปกติ ก็ Sync ตามเดิม
                 print("App Start: Syncing with Cloud...")            
-                cloud_mgr.sync_data(callback=lambda msg: print(f"Cloud: {msg}"))
+                sync_worker.request(callback=lambda msg: print(f"Cloud: {msg}"))
             
-            # เมื่อข้อมูลในเครื่องเปลี่ยน ให้ Sync ขึ้น Cloud ทันที
-            current_db.on_data_changed = lambda: cloud_mgr.sync_data()
+            # เมื่อข้อมูลในเครื่องเปลี่ยน ให้ Sync ขึ้น Cloud (Worker รวมการแก้ไขติดๆ กันเป็นรอบเดียว)
+            current_db.on_data_changed = sync_worker.request
        
         cal.set_db(current_db)
         
         main_container.content = build_mobile_view()
-        refresh_ui()
+        refresh_ui(); refresh_scheduler.flush()
         main_container.update()
 
     def check_startup():
@@ -837,33 +920,23 @@ def real_main(page: ft.Page):
         init_application(target_db)
         
     def start_auto_sync():
+        # เฝ้าดูการเปลี่ยนแปลงด้วย PRAGMA data_version + change_log (แทนการ stat ไฟล์ DB/WAL ทุก 2 วินาที)
+        # การเขียนของเราเองถูกข้าม (UI refresh ไปแล้ว) และเว้นช่วงห่างขึ้นเรื่อยๆ (Backoff) เมื่อไม่มีอะไรเปลี่ยน
         def sync_loop():
-            try:
-                current_conf = load_config()
-                target_path = current_conf.get("db_path", "modern_money.db")
-                if not os.path.isabs(target_path):
-                    base_dir = os.path.dirname(os.path.abspath(__file__))
-                    target_path = os.path.join(base_dir, target_path)
-
-                last_mtime = 0
-                if os.path.exists(target_path):
-                    last_mtime = os.path.getmtime(target_path)
-
-                while True:
-                    time.sleep(2)
-                    try:
-                        if os.path.exists(target_path):
-                            current_mtime = os.path.getmtime(target_path)
-                            wal_path = target_path + "-wal"
-                            if os.path.exists(wal_path):
-                                current_mtime = max(current_mtime, os.path.getmtime(wal_path))
-
-                            if current_mtime != last_mtime:
-                                last_mtime = current_mtime
-                                try: refresh_ui()
-                                except: pass
-                    except: pass
-            except: pass
+            interval = WATCH_MIN_INTERVAL
+            while True:
+                time.sleep(interval)
+                try:
+                    if not current_db: continue
+                    changed = current_db.poll_changes()
+                    regions = set(r for t in changed for r in TABLE_REGIONS.get(t, ()))
+                    if regions:
+                        refresh_ui(regions=regions)
+                        interval = WATCH_MIN_INTERVAL
+                    else:
+                        interval = min(interval * 2, WATCH_MAX_INTERVAL)
+                except Exception as e:
+                    print(f"Sync Error: {e}")
         
         threading.Thread(target=sync_loop, daemon=True).start()
 
@@ -0,0 +1,208 @@
+# recognizer.py
+# ///////////////////////////////////////////////////////////////
+# แปลงเสียงพูดเป็นข้อความ เลือก Backend ได้ด้วย config["recognizer"]
+# - "google" (ค่าเริ่มต้น): speech_recognition.recognize_google ส่งทั้งก้อนตอนพูดจบ (ต้องต่อ Internet)
+# - "vosk": Offline แบบ Streaming ถอดเสียงไประหว่างที่ยังพูดอยู่ (pip install vosk, config["vosk_model"] = โฟลเดอร์ Model)
+# - "fixture": คืนข้อความที่กำหนดใน config["recognizer_fixture"] ใช้ทดสอบ / วัด Latency โดยไม่ต้องมี Internet หรือ Model
+# ใช้: r = create_recognizer(config); r.start(rate, width); r.feed(chunk) ทุก Chunk ตั้งแต่เริ่มพูด; text = r.finish()
+# ///////////////////////////////////////////////////////////////
+import abc
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+HAS_SR = False
+try:
+    import speech_recognition as sr
+    HAS_SR = True
+except ImportError:
+    pass
+
+HAS_VOSK = False
+try:
+    import vosk
+    HAS_VOSK = True
+except ImportError:
+    pass
+
+SPEECH_END_TIMEOUT = 1.5  # วินาที: เงียบนานเท่านี้หลังพูด (ต่อจาก Hangover ของ VAD) ถือว่าพูดจบ เปลี่ยนได้ด้วย config["speech_end_timeout"]
+RECOGNIZER_LANG = "th"
+UTTERANCE_LOG = deque(maxlen=50)  # สถิติต่อการพูดหนึ่งครั้งล่าสุด (log_utterance) ใช้วัดผลของ Capture profile / Backend
+
+# ///////////////////////////////////////////////////////////////
+# [SECTION: BASE]
+# ///////////////////////////////////////////////////////////////
+class Recognizer(abc.ABC):
+    """Backend แบบส่งทั้งก้อน: feed() แค่ต่อท้าย bytearray (ไม่ต้องเก็บ List ของ Chunk แล้ว b''.join ตอนจบ) งานจริงอยู่ที่ finish()
+    Backend ต้องมี _transcribe() ไม่งั้นสร้าง Object ไม่ได้ (TypeError ตอน create_recognizer ไม่ใช่กลางการอัด)"""
+    name = "base"
+    streaming = False
+
+    def __init__(self, config=None):
+        self.config = config or {}
+        self.sample_rate = 44100
+        self.sample_width = 2
+        self.buffer = bytearray()
+        self.pcm_bytes = 0   # PCM ที่ส่งเข้า Recognizer
+        self.sent_bytes = 0  # ที่ส่งออกไปทาง Network จริง (Offline = 0)
+
+    def start(self, sample_rate=44100, sample_width=2):
+        self.sample_rate, self.sample_width = sample_rate, sample_width
+        self.buffer = bytearray()
+
+    def feed(self, chunk):
+        self.pcm_bytes += len(chunk)
+        self.buffer += chunk
+
+    def finish(self):
+        """-> ข้อความที่ถอดได้ ('' = ฟังไม่ออก), เรียก Backend ไม่สำเร็จ -> Exception"""
+        return self._transcribe(self.buffer)
+
+    def cancel(self):
+        self.buffer = bytearray()
+
+    @abc.abstractmethod
+    def _transcribe(self, pcm):
+        """PCM ทั้งก้อน -> ข้อความ"""
+
+class StreamingRecognizer(Recognizer):
+    """Backend แบบ Streaming: ประมวลผลแต่ละ Chunk ใน Thread ของตัวเองระหว่างที่ยังพูดอยู่ (feed() ไม่ทำให้ Thread อัดเสียงรอ)
+    พอพูดจบเหลือแค่ Chunk ท้ายๆ ที่ยังค้างในคิว แล้วขอผลสุดท้าย"""
+    streaming = True
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.worker = None
+
+    def start(self, sample_rate=44100, sample_width=2):
+        self.sample_rate, self.sample_width = sample_rate, sample_width
+        self.queue = queue.Queue()
+        self.error = None
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def feed(self, chunk):
+        self.pcm_bytes += len(chunk)
+        self.queue.put(bytes(chunk))
+
+    def finish(self):
+        self.queue.put(None)
+        self.worker.join()
+        if self.error: raise self.error
+        return self._final()
+
+    def cancel(self):
+        # ยังไม่ได้ start() (ไม่มีเสียงพูด) -> ไม่มี Worker ให้หยุด
+        if self.worker is not None: self.queue.put(None)
+
+    def _run(self):
+        # _begin() อยู่ใน Worker ด้วย (เช่นโหลด Model ครั้งแรก) Chunk ที่เข้ามาระหว่างนั้นรอในคิว
+        try: self._begin()
+        except Exception as e: self.error = e
+        while True:
+            chunk = self.queue.get()
+            if chunk is None: return
+            if self.error: continue
+            try: self._accept(chunk)
+            except Exception as e: self.error = e
+
+    def _transcribe(self, pcm):
+        # ถอดทั้งก้อนใน Thread ที่เรียก (ไม่ผ่าน Worker) ด้วยขั้นตอนเดียวกับ Streaming
+        self._begin()
+        self._accept(bytes(pcm))
+        return self._final()
+
+    def _begin(self): pass
+
+    @abc.abstractmethod
+    def _accept(self, chunk):
+        """ประมวลผลเสียงหนึ่ง Chunk (ใน Thread ของ Worker)"""
+
+    @abc.abstractmethod
+    def _final(self):
+        """-> ข้อความสุดท้ายหลังส่งครบทุก Chunk"""
+
+# ///////////////////////////////////////////////////////////////
+# [SECTION: BACKENDS]
+# ///////////////////////////////////////////////////////////////
+if HAS_SR:
+    class _MeteredAudioData(sr.AudioData):
+        # recognize_google เข้ารหัส FLAC ก่อนส่งเสมอ -> จดขนาดที่ส่งจริงจากตรงนั้น (ไม่ต้องเข้ารหัสซ้ำเพื่อวัด)
+        sent_bytes = 0
+        def get_flac_data(self, *args, **kwargs):
+            data = super().get_flac_data(*args, **kwargs)
+            self.sent_bytes = len(data)
+            return data
+
+class GoogleRecognizer(Recognizer):
+    name = "google"
+
+    def _transcribe(self, pcm):
+        if not HAS_SR: raise RuntimeError("SpeechRecognition is not installed")
+        lang = self.config.get("recognizer_lang", RECOGNIZER_LANG)
+        audio = _MeteredAudioData(pcm, self.sample_rate, self.sample_width)
+        try: return sr.Recognizer().recognize_google(audio, language=lang)
+        except sr.UnknownValueError: return ""
+        finally: self.sent_bytes = audio.sent_bytes
+
+class VoskRecognizer(StreamingRecognizer):
+    name = "vosk"
+    _models = {}  # Model ใหญ่และโหลดช้า -> โหลดครั้งเดียวต่อ Path แล้วใช้ซ้ำ
+
+    def _begin(self):
+        path = self.config.get("vosk_model", "")
+        model = self._models.get(path)
+        if model is None: model = self._models[path] = vosk.Model(path)
+        self.rec = vosk.KaldiRecognizer(model, self.sample_rate)
+
+    def _accept(self, chunk):
+        self.rec.AcceptWaveform(chunk)
+
+    def _final(self):
+        return json.loads(self.rec.FinalResult()).get("text", "")
+
+class FixtureRecognizer(StreamingRecognizer):
+    """คืน config["recognizer_fixture"] (ถ้ามีเสียงส่งเข้ามา) หลังหน่วง config["recognizer_fixture_delay"] วินาที"""
+    name = "fixture"
+
+    def _begin(self):
+        self.bytes_fed = 0
+
+    def _accept(self, chunk):
+        self.bytes_fed += len(chunk)
+
+    def _final(self):
+        time.sleep(float(self.config.get("recognizer_fixture_delay", 0)))
+        return self.config.get("recognizer_fixture", "") if self.bytes_fed else ""
+
+RECOGNIZERS = {"google": GoogleRecognizer, "vosk": VoskRecognizer, "fixture": FixtureRecognizer}
+
+def create_recognizer(config):
+    """Recognizer ตาม config["recognizer"] (ใช้ครั้งเดียวต่อการพูดหนึ่งครั้ง) Vosk ใช้ไม่ได้ -> กลับไปใช้ Google"""
+    name = (config or {}).get("recognizer", "google")
+    if name == "vosk" and not (HAS_VOSK and config.get("vosk_model")):
+        print("Vosk recognizer unavailable (pip install vosk and set vosk_model), using Google")
+        name = "google"
+    return RECOGNIZERS.get(name, GoogleRecognizer)(config)
+
+def log_utterance(recognizer, timing, captured_bytes=None):
+    """จดสถิติการพูดหนึ่งครั้งลง UTTERANCE_LOG และพิมพ์สรุป -> dict ที่จด
+    timing = เวลา perf_counter: last_voiced (เสียงพูดเฟรมสุดท้าย), stopped (หยุดอัด), text (ได้ข้อความ), parsed (แยกรายการเสร็จ)"""
+    entry = {
+        "backend": recognizer.name, "rate": recognizer.sample_rate,
+        "audio_ms": 1000.0 * recognizer.pcm_bytes / (recognizer.sample_rate * recognizer.sample_width),
+        "pcm_bytes": recognizer.pcm_bytes, "sent_bytes": recognizer.sent_bytes,
+        "captured_bytes": captured_bytes,
+        "end_of_speech_ms": (timing["stopped"] - timing["last_voiced"]) * 1000,
+        "recognize_ms": (timing["text"] - timing["stopped"]) * 1000,
+        "parse_ms": (timing["parsed"] - timing["text"]) * 1000,
+        "latency_ms": (timing["parsed"] - timing["last_voiced"]) * 1000,
+    }
+    UTTERANCE_LOG.append(entry)
+    captured = f" of {entry['captured_bytes']:,} captured" if entry["captured_bytes"] else ""
+    print(f"Voice ({entry['backend']} @ {entry['rate']} Hz): {entry['audio_ms'] / 1000:.1f}s audio, {entry['pcm_bytes']:,} B PCM{captured}, "
+          f"{entry['sent_bytes']:,} B sent | latency {entry['latency_ms'] / 1000:.2f}s = end-of-speech {entry['end_of_speech_ms'] / 1000:.2f}s "
+          f"+ recognize {entry['recognize_ms'] / 1000:.2f}s + parse {entry['parse_ms']:.0f}ms")
+    return entry
@@ -93,8 +93,19 @@ def _build_general_ui(page, current_db, config, init_app_callback, cloud_mgr):
         tooltip="ลบข้อมูลที่ถูกลบแล้วออกจาก Database จริงๆ และ Sync ลบออกจาก Cloud ด้วย"
     )
 
+    def on_rebuild_totals_click(e):
+        if current_db.rebuild_monthly_totals(): safe_show_snack(page, "Monthly totals rebuilt.", "green")
+        else: safe_show_snack(page, "Error rebuilding monthly totals.", "red")
+
+    btn_rebuild_totals = ft.OutlinedButton(
+        text="คำนวณยอดสรุปรายเดือนใหม่ (Rebuild Totals)",
+        icon="build",
+        on_click=on_rebuild_totals_click,
+        tooltip="คำนวณตารางยอดรวมรายเดือนใหม่จากรายการทั้งหมด ใช้เมื่อยอดสรุปไม่ตรง"
+    )
+
     content = ft.Column([
-        create_group(T("data_section"), [f_budget, ft.Divider(), ft.Text("Maintenance", size=12, color="grey"), btn_purge]),
+        create_group(T("data_section"), [f_budget, ft.Divider(), ft.Text("Maintenance", size=12, color="grey"), btn_purge, btn_rebuild_totals]),
         create_group(T("voice_opts"), [sw_auto_save, ft.Column([txt_delay_label, sl_delay], spacing=0)]),
         create_group(T("startup_mode"), [mode_seg]),
         create_group(T("db_file"), [txt_db_path, ft.ElevatedButton(T("select_file"), on_click=lambda _: db_picker.pick_files(allowed_extensions=["db"]), height=30)])
@@ -205,7 +216,9 @@ def _build_card_ui(page, current_db, config, refresh_ui_callback, close_dialog_f
         card_list_col.controls.clear()
         cards = current_db.get_cards()
         if not cards: card_list_col.controls.append(ft.Text("No credit cards added", color="grey", italic=True))
-        else: [card_list_col.controls.append(CreditCardWidget(c, open_card_edit, confirm_delete_card, current_db.get_card_usage(c[0]))) for c in cards]
+        else:
+            card_usages = current_db.get_all_card_usages()
+            [card_list_col.controls.append(CreditCardWidget(c, open_card_edit, confirm_delete_card, card_usages.get(c[0], 0.0))) for c in cards]
         if card_list_col.page: card_list_col.update()
         
     def show_list(): edit_container.visible = False; list_container.visible = True; render_cards(); main_stack.update()
@@ -253,12 +266,15 @@ def _build_cloud_ui(page, current_db, config, refresh_ui_callback, cloud_mgr, cl
     f_cloud_key = ft.TextField(label=T("json_key"), value=current_db.get_setting("cloud_key"), expand=True, text_size=12)
     json_picker = ft.FilePicker(on_result=lambda e: [setattr(f_cloud_key, 'value', e.files[0].path), page.update()] if e.files else None)
     page.overlay.append(json_picker)
+    # config["cloud_engine"] ใช้ตอนสร้าง cloud_mgr (create_cloud_manager) -> เปลี่ยนแล้วมีผลหลังเปิดแอปใหม่
+    sw_async = ft.Switch(label=T("async_engine"), value=config.get("cloud_engine", "sync") == "async")
 
     # --- Save Settings Logic ---
     def save_cloud(e):
         # 1. Update Config & DB
         config["cloud_key"] = f_cloud_key.value
         config["firebase_url"] = f_firebase_url.value
+        config["cloud_engine"] = "async" if sw_async.value else "sync"
         save_config(config)
         current_db.set_setting("cloud_key", f_cloud_key.value)
         
@@ -276,10 +292,11 @@ def _build_cloud_ui(page, current_db, config, refresh_ui_callback, cloud_mgr, cl
     btn_compare = ft.ElevatedButton(T("btn_compare"), bgcolor=COLOR_WARNING, color="white", width=400)
     btn_pull = ft.ElevatedButton(T("btn_pull"), bgcolor=COLOR_EXPENSE, color="white", width=400)
     btn_push = ft.ElevatedButton(T("btn_push"), bgcolor=COLOR_PRIMARY, color="white", width=400)
-    all_buttons = [btn_check, btn_compare, btn_pull, btn_push]
+    btn_layout = ft.OutlinedButton(T("btn_layout"), width=400, visible=current_db.get_setting("cloud_layout", "") != "monthly")
+    all_buttons = [btn_check, btn_compare, btn_pull, btn_push, btn_layout]
 
     # Containers for swapping views
-    buttons_container = ft.Column([btn_check, btn_compare, btn_pull, btn_push], spacing=10, horizontal_alignment="center")
+    buttons_container = ft.Column([btn_check, btn_compare, btn_pull, btn_push, btn_layout], spacing=10, horizontal_alignment="center")
     
     # Confirmation Container
     txt_confirm_msg = ft.Text("", color="red", size=16, weight="bold")
@@ -350,6 +367,10 @@ def _build_cloud_ui(page, current_db, config, refresh_ui_callback, cloud_mgr, cl
                 cloud_mgr.force_pull(callback=lambda m, c="white": update_status_cb(m, c))
                 refresh_ui_callback()
 
+            elif task_type == "layout":
+                cloud_mgr.migrate_layout(callback=lambda m, c="white": update_status_cb(m, c))
+                btn_layout.visible = not cloud_mgr._monthly()
+
             elif task_type == "compare":
                 update_status_cb("Comparing...", "blue")
                 result_str = cloud_mgr.compare_data()
@@ -370,11 +391,13 @@ def _build_cloud_ui(page, current_db, config, refresh_ui_callback, cloud_mgr, cl
     btn_compare.on_click = lambda _: run_task_wrapper("compare")
     btn_pull.on_click = lambda _: show_confirm_view("confirm_pull", lambda: [restore_buttons_view(), run_task_wrapper("pull")])
     btn_push.on_click = lambda _: show_confirm_view("confirm_push", lambda: [restore_buttons_view(), run_task_wrapper("push")])
+    btn_layout.on_click = lambda _: show_confirm_view("confirm_layout", lambda: [restore_buttons_view(), run_task_wrapper("layout")])
 
     return ft.Column([
         ft.Text(T("cloud_config"), weight="bold", size=16), 
         f_firebase_url,
         ft.Row([f_cloud_key, ft.IconButton(icon="folder_open", on_click=lambda _: json_picker.pick_files(allowed_extensions=["json"]))]), 
+        sw_async,
         ft.ElevatedButton(T("save"), on_click=save_cloud),
         ft.Divider(), 
         txt_status,
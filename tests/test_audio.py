@@ -0,0 +1,71 @@
+# tests/test_audio.py
+# Resampler (ลด/เพิ่ม Rate ต่อเนื่องทีละ Chunk) และ CaptureStream ตอนอุปกรณ์ไม่รองรับ Rate ของ Profile
+import os
+import sys
+import unittest
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio import Resampler, CaptureStream
+
+def pcm(samples):
+    return array("h", samples).tobytes()
+
+def samples(data):
+    out = array("h")
+    out.frombytes(data)
+    return list(out)
+
+def run_chunks(resampler, data, size):
+    return b"".join(resampler.process(data[i:i + size]) for i in range(0, len(data), size))
+
+class ResamplerTest(unittest.TestCase):
+    def test_downsample_averages_each_span(self):
+        src = [v for v in range(0, 3000, 10) for _ in range(3)]  # 48 kHz: แต่ละค่าซ้ำ 3 Sample
+        out = samples(Resampler(48000, 16000).process(pcm(src)))
+        self.assertEqual(out, list(range(0, 3000, 10)))
+
+    def test_upsample_interpolates_between_samples(self):
+        src = list(range(0, 8000, 20))  # 8 kHz (หูฟัง Bluetooth HFP) -> 16 kHz
+        out = samples(Resampler(8000, 16000).process(pcm(src)))
+        self.assertEqual(len(out), 2 * (len(src) - 1))  # จุดตั้งแต่ Sample สุดท้ายรอ Chunk ถัดไป
+        self.assertEqual(out[:6], [0, 10, 20, 30, 40, 50])
+
+    def test_chunked_output_matches_whole_buffer(self):
+        src = pcm([(i * 37) % 2000 - 1000 for i in range(4410)])
+        for src_rate, dst_rate in ((44100, 16000), (8000, 16000), (11025, 16000)):
+            whole = Resampler(src_rate, dst_rate).process(src)
+            self.assertEqual(run_chunks(Resampler(src_rate, dst_rate), src, 2 * 333), whole, (src_rate, dst_rate))
+
+    def test_output_length_tracks_rate_ratio(self):
+        src = pcm([0] * 8000)
+        for src_rate, dst_rate in ((48000, 16000), (8000, 16000), (22050, 16000)):
+            n = len(run_chunks(Resampler(src_rate, dst_rate), src, 2 * 512)) // 2
+            self.assertAlmostEqual(n, 8000 * dst_rate / src_rate, delta=2)
+
+class _Stream:
+    def read(self, n, exception_on_overflow=False): return b"\0\0" * n
+
+class _PyAudio:
+    # อุปกรณ์ที่เปิดได้แค่ Rate ของตัวเอง
+    def __init__(self, rate): self.rate = rate
+    def get_format_from_width(self, width): return 8
+    def get_default_input_device_info(self): return {"defaultSampleRate": float(self.rate)}
+    def open(self, rate, **kwargs):
+        if rate != self.rate: raise OSError("Invalid sample rate")
+        return _Stream()
+
+class CaptureStreamTest(unittest.TestCase):
+    def test_low_rate_device_records_at_native_rate(self):
+        stream = CaptureStream(_PyAudio(8000), "speech")
+        self.assertEqual((stream.rate, stream.frames, stream.resampler), (8000, 256, None))
+        self.assertEqual(len(stream.read()), 2 * 256)
+
+    def test_high_rate_device_is_resampled(self):
+        stream = CaptureStream(_PyAudio(48000), "speech")
+        self.assertEqual((stream.rate, stream.device_rate), (16000, 48000))
+        self.assertEqual(len(stream.read()), 2 * 512)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+# tests/test_cloud_sync.py
+# Sync สองเครื่องผ่าน Firebase จำลอง (firebase_stub) ทั้ง Engine แบบ sync และ async
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cloud
+from database import DatabaseManager
+from cloud import CloudManager
+from cloud_async import AsyncCloudManager
+from firebase_stub import FirebaseStub
+
+class StubTestCase(unittest.TestCase):
+    # Firebase จำลอง + ฐานข้อมูลชั่วคราวต่อ Test, client(name) -> (db, CloudManager)
+    engine = CloudManager
+
+    def setUp(self):
+        self.stub = FirebaseStub().start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dbs = []
+
+    def tearDown(self):
+        for db in self.dbs: db.conn.close()
+        self.stub.stop()
+        self.tmp.cleanup()
+
+    def client(self, name):
+        db = DatabaseManager(os.path.join(self.tmp.name, f"{name}.db"))
+        db.connect()
+        self.dbs.append(db)
+        return db, self.engine(db, {"firebase_url": self.stub.base_url})
+
+    def rows(self, db):
+        return db.conn.execute("SELECT uuid, item, rev FROM transactions").fetchall()
+
+class TimeoutConfigTest(StubTestCase):
+    def test_number_or_pair(self):
+        _, ca = self.client("a")
+        for value, expected in ((10, 10.0), ("7.5", 7.5), ([3, 20], (3.0, 20.0))):
+            ca.config["cloud_timeout"] = value
+            self.assertEqual(ca._timeout(), expected)
+            self.assertTrue(ca.sync_now())
+
+class MonthlyConflictTest(StubTestCase):
+    def test_offline_edits_of_same_row_converge(self):
+        a, ca = self.client("a")
+        b, cb = self.client("b")
+        a.add_transaction("expense", "a5", 5, "อาหาร", datetime.now(), None)
+        self.assertTrue(ca.sync_now())
+        ca.migrate_layout(lambda *args: None)
+        self.assertTrue(cb.sync_now())
+        self.assertEqual(b.get_setting("cloud_layout"), "monthly")
+
+        # แก้แถวเดียวกันตอน Offline ทั้งสองเครื่อง -> rev เท่ากัน, Digest รายเดือนตรงกัน
+        a.update_transaction(a.conn.execute("SELECT id FROM transactions").fetchone()[0], "a5-A", 5, "อาหาร")
+        b.update_transaction(b.conn.execute("SELECT id FROM transactions").fetchone()[0], "a5-B", 5, "อาหาร")
+        for c in (ca, cb, ca, cb): self.assertTrue(c.sync_now())
+
+        self.assertEqual(self.rows(a), self.rows(b))
+        self.assertEqual(self.rows(a)[0][1], "a5-B")  # เครื่องที่ส่งทีหลังชนะ Conflict ด้วย rev ที่ bump
+        self.assertFalse(a.has_sync_changes() or b.has_sync_changes())
+        self.assertEqual(ca.compare_data().splitlines()[0], "Transactions: Local=1 / Cloud=1")  # Digest ตรง ไม่มี (differs)
+
+class AsyncMonthlyConflictTest(MonthlyConflictTest):
+    engine = AsyncCloudManager
+
+class OutboxTest(StubTestCase):
+    def setUp(self):
+        super().setUp()
+        self.batch = cloud.OUTBOX_BATCH
+        cloud.OUTBOX_BATCH = 5
+
+    def tearDown(self):
+        cloud.OUTBOX_BATCH = self.batch
+        super().tearDown()
+
+    def cloud_items(self):
+        return {v["item"] for v in (self.stub.tree.root.get("transactions") or {}).values()}
+
+    def pending(self, db):
+        return [r[0] for r in db.conn.execute("SELECT t.item FROM sync_journal j JOIN transactions t ON t.uuid = j.uuid WHERE j.tbl = 'transactions' ORDER BY j.seq")]
+
+    def test_interrupted_drain_resends_only_unacked_batches(self):
+        a, ca = self.client("a")
+        ca.config["cloud_retries"] = 0
+        self.assertTrue(ca.sync_now())  # Full Sync ครั้งแรก -> มี Watermark รอบถัดไปเป็น Delta (ส่ง Outbox)
+        for i in range(12): a.add_transaction("expense", f"x{i:02d}", i, "อาหาร", datetime.now(), None)
+        self.assertEqual(self.pending(a), [f"x{i:02d}" for i in range(12)])
+
+        # PATCH ก้อนแรกผ่าน (ระหว่างนั้นหน้าจอแก้ x00 อีกครั้ง), ก้อนที่สองหลุด
+        ui = DatabaseManager(a.db_path)
+        ui.connect()
+        self.dbs.append(ui)
+        patches = []
+        def fail(method, path):
+            if method != "PATCH": return False
+            patches.append(path)
+            if len(patches) == 1:
+                ui.update_transaction(ui.conn.execute("SELECT id FROM transactions WHERE item = 'x00'").fetchone()[0], "x00-edited", 0, "อาหาร")
+            return len(patches) == 2
+        self.stub.fail = fail
+        self.assertFalse(ca.sync_now())
+        self.assertEqual(self.cloud_items(), {f"x{i:02d}" for i in range(5)})  # ส่งตามลำดับที่แก้ ก้อนละ 5
+        self.assertEqual(self.pending(a), [f"x{i:02d}" for i in range(5, 12)] + ["x00-edited"])  # แก้ระหว่างส่ง -> ค้างไว้ต่อท้ายคิว
+
+        # เปิดแอปใหม่ (Connection / CloudManager ใหม่) แล้ว Sync ต่อ: ส่งเฉพาะที่ยังไม่ Ack
+        self.stub.fail = None
+        b = DatabaseManager(a.db_path)
+        b.connect()
+        self.dbs.append(b)
+        cb = self.engine(b, {"firebase_url": self.stub.base_url})
+        msgs = []
+        self.assertTrue(cb.sync_now(msgs.append))
+        self.assertIn("Syncing: outbox 8/8", msgs)
+        self.assertEqual(self.pending(b), [])
+        self.assertEqual(self.cloud_items(), {"x00-edited"} | {f"x{i:02d}" for i in range(1, 12)})
+
+class AsyncOutboxTest(OutboxTest):
+    engine = AsyncCloudManager
+
+class TombstoneTest(StubTestCase):
+    def live(self, db):
+        return db.conn.execute("SELECT item FROM transactions WHERE is_deleted = 0").fetchall()
+
+    def test_force_push_keeps_recent_deletes(self):
+        a, ca = self.client("a")
+        b, cb = self.client("b")
+        a.add_transaction("expense", "X", 5, "อาหาร", datetime.now(), None)
+        self.assertTrue(ca.sync_now() and cb.sync_now())
+        a.delete_transaction(a.conn.execute("SELECT id FROM transactions").fetchone()[0])
+        self.assertTrue(ca.sync_now())
+        ca.force_push(lambda *args: None)  # PUT ทั้งก้อนจากเครื่อง A ต้องมี Tombstone ของ X ไปด้วย
+        cb._full_sync()
+        self.assertTrue(ca.sync_now())
+        self.assertEqual((self.live(a), self.live(b)), ([], []))
+
+    def test_old_tombstones_are_purged(self):
+        a, ca = self.client("a")
+        a.add_transaction("expense", "X", 5, "อาหาร", datetime.now(), None)
+        self.assertTrue(ca.sync_now())
+        a.delete_transaction(a.conn.execute("SELECT id FROM transactions").fetchone()[0])
+        self.assertTrue(ca.sync_now())
+        self.assertEqual(len(self.rows(a)), 1)  # ยังอยู่ในช่วงเก็บ
+        ca.config["tombstone_retention_days"] = -1
+        ca._purge_tombstones()
+        self.assertEqual(self.rows(a), [])
+
+class ForcePullTest(StubTestCase):
+    def test_failed_download_keeps_local_data(self):
+        a, ca = self.client("a")
+        ca.config["cloud_retries"] = 0
+        for i in range(5): a.add_transaction("expense", f"x{i}", i, "อาหาร", datetime.now(), None)
+        self.assertTrue(ca.sync_now())
+        before, wm = self.rows(a), a.get_setting("sync_watermark")
+
+        self.stub.fail = lambda method, path: method == "GET" and path.startswith("transactions")
+        msgs = []
+        ca.force_pull(lambda msg, color=None: msgs.append(msg))
+        self.assertTrue(msgs[-1].startswith("Error"))
+        self.assertEqual(self.rows(a), before)
+        self.assertEqual(a.get_setting("sync_watermark"), wm)
+
+        self.stub.fail = None
+        ca.force_pull(lambda msg, color=None: msgs.append(msg))
+        self.assertEqual(msgs[-1], "Pull Success!")
+        self.assertEqual(self.rows(a), before)
+
+class AsyncForcePullTest(ForcePullTest):
+    engine = AsyncCloudManager
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# tests/test_database.py
+# ค่าที่ Trigger / Query รวมของ DatabaseManager ดูแลให้ ต้องตรงกับการคำนวณจากข้อมูลจริง
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp.name, "test.db"))
+        self.db.connect()
+
+    def tearDown(self):
+        self.db.conn.close()
+        self.tmp.cleanup()
+
+class RecurringPaidMapTest(DatabaseTestCase):
+    def test_recurring_with_null_is_deleted_counts_as_paid(self):
+        db = self.db
+        db.conn.execute("INSERT INTO recurring_expenses (day, item, amount, category, auto_pay, is_deleted, uuid) VALUES (1, 'Netflix', 419, 'อื่นๆ', 1, NULL, 'r1')")
+        db.conn.commit()
+        rid = db.get_recurring()[0][0]
+        ym = datetime.now().strftime("%Y-%m")
+        self.assertEqual(db.get_recurring_paid_map(ym), set())
+        db.add_transaction("expense", "Netflix", 419, "อื่นๆ", datetime.now(), None)
+        self.assertEqual(db.get_recurring_paid_map(ym), {rid})
+
+class SyncJournalTest(DatabaseTestCase):
+    def test_reconnect_does_not_queue_default_categories(self):
+        self.db.clear_sync_journal()
+        again = DatabaseManager(self.db.db_path)
+        again.connect()
+        self.addCleanup(again.conn.close)
+        self.assertFalse(again.has_sync_changes())
+
+class PollChangesTest(DatabaseTestCase):
+    def test_reports_other_connections_but_not_own_writes(self):
+        db = self.db
+        db.poll_changes()
+        db.add_transaction("expense", "own", 10, "อาหาร", datetime.now(), None)  # _notify -> เห็นแล้ว
+        self.assertEqual(db.poll_changes(), set())
+        other = DatabaseManager(db.db_path)
+        other.connect()
+        self.addCleanup(other.conn.close)
+        other.add_transaction("expense", "other", 20, "อาหาร", datetime.now(), None)
+        self.assertIn("transactions", db.poll_changes())
+        self.assertEqual(db.poll_changes(), set())
+
+class SyncDigestTest(DatabaseTestCase):
+    def test_triggers_match_rebuild_after_mixed_writes(self):
+        db = self.db
+        tid = lambda item: db.conn.execute("SELECT id FROM transactions WHERE item = ?", (item,)).fetchone()[0]
+        for i, month in enumerate((1, 1, 2, 3)):
+            db.add_transaction("expense", f"t{i}", 10 + i, "อาหาร", datetime(2026, month, 5), None)
+        db.update_transaction(tid("t0"), "t0", 99, "อาหาร")                                     # แก้ค่า -> rev ใหม่
+        db.update_transaction(tid("t1"), "t1", 11, "อาหาร", date=datetime(2026, 4, 1))          # ย้ายเดือน
+        db.delete_transaction(tid("t2"))                                                        # ลบ (Tombstone)
+        db.conn.execute("UPDATE transactions SET is_deleted = 0 WHERE id = ?", (tid("t2"),))    # กู้คืน
+        db.delete_transaction(tid("t3"))
+        db.conn.execute("DELETE FROM transactions WHERE id = ?", (tid("t3"),))                 # ลบจริง (purge)
+        db.conn.execute("UPDATE transactions SET rev = 7, updated_at = 123 WHERE id = ?", (tid("t0"),))  # เขียนจาก Cloud
+        db.conn.execute("INSERT INTO transactions (type, item, amount, category, date, is_deleted, uuid) VALUES ('expense', 'bad', 1, 'อาหาร', 'not a date', 0, 'bad-uuid')")
+        db.add_card("Visa", 1000, 25, "#fff")
+        card = db.get_cards()[0][0]
+        db.update_card(card, "Visa 2", 2000, 25, "#000")
+        db.add_recurring(1, "Netflix", 419, "อื่นๆ")
+        db.delete_recurring(db.get_recurring()[0][0])
+        cat = db.get_categories("expense")[0][0]
+        db.update_category(cat, "อาหารใหม่", "")
+        db.delete_category(db.get_categories("expense")[-1][0])
+        db.conn.commit()
+
+        incremental = db.get_sync_digest()
+        db.rebuild_sync_digest()
+        self.assertEqual(incremental, db.get_sync_digest())
+        self.assertEqual(sorted(incremental["transactions"]["months"]), ["2026-01", "2026-02", "2026-04"])
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM sync_digest WHERE ym IS NULL").fetchone()[0], 0)
+
+class MonthlyTotalsTest(DatabaseTestCase):
+    def totals(self):
+        return sorted(self.db.conn.execute("SELECT ym, payment_id, type, total, tx_count FROM monthly_totals WHERE tx_count != 0").fetchall())
+
+    def test_unparsable_dates_add_no_rows(self):
+        db = self.db
+        for i in range(3):
+            db.conn.execute("INSERT INTO transactions (type, item, amount, category, date, is_deleted) VALUES ('expense', ?, 10, 'อาหาร', 'not a date', 0)", (f"bad{i}",))
+        db.conn.commit()
+        self.assertEqual(db.conn.execute("SELECT COUNT(*) FROM monthly_totals WHERE ym IS NULL").fetchone()[0], 0)
+
+    def test_triggers_match_rebuild(self):
+        db = self.db
+        db.add_transaction("expense", "a", 10, "อาหาร", datetime(2026, 1, 5), None)
+        db.add_transaction("expense", "b", 20, "อาหาร", datetime(2026, 2, 5), None)
+        db.conn.execute("INSERT INTO transactions (type, item, amount, category, date, is_deleted) VALUES ('expense', 'bad', 5, 'อาหาร', 'not a date', 0)")
+        bad = db.conn.execute("SELECT id FROM transactions WHERE item = 'bad'").fetchone()[0]
+        db.conn.execute("UPDATE transactions SET date = '2026-01-09 10:00:00' WHERE id = ?", (bad,))  # แก้จนแปลงได้ -> นับเข้าเดือน
+        db.conn.execute("UPDATE transactions SET date = 'still bad' WHERE item = 'a'")               # แปลงไม่ได้ -> ออกจากเดือนเดิม
+        db.conn.commit()
+        incremental = self.totals()
+        db.rebuild_monthly_totals()
+        self.assertEqual(incremental, self.totals())
+
+if __name__ == "__main__":
+    unittest.main()
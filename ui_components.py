@@ -2,9 +2,11 @@
 import flet as ft
 import random
 import calendar
+import threading
 from datetime import datetime
 from const import *
 from utils import format_currency, hex_with_opacity, get_heavier_weight
+from audio import LevelRing
 
 class TransactionCard(ft.Container):
     def __init__(self, data, onDelete, onEdit, font_delta=0, font_weight="w600", is_new=False, minimal=False):
@@ -103,7 +105,35 @@ class TransactionCard(ft.Container):
              self.actions_container.width = 0
              self.actions_container.opacity = 0
         self.actions_container.update()
-        
+
+
+class TransactionListCache:
+    # เก็บ TransactionCard ไว้ตาม transaction id + hash ของเนื้อหา
+    # refresh ที่ข้อมูลไม่เปลี่ยนจะได้ Control ตัวเดิมกลับมา -> Flet ไม่ต้องส่งการ์ดนั้นไป Client ใหม่
+    def __init__(self):
+        self.cards = {}    # tid -> (hash, TransactionCard)
+        self.headers = {}  # (date_str, font_delta) -> Container
+
+    def card(self, row, onDelete, onEdit, font_delta=0, font_weight="w600", is_new=False, minimal=False):
+        key = hash((tuple(row), font_delta, font_weight, minimal))
+        cached = self.cards.get(row[0])
+        if cached and cached[0] == key and not is_new: return cached[1], False
+        card = TransactionCard(row, onDelete, onEdit, font_delta, font_weight, is_new=is_new, minimal=minimal)
+        self.cards[row[0]] = (key, card)
+        return card, True
+
+    def header(self, date_str, font_delta, top_padding=10):
+        key = (date_str, font_delta)
+        if key not in self.headers:
+            self.headers[key] = ft.Container(content=ft.Text(date_str, size=12+font_delta, weight="bold", color="grey"), padding=ft.padding.only(top=top_padding, bottom=5))
+        return self.headers[key]
+
+    def prune(self, controls):
+        # ลบการ์ด/หัวข้อที่ไม่ได้แสดงแล้ว เพื่อไม่ให้ Cache โตตามจำนวนรายการทั้งหมด
+        live = set(id(c) for c in controls)
+        self.cards = {k: v for k, v in self.cards.items() if id(v[1]) in live}
+        self.headers = {k: v for k, v in self.headers.items() if id(v) in live}
+
 
 class SummaryCard(ft.Container):
     def __init__(self, title_key, value, color, icon_name, font_delta=0, font_weight="w600"):
@@ -127,11 +157,32 @@ class SummaryCard(ft.Container):
         self.txt_value.weight = heavy_weight
         self.icon_widget.size = 20 + (font_delta/2)
 
+class SyncStatusIcon(ft.Icon):
+    # ไอคอนสถานะ Auto Sync (รับ stats จาก SyncWorker.get_stats)
+    ICONS = {"idle": ("cloud_done", "grey"), "waiting": ("cloud_queue", "grey"), "syncing": ("cloud_sync", COLOR_PRIMARY),
+             "offline": ("cloud_off", "orange"), "error": ("sync_problem", "red")}
+
+    def __init__(self):
+        super().__init__("cloud_done", size=18, color="grey", visible=False, tooltip="Sync")
+
+    def set_stats(self, stats):
+        self.name, self.color = self.ICONS.get(stats["state"], self.ICONS["idle"])
+        tip = [f"Sync: {stats['state']}", f"Queue: {stats['queue']}"]
+        if stats.get("pending"): tip.append(f"Waiting to upload: {stats['pending']}")
+        if stats["last_duration"] is not None: tip.append(f"Last sync: {stats['last_duration']:.2f}s")
+        if stats["retry_in"]: tip.append(f"Retry in {stats['retry_in']:.0f}s")
+        if stats["last_error"] and stats["state"] in ("offline", "error"): tip.append(stats["last_error"][:80])
+        self.tooltip = "\n".join(tip)
+        self.visible = True
+        try: self.update()
+        except: pass
+
 class CalendarWidget(ft.Column):
-    def __init__(self, page, on_select, font_delta=0, font_weight="w600"):
+    def __init__(self, page, on_select, font_delta=0, font_weight="w600", on_month_change=None):
         super().__init__()
         self.page_ref = page
         self.on_select = on_select
+        self.on_month_change = on_month_change  # เรียกเมื่อเปลี่ยนเดือน (ใช้โหลดเดือนเก่าจาก Cloud แบบ Lazy)
         self.font_delta = font_delta
         self.font_weight = font_weight
         self.now = datetime.now()
@@ -197,6 +248,7 @@ class CalendarWidget(ft.Column):
             self.sel_date = d
             self.render()
             self.update()
+            if self.on_month_change: self.on_month_change(self.year, self.month)
             self.on_select(d.strftime("%Y-%m-%d"))
     
     def nav(self, d): 
@@ -210,6 +262,7 @@ class CalendarWidget(ft.Column):
         
         self.render()
         self.update()
+        if self.on_month_change: self.on_month_change(self.year, self.month)
         self.on_select(None)
     
     def render(self):
@@ -292,8 +345,55 @@ class CalendarWidget(ft.Column):
         self.on_select(None)
 
 class RealTimeVoiceVisualizer(ft.Row):
-    def __init__(self): super().__init__(alignment="center", spacing=4, height=60); self.bars = [ft.Container(width=6, height=5, bgcolor=COLOR_PRIMARY, border_radius=3, animate=ft.Animation(50, "easeOut")) for _ in range(12)]; self.controls = self.bars
-    def update_volume(self, rms_value): scale = min(rms_value / 15, 55); mid = len(self.bars) // 2; [setattr(bar, 'height', max(5, scale - (abs(i - mid) * 3) + random.randint(-5, 5))) for i, bar in enumerate(self.bars)]; self.update()
+    # update_volume() เรียกจาก Thread อัดเสียงได้ทุก Chunk: แค่เขียนลง LevelRing ไม่แตะ UI (ไม่ทำให้ stream.read รอ)
+    # Ticker Thread วาดไม่เกิน fps ครั้ง/วินาที จากค่าสูงสุดในช่วงนั้น และส่งเฉพาะแท่งที่ความสูงเปลี่ยนใน page.update() ครั้งเดียว
+    # Ticker เริ่มเองเมื่อมีค่าเข้ามา และหยุดเมื่อไม่มีค่าใหม่สักพัก / Control ถูกถอดออกจากหน้า
+    IDLE_STOP = 1.0  # วินาที
+
+    def __init__(self, fps=VISUALIZER_FPS):
+        super().__init__(alignment="center", spacing=4, height=60)
+        self.bars = [ft.Container(width=6, height=5, bgcolor=COLOR_PRIMARY, border_radius=3, animate=ft.Animation(50, "easeOut")) for _ in range(12)]
+        self.controls = self.bars
+        self.levels = LevelRing()
+        self.interval = 1.0 / fps
+        self.ticker = None
+        self.stop_event = threading.Event()
+
+    def update_volume(self, rms_value):
+        self.levels.push(rms_value)
+        if self.ticker is None or not self.ticker.is_alive():
+            self.stop_event.clear()
+            self.ticker = threading.Thread(target=self._tick, daemon=True)
+            self.ticker.start()
+
+    def will_unmount(self):
+        self.stop_event.set()
+
+    def _tick(self):
+        idle = 0.0
+        while not self.stop_event.wait(self.interval):
+            level = self.levels.peak()
+            if level is None:
+                idle += self.interval
+                if idle >= self.IDLE_STOP: return
+                continue
+            idle = 0.0
+            changed = self._set_level(level)
+            if not changed or not self.page: continue
+            try: self.page.update(*changed)
+            except: return
+
+    def _set_level(self, rms_value):
+        # -> แท่งที่ความสูงเปลี่ยน (ปัดทีละ 2px, เงียบแล้วไม่สั่น -> ไม่มีอะไรต้องส่ง)
+        scale = min(rms_value / 15, 55); mid = len(self.bars) // 2
+        changed = []
+        for i, bar in enumerate(self.bars):
+            jitter = random.randint(-5, 5) if scale > 10 else 0
+            height = max(5, int(scale - (abs(i - mid) * 3) + jitter) // 2 * 2)
+            if height != bar.height:
+                bar.height = height
+                changed.append(bar)
+        return changed
 
 class CreditCardWidget(ft.Container):
     def __init__(self, card_data, onEdit, onDelete, usage=0.0):
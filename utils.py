@@ -3,6 +3,7 @@ import sys
 import json
 import os
 import re
+import threading
 from types import ModuleType
 
 # ==============================================================================
@@ -296,4 +297,59 @@ def load_config():
 
 def save_config(config_data):
     with open(CONFIG_FILE, "w") as f:
-        json.dump(config_data, f)
\ No newline at end of file
+        json.dump(config_data, f)
+
+# [SECTION: REFRESH SCHEDULER]
+REFRESH_REGIONS = ("summary", "cards", "list", "recurring", "calendar")
+
+# ตารางที่เปลี่ยน (จาก DatabaseManager.poll_changes) -> region ที่ต้องวาดใหม่
+TABLE_REGIONS = {
+    "transactions": REFRESH_REGIONS,
+    "recurring_expenses": ("recurring",),
+    "credit_cards": ("summary", "cards", "list"),
+    "categories": (),
+}
+
+class RefreshScheduler:
+    # รวมคำขอ refresh จากหลาย Thread (UI, Poller, Cloud, Dialog) ให้เหลือการ render ครั้งเดียว
+    # - คำขอที่เข้ามาภายใน `delay` วินาทีถูกรวมกัน (Coalesce) พร้อมรวม region ที่ต้องวาดใหม่
+    # - render ทีละครั้งเท่านั้น คำขอที่เข้ามาระหว่าง render จะรอรอบถัดไป
+    def __init__(self, render, delay=0.1):
+        self.render = render  # render(regions: set, new_id)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.run_lock = threading.Lock()
+        self.pending = set()
+        self.new_id = None
+        self.timer = None
+        self.requests = 0
+        self.runs = 0
+
+    def request(self, regions=None, new_id=None):
+        with self.lock:
+            self.requests += 1
+            self.pending.update(regions or REFRESH_REGIONS)
+            if new_id is not None: self.new_id = new_id
+            if self.timer is None:
+                self.timer = threading.Timer(self.delay, self._run)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def _run(self):
+        with self.run_lock:
+            with self.lock:
+                regions, new_id = self.pending, self.new_id
+                self.pending, self.new_id, self.timer = set(), None, None
+            if not regions: return
+            self.runs += 1
+            try: self.render(regions, new_id)
+            except Exception as e: print(f"Refresh Error: {e}")
+
+    def flush(self):
+        # render คำขอที่ค้างอยู่ทันทีใน Thread ปัจจุบัน (เช่นตอนเปลี่ยน View)
+        with self.lock:
+            if self.timer: self.timer.cancel(); self.timer = None
+        self._run()
+
+    def get_stats(self):
+        return {"requests": self.requests, "runs": self.runs, "coalesced": self.requests - self.runs}